@@ -1,17 +1,23 @@
+from contextlib import nullcontext
 import f4py
 import fastnumbers
+import glob
+from itertools import count
 from joblib import Parallel, delayed
 import math
+import numpy as np
 import os
 import shutil
+import struct
 import tempfile
+import warnings
 import zstandard
 
 class Builder:
     def __init__(self, verbose=False):
         self.__verbose = verbose
 
-    def convert_delimited_file(self, delimited_file_path, f4_file_path, index_columns=[], delimiter="\t", comment_prefix="#", compression_type=None, num_processes=1, num_cols_per_chunk=None, num_rows_per_save=100, tmp_dir_path=None):
+    def convert_delimited_file(self, delimited_file_path, f4_file_path, index_columns=[], delimiter="\t", comment_prefix="#", compression_type=None, num_processes=1, num_cols_per_chunk=None, num_rows_per_save=100, tmp_dir_path=None, schema=None, widen_schema=False, numeric_encoding=None, single_file=False, zone_map_columns=[], bloom_filter_columns=[], hash_index_columns=[], bitmap_index_columns=[], trigram_index_columns=[], num_rows_per_run=10000000, max_exact_values=1000):
         if type(delimiter) != str:
             raise Exception("The delimiter value must be a string.")
 
@@ -29,6 +35,24 @@ class Builder:
             if comment_prefix == "":
                 comment_prefix = None
 
+        if num_cols_per_chunk is not None:
+            warnings.warn("The num_cols_per_chunk argument is deprecated and ignored. Each row is now read only once, no matter how many columns there are.", DeprecationWarning, stacklevel=2)
+
+        if numeric_encoding not in (None, "binary"):
+            raise Exception("Invalid numeric_encoding. Must be None or binary.")
+
+        if numeric_encoding == "binary" and compression_type == "dictionary":
+            raise Exception("Binary numeric encoding cannot be used with dictionary compression.")
+
+        # This is the number of distinct values per column that are tracked exactly while the file is summarized. Dictionary
+        # compression only stores a column as categories when all of its values were tracked, so large files that have
+        # columns with more than this many categories (but still few relative to the number of rows) need a larger value.
+        if type(max_exact_values) != int or max_exact_values < 1:
+            raise Exception("The max_exact_values value must be a positive integer.")
+
+        # Cached memory maps and values for a previous version of this file must not be used.
+        f4py.clear_file_cache(f4_file_path)
+
         self._print_message(f"Converting from {delimited_file_path}")
 
         tmp_dir_path2 = self._prepare_tmp_dir(tmp_dir_path)
@@ -49,59 +73,100 @@ class Builder:
         if num_cols == 0:
             raise Exception(f"No data was detected in {delimited_file_path}.")
 
-        # Iterate through the lines to summarize each column.
-        self._print_message(f"Summarizing each column in {delimited_file_path}")
-        if num_processes == 1:
-            chunk_results = [self._parse_columns_chunk(delimited_file_path, delimiter, comment_prefix, 0, num_cols, compression_type)]
-        else:
-            column_chunk_indices = _generate_chunk_ranges(num_cols, num_cols_per_chunk)
-            chunk_results = Parallel(n_jobs=num_processes)(delayed(self._parse_columns_chunk)(delimited_file_path, delimiter, comment_prefix, column_chunk[0], column_chunk[1], compression_type) for column_chunk in column_chunk_indices)
+        # Values in the index columns (including columns with zone maps, Bloom filters, etc.) are saved while the output file is written,
+        # so that file does not need to be read again to build the indexes.
+        index_specs = f4py.IndexBuilder._get_index_specs(f4_file_path, index_columns) if index_columns else []
+        key_column_names = [column_name for index_spec in index_specs for column_name in index_spec[1]]
+        for columns in (zone_map_columns, bloom_filter_columns, hash_index_columns, bitmap_index_columns, trigram_index_columns):
+            key_column_names.extend(_get_column_name_list(columns))
+        key_column_indices = sorted({column_names.index(column_name.encode()) for column_name in key_column_names if column_name.encode() in column_names})
 
-        # Summarize the column sizes and types across the chunks.
-        column_sizes = []
-        column_types = []
-        column_compression_dicts = {}
+        # Column sizes and types from a schema make it unnecessary to summarize the columns.
+        schema_violation = None
+        column_stats = None
+        if schema:
+            column_sizes, column_types = self._get_schema_sizes_and_types(schema, column_names, compression_type)
+            column_encodings = [_get_default_binary_format(the_type, numeric_encoding) for the_type in column_types]
+            column_compression_dicts = {}
+            chunk_offsets = self._get_chunk_offsets(delimited_file_path, comment_prefix, num_processes)
+
+            self._print_message(f"Using the specified schema for {delimited_file_path}")
+            line_length, num_rows, schema_violation = self._save_output_file(delimited_file_path, f4_file_path, delimiter, compression_type, column_sizes, column_encodings, column_compression_dicts, chunk_offsets, num_processes, num_rows_per_save, tmp_dir_path2, column_types, key_column_indices, num_rows_per_run)
+
+            if schema_violation:
+                if not widen_schema:
+                    self._remove_tmp_dir(tmp_dir_path2)
+                    raise Exception(schema_violation)
 
-        for chunk_tuple in chunk_results:
-            for i, size in sorted(chunk_tuple[0].items()):
-                column_sizes.append(size)
+                self._print_message(f"{schema_violation} The schema will be widened.")
 
-            for i, the_type in sorted(chunk_tuple[1].items()):
-                column_types.append(the_type)
+        if not schema or schema_violation:
+            schema_sizes_and_types = (column_sizes, column_types) if schema_violation else None
+            column_sizes, column_types, column_encodings, column_compression_dicts, num_rows, chunk_offsets, column_profilers = self._summarize_columns(delimited_file_path, delimiter, comment_prefix, num_cols, compression_type, numeric_encoding, num_processes, max_exact_values)
 
-            if len(chunk_tuple) > 0:
-                # This merges the dictionaries
-                column_compression_dicts = {**column_compression_dicts, **chunk_tuple[2]}
+            # Anything that the schema allowed should still be allowed.
+            if schema_sizes_and_types:
+                column_sizes = [max(size, schema_sizes_and_types[0][i]) for i, size in enumerate(column_sizes)]
+                widened_column_types = [_widen_type(the_type, schema_sizes_and_types[1][i]) for i, the_type in enumerate(column_types)]
+                column_encodings = [column_encodings[i] if the_type == column_types[i] else _get_default_binary_format(the_type, numeric_encoding) for i, the_type in enumerate(widened_column_types)]
+                column_types = widened_column_types
 
-        # When each chunk was processed, we went through all rows, so we can get these numbers from just the first chunk.
-        num_rows = chunk_results[0][3]
+            column_stats = [profiler.get_stats(column_types[i]) for i, profiler in enumerate(column_profilers)]
+
+            ## Check whether we have enough data to train a compression dictionary.
+            #if compression_level != None:
+            #    if total_num_chars > 100000 and len(compression_training_set) > 0:
+            #        f4py.CompressionHelper._save_training_dict(compression_training_set, f4_file_path, compression_level, num_processes)
+
+            #    f4py.CompressionHelper._save_level_file(f4_file_path, compression_level)
+
+            line_length, num_rows, schema_violation = self._save_output_file(delimited_file_path, f4_file_path, delimiter, compression_type, column_sizes, column_encodings, column_compression_dicts, chunk_offsets, num_processes, num_rows_per_save, tmp_dir_path2, key_column_indices=key_column_indices, num_rows_per_key_file=num_rows_per_run)
 
         if num_rows == 0:
+            self._remove_tmp_dir(tmp_dir_path2)
             raise Exception(f"A header row but no data rows were detected in {delimited_file_path}")
 
-        ## Check whether we have enough data to train a compression dictionary.
-        #if compression_level != None:
-        #    if total_num_chars > 100000 and len(compression_training_set) > 0:
-        #        f4py.CompressionHelper._save_training_dict(compression_training_set, f4_file_path, compression_level, num_processes)
+        # Values in binary-encoded columns take up a fixed number of bytes.
+        column_sizes = [struct.calcsize(column_encodings[i]) if column_encodings[i] else size for i, size in enumerate(column_sizes)]
 
-        #    f4py.CompressionHelper._save_level_file(f4_file_path, compression_level)
+        self._print_message(f"Saving meta files for {f4_file_path}")
+        self._save_meta_files(f4_file_path, column_sizes, line_length, column_names, column_types, compression_type, column_compression_dicts, num_rows, column_encodings, column_stats)
 
-        line_length = self._save_output_file(delimited_file_path, f4_file_path, delimiter, comment_prefix, compression_type, column_sizes, column_compression_dicts, num_rows, num_processes, num_rows_per_save, tmp_dir_path2)
+        key_chunks = {column_names[i].decode(): _load_key_arrays(tmp_dir_path2, len(chunk_offsets), i) for i in key_column_indices}
 
-        self._print_message(f"Saving meta files for {f4_file_path}")
-        self._save_meta_files(f4_file_path, column_sizes, line_length, column_names, column_types, compression_type, column_compression_dicts, num_rows)
+        if index_specs:
+            self._print_message(f"Building indexes for {f4_file_path}")
+            f4py.IndexBuilder._build_indexes(f4_file_path, index_specs, False, num_processes, num_rows_per_run, tmp_dir_path2, key_chunks)
+            f4py.IndexBuilder._add_to_single_file(f4_file_path)
+
+        if zone_map_columns:
+            f4py.IndexBuilder._build_zone_maps(f4_file_path, zone_map_columns, key_chunks=key_chunks)
+
+        if bloom_filter_columns:
+            f4py.IndexBuilder._build_bloom_filters(f4_file_path, bloom_filter_columns, key_chunks=key_chunks)
+
+        if hash_index_columns:
+            f4py.IndexBuilder._build_hash_indexes(f4_file_path, hash_index_columns, num_processes=num_processes, num_rows_per_run=num_rows_per_run, tmp_dir_path=tmp_dir_path2, key_chunks=key_chunks)
+
+        if bitmap_index_columns:
+            f4py.IndexBuilder._build_bitmap_indexes(f4_file_path, bitmap_index_columns, num_processes=num_processes, num_rows_per_run=num_rows_per_run, tmp_dir_path=tmp_dir_path2, key_chunks=key_chunks)
+
+        if trigram_index_columns:
+            f4py.IndexBuilder._build_trigram_indexes(f4_file_path, trigram_index_columns, num_processes=num_processes, num_rows_per_run=num_rows_per_run, tmp_dir_path=tmp_dir_path2, key_chunks=key_chunks)
 
         self._remove_tmp_dir(tmp_dir_path2)
         self._print_message(f"Done converting {delimited_file_path} to {f4_file_path}")
 
-        if index_columns:
-            f4py.IndexBuilder.build_indexes(f4_file_path, index_columns)
+        if single_file:
+            # Store the metadata and indexes within the data file so that fewer files must be opened.
+            self._print_message(f"Combining files into {f4_file_path}")
+            f4py.combine_into_single_file(f4_file_path)
 
     #####################################################
     # Non-public functions
     #####################################################
 
-    def _save_meta_files(self, f4_file_path, column_sizes, line_length, column_names=None, column_types=None, compression_type=None, column_compression_dicts=None, num_rows=None):
+    def _save_meta_files(self, f4_file_path, column_sizes, line_length, column_names=None, column_types=None, compression_type=None, column_compression_dicts=None, num_rows=None, column_encodings=None, column_stats=None):
         # Calculate and save the column coordinates and max length of these coordinates.
         column_start_coords = f4py.get_column_start_coords(column_sizes)
         column_coords_string, max_column_coord_length = f4py.build_string_map(column_start_coords)
@@ -130,11 +195,30 @@ class Builder:
             f4py.write_str_to_file(f4_file_path + ".ct", column_types_string)
             f4py.write_str_to_file(f4_file_path + ".mctl", str(max_col_type_length).encode())
 
+        if column_encodings and any(column_encodings):
+            # Save the struct format character for each binary-encoded column (t for text columns).
+            f4py.write_str_to_file(f4_file_path + ".ce", b"".join([encoding[1:].encode() if encoding else b"t" for encoding in column_encodings]))
+        elif os.path.exists(f4_file_path + ".ce"):
+            # Encodings from a previous version of this file would cause its values to be misread.
+            os.unlink(f4_file_path + ".ce")
+
         self._save_compression_info(f4_file_path, compression_type, column_compression_dicts, column_index_name_dict)
 
         # Save number of rows and columns.
-        #f4py.write_str_to_file(f4_file_path + ".nrow", str(num_rows).encode())
-        #f4py.write_str_to_file(f4_file_path + ".ncol", str(len(column_names)).encode())
+        f4py.write_str_to_file(f4_file_path + ".nrow", str(num_rows).encode())
+        f4py.write_str_to_file(f4_file_path + ".ncol", str(len(column_names)).encode())
+
+        # Statistics are only available if the values were summarized (not when a schema was used).
+        if column_stats:
+            f4py.write_str_to_file(f4_file_path + ".stats", f4py.serialize({column_name.decode(): column_stats[i] for i, column_name in enumerate(column_names) if column_stats[i] is not None}))
+        elif os.path.exists(f4_file_path + ".stats"):
+            # Statistics from a previous version of this file would no longer be accurate.
+            os.unlink(f4_file_path + ".stats")
+
+        # Likewise for zone maps, Bloom filters, hash indexes and bitmap indexes.
+        for extension in (".zm_", ".bf_", ".hidx_", ".bidx_", ".tidx_"):
+            for file_path in glob.glob(glob.escape(f4_file_path) + extension + "*"):
+                os.unlink(file_path)
 
     def _prepare_tmp_dir(self, tmp_dir_path):
         # Figure out where temp files will be stored and create directory, if needed.
@@ -161,56 +245,166 @@ class Builder:
                 print(e)
                 pass
 
-    def _parse_columns_chunk(self, delimited_file_path, delimiter, comment_prefix, start_index, end_index, compression_type):
-        #compression_training_set = set()
+    def _get_schema_sizes_and_types(self, schema, column_names, compression_type):
+        if compression_type == "dictionary":
+            raise Exception("A schema cannot be used with dictionary compression because the compression dictionaries depend on the data.")
+
+        # Copy the schema from an existing F4 file.
+        if isinstance(schema, str):
+            with f4py.Parser(schema) as parser:
+                schema_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = parser._get_column_meta(set(), [])
+
+                if decompression_type:
+                    raise Exception(f"A schema cannot be copied from {schema} because it is compressed.")
+
+                if any([len(coords) > 2 for coords in column_coords_dict.values()]):
+                    raise Exception(f"A schema cannot be copied from {schema} because it has binary-encoded columns.")
+
+                schema = {}
+                for column_index, column_name in enumerate(schema_columns):
+                    coords = column_coords_dict[column_name]
+                    schema[column_name.decode()] = (parser._get_column_type_from_index(column_index), coords[1] - coords[0])
+
+        if not isinstance(schema, dict):
+            raise Exception("The schema must be a dictionary or the path to an F4 file.")
+
+        column_sizes = []
+        column_types = []
+        for column_name in column_names:
+            if column_name.decode() not in schema:
+                raise Exception(f"The schema does not include the {column_name.decode()} column.")
+
+            the_type, size = schema[column_name.decode()]
+
+            if the_type not in ("i", "f", "s"):
+                raise Exception(f"The type for the {column_name.decode()} column in the schema must be i, f, or s.")
+
+            if not isinstance(size, int) or size < 0:
+                raise Exception(f"The width for the {column_name.decode()} column in the schema must be a non-negative integer.")
+
+            column_sizes.append(size)
+            column_types.append(the_type.encode())
 
+        return column_sizes, column_types
+
+    def _summarize_columns(self, delimited_file_path, delimiter, comment_prefix, num_cols, compression_type, numeric_encoding, num_processes, max_exact_values):
+        # Iterate through the lines to summarize each column. The file is split into byte ranges
+        # that align with line boundaries so that each row is read only once, no matter how
+        # many columns there are.
+        self._print_message(f"Summarizing each column in {delimited_file_path}")
+        chunk_offsets = self._get_chunk_offsets(delimited_file_path, comment_prefix, num_processes)
+
+        if len(chunk_offsets) == 1:
+            # Record line offsets along the way so the rows can be split across processes when they are saved.
+            max_num_checkpoints = 0 if num_processes == 1 else 4 * num_processes
+            chunk_results = [self._parse_columns_chunk(delimited_file_path, delimiter, chunk_offsets[0][0], chunk_offsets[0][1], num_cols, compression_type, numeric_encoding, max_exact_values, max_num_checkpoints)]
+        else:
+            chunk_results = Parallel(n_jobs=num_processes)(delayed(self._parse_columns_chunk)(delimited_file_path, delimiter, chunk[0], chunk[1], num_cols, compression_type, numeric_encoding, max_exact_values) for chunk in chunk_offsets)
+
+        # Summarize the column sizes and types across the chunks.
+        column_sizes, column_types, column_encodings, column_compression_dicts, num_rows, column_profilers = self._merge_chunk_results(chunk_results, num_cols, compression_type, numeric_encoding)
+
+        if len(chunk_offsets) == 1 and num_processes > 1 and num_rows > 0:
+            chunk_offsets = _split_at_checkpoints(chunk_results[0][2], num_rows, num_processes)
+
+        return column_sizes, column_types, column_encodings, column_compression_dicts, num_rows, chunk_offsets, column_profilers
+
+    def _get_chunk_offsets(self, delimited_file_path, comment_prefix, num_chunks):
+        # Find byte offsets (after the header) that split the data rows into roughly equal chunks.
+        # Each offset is moved forward to the start of the next line.
         with f4py.get_delimited_file_handle(delimited_file_path) as in_file:
             self._exclude_comments_and_header(in_file, comment_prefix)
+            offsets = [in_file.tell()]
+
+            if num_chunks == 1:
+                return [(offsets[0], None)]
+
+            # Seeking within a gzipped file requires decompressing everything before the seek position.
+            if delimited_file_path.endswith(".gz"):
+                self._print_message(f"{delimited_file_path} is gzipped, so it cannot be split into {num_chunks} chunks and will be summarized in a single process.")
+                return [(offsets[0], None)]
+
+            file_size = os.path.getsize(delimited_file_path)
 
-            # Initialize the column sizes and types.
-            column_sizes_dict = {}
-            column_types_values_dict = {} # TODO: This dictionary could get really large. Could modify the code to use sqlitedict or https://stackoverflow.com/questions/47233562/key-value-store-in-python-for-possibly-100-gb-of-data-without-client-server.
-            column_types_dict = {}
-            for i in range(start_index, end_index):
-                column_sizes_dict[i] = 0
-                column_types_values_dict[i] = {b"i": set(), b"f": set(), b"s": set()}
+            for i in range(1, num_chunks):
+                approximate_offset = offsets[0] + (file_size - offsets[0]) * i // num_chunks
 
-            # Loop through the file for the specified columns.
+                if approximate_offset <= offsets[-1]:
+                    continue
+
+                in_file.seek(approximate_offset - 1)
+                in_file.readline()
+                offset = in_file.tell()
+
+                if offsets[-1] < offset < file_size:
+                    offsets.append(offset)
+
+        return [(offsets[i], offsets[i + 1] if i < len(offsets) - 1 else None) for i in range(len(offsets))]
+
+    def _parse_columns_chunk(self, delimited_file_path, delimiter, start_offset, end_offset, num_cols, compression_type, numeric_encoding, max_exact_values, max_num_checkpoints=0):
+        with f4py.get_delimited_file_handle(delimited_file_path) as in_file:
+            in_file.seek(start_offset)
+
+            # Each profiler tracks the size, type and (approximate) number of distinct values for a column.
+            column_profilers = [f4py.ColumnProfiler(max_exact_values=max_exact_values, track_bigrams=(compression_type == "dictionary"), check_float32=(numeric_encoding == "binary")) for i in range(num_cols)]
+
+            # The offsets of evenly spaced lines. The spacing doubles whenever the list gets too long.
+            checkpoints = []
+            checkpoint_interval = 1
+
+            # Loop through the lines in this chunk of the file.
             num_rows = 0
+            position = start_offset
             for line in in_file:
-                line = line.rstrip(b"\n")
+                if end_offset is not None and position >= end_offset:
+                    break
 
-                line_items = line.split(delimiter)
-                for i in range(start_index, end_index):
-                    column_sizes_dict[i] = max([column_sizes_dict[i], len(line_items[i])])
+                if max_num_checkpoints and num_rows % checkpoint_interval == 0:
+                    checkpoints.append((num_rows, position))
 
-                    inferred_type = _infer_type(line_items[i])
+                    if len(checkpoints) > max_num_checkpoints:
+                        checkpoints = checkpoints[::2]
+                        checkpoint_interval *= 2
 
-                    column_types_values_dict[i][inferred_type].add(line_items[i])
+                position += len(line)
 
-                    #if build_compression_dictionary and inferred_type == b"s":
-                        #compression_training_set.add(line_items[i])
+                line_items = line.rstrip(b"\n").split(delimiter)
+                for i in range(num_cols):
+                    column_profilers[i].add(line_items[i])
 
                 num_rows += 1
 
                 if num_rows % 100000 == 0:
-                    self._print_message(f"Processed line {num_rows} of {delimited_file_path} for columns {start_index} - {end_index - 1}")
+                    self._print_message(f"Processed line {num_rows} of {delimited_file_path} (start_offset = {start_offset})")
+
+        return column_profilers, num_rows, checkpoints
+
+    def _merge_chunk_results(self, chunk_results, num_cols, compression_type, numeric_encoding):
+        column_profilers = chunk_results[0][0]
+        num_rows = chunk_results[0][1]
+
+        for chunk_profilers, chunk_num_rows, checkpoints in chunk_results[1:]:
+            for i in range(num_cols):
+                column_profilers[i].merge(chunk_profilers[i])
 
-        for i in range(start_index, end_index):
-            column_types_dict[i] = _infer_type_for_column(column_types_values_dict[i])
+            num_rows += chunk_num_rows
 
+        column_sizes = [profiler.max_length for profiler in column_profilers]
+        column_types = [profiler.column_type for profiler in column_profilers]
+        column_encodings = [profiler.get_binary_format() if numeric_encoding == "binary" else None for profiler in column_profilers]
         column_compression_dicts = {}
 
-        if compression_type == "dictionary":
-            for i in range(start_index, end_index):
-                unique_values = list(column_types_values_dict[i][b"s"] | column_types_values_dict[i][b"i"] | column_types_values_dict[i][b"f"])
-                unique_values = sorted(unique_values)
+        if compression_type == "dictionary" and num_rows > 0:
+            for i in range(num_cols):
+                unique_values = column_profilers[i].get_distinct_values()
 
-                use_categorical_compression = (len(unique_values) / num_rows) <= 0.1
+                # The exact values are only available if there were not too many of them.
+                use_categorical_compression = (column_profilers[i].get_num_distinct() / num_rows) <= 0.1 and unique_values is not None
                 column_compression_dicts[i] = {}
                 column_compression_dicts[i]["map"] = {}
 
                 if use_categorical_compression:
+                    unique_values = sorted(unique_values)
                     column_compression_dicts[i]["compression_type"] = b"c"
                     num_bytes = f4py.get_bigram_size(len(unique_values))
 
@@ -218,66 +412,87 @@ class Builder:
                         #column_compression_dicts[i]["map"][value] = int2ba(j, length = length).to01()
                         column_compression_dicts[i]["map"][value] = j.to_bytes(length = num_bytes, byteorder = "big")
 
-                    column_sizes_dict[i] = num_bytes
+                    column_sizes[i] = num_bytes
                 else:
-                    column_compression_dicts[i]["compression_type"] = column_types_dict[i]
-                    bigrams = _find_unique_bigrams(unique_values)
+                    column_compression_dicts[i]["compression_type"] = column_types[i]
+                    bigrams = sorted(column_profilers[i].get_bigrams())
                     num_bytes = f4py.get_bigram_size(len(bigrams))
 
                     for j, gram in _enumerate_for_compression(bigrams):
                         #column_compression_dicts[i]["map"][gram] = int2ba(j, length = length).to01()
                         column_compression_dicts[i]["map"][gram] = j.to_bytes(length = num_bytes, byteorder = "big")
 
-                    column_sizes_dict[i] = 0
-                    for unique_value in unique_values:
-                        compressed_length = len(f4py.compress_using_2_grams(unique_value, column_compression_dicts[i]["map"]))
-                        column_sizes_dict[i] = max(column_sizes_dict[i], compressed_length)
+                    # Each bigram (or trailing single character) is replaced by a code of num_bytes bytes.
+                    column_sizes[i] = math.ceil(column_sizes[i] / 2) * num_bytes
 
-        return column_sizes_dict, column_types_dict, column_compression_dicts, num_rows
+        return column_sizes, column_types, column_encodings, column_compression_dicts, num_rows, column_profilers
 
-    def _save_output_file(self, delimited_file_path, f4_file_path, delimiter, comment_prefix, compression_type, column_sizes, compression_dicts, num_rows, num_processes, num_rows_per_save, tmp_dir_path):
+    def _save_output_file(self, delimited_file_path, f4_file_path, delimiter, compression_type, column_sizes, column_encodings, compression_dicts, chunk_offsets, num_processes, num_rows_per_save, tmp_dir_path, schema_column_types=None, key_column_indices=[], num_rows_per_key_file=None):
         self._print_message(f"Parsing chunks of {delimited_file_path} and saving to temp directory ({tmp_dir_path})")
 
-        if num_processes == 1:
-            line_length = self._save_rows_chunk(delimited_file_path, delimiter, comment_prefix, compression_type, column_sizes, compression_dicts, 0, 0, num_rows, num_rows_per_save, tmp_dir_path)
+        if len(chunk_offsets) == 1:
+            chunk_results = [self._save_rows_chunk(delimited_file_path, delimiter, compression_type, column_sizes, column_encodings, compression_dicts, 0, chunk_offsets[0][0], chunk_offsets[0][1], num_rows_per_save, tmp_dir_path, schema_column_types, key_column_indices, num_rows_per_key_file)]
         else:
-            row_chunk_indices = _generate_chunk_ranges(num_rows, math.ceil(num_rows / num_processes) + 1)
+            chunk_results = Parallel(n_jobs=num_processes)(delayed(self._save_rows_chunk)(delimited_file_path, delimiter, compression_type, column_sizes, column_encodings, compression_dicts, i, chunk[0], chunk[1], num_rows_per_save, tmp_dir_path, schema_column_types, key_column_indices, num_rows_per_key_file) for i, chunk in enumerate(chunk_offsets))
+
+        # Find the line length and number of rows.
+        line_length = max([chunk_result[0] for chunk_result in chunk_results])
+        num_rows = sum([chunk_result[1] for chunk_result in chunk_results])
 
-            # Find the line length.
-            max_line_sizes = Parallel(n_jobs=num_processes)(delayed(self._save_rows_chunk)(delimited_file_path, delimiter, comment_prefix, compression_type, column_sizes, compression_dicts, i, row_chunk[0], row_chunk[1], num_rows_per_save, tmp_dir_path) for i, row_chunk in enumerate(row_chunk_indices))
-            line_length = max(max_line_sizes)
+        schema_violations = [chunk_result[2] for chunk_result in chunk_results if chunk_result[2]]
+        if len(schema_violations) > 0:
+            return line_length, num_rows, schema_violations[0]
 
         # Merge the file chunks. This dictionary enables us to sort them properly.
         self._print_message(f"Merging the file chunks for {delimited_file_path}")
-        self._merge_chunk_files(f4_file_path, num_processes, num_rows_per_save, tmp_dir_path)
+        self._merge_chunk_files(f4_file_path, len(chunk_offsets), line_length, num_rows_per_save, tmp_dir_path)
 
-        return line_length
+        return line_length, num_rows, None
 
-    def _save_rows_chunk(self, delimited_file_path, delimiter, comment_prefix, compression_type, column_sizes, compression_dicts, chunk_number, start_index, end_index, num_rows_per_save, tmp_dir_path):
+    def _save_rows_chunk(self, delimited_file_path, delimiter, compression_type, column_sizes, column_encodings, compression_dicts, chunk_number, start_offset, end_offset, num_rows_per_save, tmp_dir_path, schema_column_types=None, key_column_indices=[], num_rows_per_key_file=None):
         max_line_size = 0
+        num_rows = 0
+
+        # Values in these columns are saved separately (as they are stored in the output file) so they can be indexed without reading the file again.
+        # They are saved in files of about num_rows_per_key_file rows (when the output lines are saved), so they are not all kept in memory.
+        key_items = {i: [] for i in key_column_indices}
+        num_key_files = 0
 
         if compression_type == "zstd":
             compressor = zstandard.ZstdCompressor(level = 0)
 
-        # Save the data to output file. Ignore the header line.
+        # Binary-encoded columns are converted to numbers and packed rather than padded.
+        encode_functions = {}
+        for i, encoding in enumerate(column_encodings):
+            if encoding:
+                encode_functions[i] = (encoding, fastnumbers.fast_float if encoding in ("<f", "<d") else fastnumbers.fast_int)
+
+        # Save the data to output file. Go directly to the first line in this chunk.
+        # For gzipped files, seeking decompresses (but does not parse) the preceding data.
         with f4py.get_delimited_file_handle(delimited_file_path) as in_file:
-            self._exclude_comments_and_header(in_file, comment_prefix)
+            in_file.seek(start_offset)
 
-            with open(f"{tmp_dir_path}{chunk_number}", 'wb') as chunk_file:
+            # Compressed lines vary in size, so we store their sizes and pad them when merging.
+            with open(f"{tmp_dir_path}{chunk_number}", 'wb') as chunk_file, (open(f"{tmp_dir_path}{chunk_number}_linesizes", 'wb') if compression_type == "zstd" else nullcontext()) as size_file:
                 out_lines = []
 
-                line_index = -1
+                position = start_offset
                 for line in in_file:
-                    # Check whether we should process the specified line.
-                    line_index += 1
-                    if line_index < start_index:
-                        continue
-                    if line_index == end_index:
+                    # Check whether we have reached the next chunk.
+                    if end_offset is not None and position >= end_offset:
                         break
+                    position += len(line)
 
                     # Parse the data from the input file.
                     line_items = line.rstrip(b"\n").split(delimiter)
 
+                    # Stop as soon as a value does not fit the schema.
+                    if schema_column_types:
+                        schema_violation = _find_schema_violation(line_items, column_sizes, schema_column_types, column_encodings)
+
+                        if schema_violation:
+                            return max_line_size, num_rows, f"Row {num_rows + 1} after byte {start_offset} of {delimited_file_path} does not fit the schema: {schema_violation}"
+
                     # Replace values with compressed versions and update column sizes.
 #                    for column_index, compression_dict in compression_dicts.items():
 #                        line_items[column_index] = compression_dict[line_items[column_index]]
@@ -291,14 +506,27 @@ class Builder:
 
                     if compression_type == "dictionary":
                         for i, size in enumerate(column_sizes):
-                            compressed_value = f4py.compress_using_2_grams(line_items[i], compression_dicts[i]["map"])
+                            if compression_dicts[i]["compression_type"] == b"c":
+                                compressed_value = compression_dicts[i]["map"][line_items[i]]
+                            else:
+                                compressed_value = f4py.compress_using_2_grams(line_items[i], compression_dicts[i]["map"])
                             out_items.append(f4py.format_string_as_fixed_width(compressed_value, size))
+                    elif len(encode_functions) > 0:
+                        for i, size in enumerate(column_sizes):
+                            if i in encode_functions:
+                                encoding, conversion_function = encode_functions[i]
+                                out_items.append(struct.pack(encoding, conversion_function(line_items[i])))
+                            else:
+                                out_items.append(f4py.format_string_as_fixed_width(line_items[i], size))
                     else:
                         for i, size in enumerate(column_sizes):
                             out_items.append(f4py.format_string_as_fixed_width(line_items[i], size))
 
                     out_line = b"".join(out_items)
 
+                    for i in key_column_indices:
+                        key_items[i].append(line_items[i] if compression_type == "dictionary" else out_items[i])
+
                     if compression_type == "zstd":
                         out_line = compressor.compress(out_line)
 
@@ -306,16 +534,31 @@ class Builder:
                     max_line_size = max([max_line_size, line_size])
 
                     out_lines.append(out_line)
+                    num_rows += 1
 
                     if len(out_lines) % num_rows_per_save == 0:
-                        self._print_message(f"Processed chunk of {delimited_file_path} at line {line_index} (start_index = {start_index}, end_index = {end_index})")
+                        self._print_message(f"Processed chunk of {delimited_file_path} at position {position} (start_offset = {start_offset}, end_offset = {end_offset})")
                         chunk_file.write(b"".join(out_lines))
+
+                        if size_file:
+                            size_file.write(b"".join([f"{len(out_line)}\n".encode() for out_line in out_lines]))
+
                         out_lines = []
 
+                        if len(key_column_indices) > 0 and (num_rows_per_key_file is None or len(key_items[key_column_indices[0]]) >= num_rows_per_key_file):
+                            _save_key_arrays(key_items, column_encodings, f"{tmp_dir_path}{chunk_number}_keys", num_key_files)
+                            num_key_files += 1
+
                 if len(out_lines) > 0:
                     chunk_file.write(b"".join(out_lines))
 
-        return max_line_size
+                    if size_file:
+                        size_file.write(b"".join([f"{len(out_line)}\n".encode() for out_line in out_lines]))
+
+        if len(key_column_indices) > 0 and (num_key_files == 0 or len(key_items[key_column_indices[0]]) > 0):
+            _save_key_arrays(key_items, column_encodings, f"{tmp_dir_path}{chunk_number}_keys", num_key_files)
+
+        return max_line_size, num_rows, None
 
     def _exclude_comments_and_header(self, in_file, comment_prefix):
         # Ignore the header because we don't need column names here. Also ignore commented lines.
@@ -326,44 +569,38 @@ class Builder:
         else:
             in_file.readline()
 
-    def _merge_chunk_files(self, f4_file_path, num_processes, num_rows_per_save, tmp_dir_path):
+    def _merge_chunk_files(self, f4_file_path, num_chunks, line_length, num_rows_per_save, tmp_dir_path):
         with open(f4_file_path, "wb") as f4_file:
             out_lines = []
 
-            for i in range(num_processes):
+            for i in range(num_chunks):
                 chunk_file_path = f"{tmp_dir_path}{i}"
+                size_file_path = f"{chunk_file_path}_linesizes"
 
                 if not os.path.exists(chunk_file_path):
                     continue
 
                 with open(chunk_file_path, "rb") as chunk_file:
-                    for line in chunk_file:
-                        out_lines.append(line)
-
-                        if len(out_lines) % num_rows_per_save == 0:
-                            f4_file.write(b"".join(out_lines))
-                            out_lines = []
+                    if os.path.exists(size_file_path):
+                        # Pad each compressed line so that all lines have the same length.
+                        with open(size_file_path, "rb") as size_file:
+                            lines = (f4py.format_string_as_fixed_width(chunk_file.read(fastnumbers.fast_int(size_line.rstrip(b"\n"))), line_length) for size_line in size_file)
 
-                    #size_file_path = f"{tmp_dir_path}{i}_linesizes"
+                            for line in lines:
+                                out_lines.append(line)
 
-#                    with open(size_file_path, 'rb') as size_file:
-#                    position = 0
+                                if len(out_lines) % num_rows_per_save == 0:
+                                    f4_file.write(b"".join(out_lines))
+                                    out_lines = []
 
-#                        for size_line in size_file:
-                            #TODO
-                            #size = fastnumbers.fast_int(size_line.rstrip(b"\n"))
-#                            print(line_length)
-
-                            #out_line = chunk_file[position:(position + size)]
-#                            out_line = chunk_file[position:(position + line_length - 1)]
-                            #out_line = f4py._format_string_as_fixed_width(out_line, line_length)
-#                            out_lines.append(out_line)
-                            #position += size
-#                            position += line_length
+                        os.remove(size_file_path)
+                    else:
+                        for line in chunk_file:
+                            out_lines.append(line)
 
-#                            if len(out_lines) % num_rows_per_save == 0:
-#                                f4_file.write(b"".join(out_lines))
-#                                out_lines = []
+                            if len(out_lines) % num_rows_per_save == 0:
+                                f4_file.write(b"".join(out_lines))
+                                out_lines = []
 
                 os.remove(chunk_file_path)
 
@@ -453,46 +690,87 @@ class Builder:
 # Class functions (non-public)
 #####################################################
 
-def _generate_chunk_ranges(num_cols, num_cols_per_chunk):
-    if num_cols_per_chunk:
-        last_end_index = 0
-
-        while last_end_index != num_cols:
-            last_start_index = last_end_index
-            last_end_index = min([last_start_index + num_cols_per_chunk, num_cols])
-            yield [last_start_index, last_end_index]
-    else:
-        yield [0, num_cols]
-
-def _infer_type(value):
-    #if not value or f4py.is_missing_value(value):
-    #    return None
-    if fastnumbers.isint(value):
-        return b"i"
-    if fastnumbers.isfloat(value):
-        return b"f"
-    return b"s"
-
-def _infer_type_for_column(types_dict):
-    if len(types_dict) == 0:
+def _widen_type(type1, type2):
+    for the_type in (b"s", b"f"):
+        if the_type in (type1, type2):
+            return the_type
+
+    return b"i"
+
+def _get_default_binary_format(column_type, numeric_encoding):
+    if numeric_encoding != "binary" or column_type == b"s":
         return None
 
-    if len(types_dict[b"s"]) > 0:
-        return b"s"
-    elif len(types_dict[b"f"]) > 0:
-        return b"f"
+    return "<d" if column_type == b"f" else "<q"
 
-    return b"i"
+def _find_schema_violation(line_items, column_sizes, column_types, column_encodings):
+    if len(line_items) != len(column_sizes):
+        return f"it has {len(line_items)} values, but the schema has {len(column_sizes)} columns."
+
+    for i, value in enumerate(line_items):
+        if len(value) > column_sizes[i]:
+            return f"the value {value.decode()} is longer than {column_sizes[i]} characters."
+
+        if column_types[i] == b"i" and not fastnumbers.isint(value):
+            return f"the value {value.decode()} is not an integer."
+
+        if column_encodings[i] == "<q" and not -2 ** 63 <= fastnumbers.fast_int(value) < 2 ** 63:
+            return f"the value {value.decode()} is too large to be stored as a binary-encoded integer."
+
+        if column_types[i] == b"f" and not fastnumbers.isfloat(value):
+            return f"the value {value.decode()} is not a float."
+
+    return None
+
+def _get_column_name_list(columns):
+    # Zone map, Bloom filter and other index columns can be a column name or a list of them (invalid values are reported when the index is built).
+    if isinstance(columns, str):
+        return [columns]
+
+    if isinstance(columns, list):
+        return [column for column in columns if isinstance(column, str)]
+
+    return []
+
+def _save_key_arrays(key_items, column_encodings, key_file_prefix, file_number):
+    # The values for each column are saved in a separate file, and the lists are then emptied.
+    for i, items in key_items.items():
+        np.save(f"{key_file_prefix}{i}_{file_number}.npy", _get_key_array(items, column_encodings[i]))
+        key_items[i] = []
+
+def _load_key_arrays(tmp_dir_path, num_chunks, column_index):
+    # Returns the saved values for a column (as memory-mapped arrays) in row order.
+    key_arrays = []
+
+    for chunk_number in range(num_chunks):
+        for file_number in count():
+            key_file_path = f"{tmp_dir_path}{chunk_number}_keys{column_index}_{file_number}.npy"
+
+            if not os.path.exists(key_file_path):
+                break
+
+            key_arrays.append(np.load(key_file_path, mmap_mode="r"))
+
+    return key_arrays
+
+def _get_key_array(key_items, encoding):
+    if encoding:
+        return np.frombuffer(b"".join(key_items), dtype=encoding)
+
+    return np.array(key_items, dtype=bytes)
+
+def _split_at_checkpoints(checkpoints, num_rows, num_chunks):
+    # Choose the checkpoints (row index, offset) that come closest to splitting the rows evenly.
+    offsets = [checkpoints[0][1]]
 
-def _find_unique_bigrams(values):
-    grams = set()
+    for i in range(1, num_chunks):
+        target_row = num_rows * i // num_chunks
+        offset = min(checkpoints, key=lambda checkpoint: abs(checkpoint[0] - target_row))[1]
 
-    for value in values:
-        for start_i in range(0, len(value), 2):
-            end_i = (start_i + 2)
-            grams.add(value[start_i:end_i])
+        if offset > offsets[-1]:
+            offsets.append(offset)
 
-    return sorted(list(grams))
+    return [(offsets[i], offsets[i + 1] if i < len(offsets) - 1 else None) for i in range(len(offsets))]
 
 # We skip the space character because it causes a problem when we parse from a file.
 def _enumerate_for_compression(values):
@@ -0,0 +1,286 @@
+import fastnumbers
+import hashlib
+import math
+import random
+import struct
+
+class ColumnProfiler:
+    """
+    This class summarizes the values in a column as they are streamed through it.
+    Memory use does not depend on the number of rows.
+
+    Args:
+        max_exact_values (int): The number of distinct values that are stored exactly. After this,
+            distinct values are only counted (approximately) with a HyperLogLog sketch.
+        track_bigrams (bool): Whether to keep the set of unique bigrams, which is needed for
+            dictionary compression, after the exact values have been discarded.
+        check_float32 (bool): Whether to check if every numeric value can be stored as a 32-bit float without loss.
+        max_sample_size (int): The number of values kept in a uniform random sample, which is used to build a histogram.
+    """
+    def __init__(self, max_exact_values=1000, track_bigrams=False, check_float32=False, max_sample_size=1000):
+        self.max_exact_values = max_exact_values
+        self.track_bigrams = track_bigrams
+        self.check_float32 = check_float32
+        self.max_sample_size = max_sample_size
+
+        # The type moves from i (integer) to f (float) to s (string) but never back.
+        self.column_type = b"i"
+        self.max_length = 0
+        self.values = set()
+        self.sketch = None
+        self.bigrams = None
+
+        # These are tracked for every column. String values are compared after removing trailing spaces, as they are when parsed.
+        self.num_values = 0
+        self.num_empty = 0
+        self.min_value = None
+        self.max_value = None
+        self.sample = []
+        self.random = random.Random(0)
+        self.next_sample_position = 1
+        self.sample_weight = None
+
+        # These are only meaningful while the column is numeric.
+        self.min_number = None
+        self.max_number = None
+        self.float32_exact = check_float32
+
+    def add(self, value):
+        if len(value) > self.max_length:
+            self.max_length = len(value)
+
+        stripped_value = value.rstrip(b" ")
+        self.num_values += 1
+
+        if not stripped_value:
+            self.num_empty += 1
+
+        if self.num_values == 1:
+            self.min_value = self.max_value = stripped_value
+        elif stripped_value < self.min_value:
+            self.min_value = stripped_value
+        elif stripped_value > self.max_value:
+            self.max_value = stripped_value
+
+        if self.num_values == self.next_sample_position:
+            self._add_to_sample(stripped_value)
+
+        if self.column_type == b"i":
+            if not fastnumbers.isint(value):
+                self.column_type = b"f" if fastnumbers.isfloat(value) else b"s"
+        elif self.column_type == b"f":
+            if not fastnumbers.isfloat(value):
+                self.column_type = b"s"
+
+        if self.column_type != b"s":
+            number = fastnumbers.fast_int(value) if self.column_type == b"i" else fastnumbers.fast_float(value)
+
+            if self.min_number is None or number < self.min_number:
+                self.min_number = number
+            if self.max_number is None or number > self.max_number:
+                self.max_number = number
+
+            if self.float32_exact:
+                self.float32_exact = _is_float32_exact(number)
+
+        if self.values is None:
+            self.sketch.add(value)
+
+            if self.track_bigrams:
+                self.bigrams.update(_get_bigrams(value))
+        else:
+            self.values.add(value)
+
+            if len(self.values) > self.max_exact_values:
+                self._discard_values()
+
+    def merge(self, other):
+        self.max_length = max(self.max_length, other.max_length)
+        self.column_type = max(self.column_type, other.column_type, key=_TYPE_RANKS.get)
+        self.min_number = min([x for x in (self.min_number, other.min_number) if x is not None], default=None)
+        self.max_number = max([x for x in (self.max_number, other.max_number) if x is not None], default=None)
+        self.float32_exact = self.float32_exact and other.float32_exact
+        self.min_value = min([x for x in (self.min_value, other.min_value) if x is not None], default=None)
+        self.max_value = max([x for x in (self.max_value, other.max_value) if x is not None], default=None)
+        self.num_empty += other.num_empty
+        self._merge_samples(other)
+
+        if self.values is not None and other.values is not None:
+            self.values |= other.values
+
+            if len(self.values) > self.max_exact_values:
+                self._discard_values()
+        else:
+            if self.values is not None:
+                self._discard_values()
+
+            if other.values is None:
+                self.sketch.merge(other.sketch)
+
+                if self.track_bigrams:
+                    self.bigrams |= other.bigrams
+            else:
+                for value in other.values:
+                    self.sketch.add(value)
+
+                    if self.track_bigrams:
+                        self.bigrams.update(_get_bigrams(value))
+
+    def get_num_distinct(self):
+        if self.values is None:
+            return self.sketch.estimate()
+
+        return len(self.values)
+
+    def get_distinct_values(self):
+        # Returns None if there were too many distinct values to store them.
+        return self.values
+
+    def get_bigrams(self):
+        if self.values is None:
+            return self.bigrams
+
+        bigrams = set()
+        for value in self.values:
+            bigrams.update(_get_bigrams(value))
+
+        return bigrams
+
+    def get_binary_format(self):
+        # Find the narrowest little-endian struct format that can hold every value in a numeric column.
+        if self.column_type == b"s" or self.min_number is None:
+            return None
+
+        if self.column_type == b"f":
+            return "<f" if self.float32_exact else "<d"
+
+        for int_format in ("<b", "<h", "<i", "<q"):
+            num_bits = struct.calcsize(int_format) * 8
+            if -2 ** (num_bits - 1) <= self.min_number and self.max_number < 2 ** (num_bits - 1):
+                return int_format
+
+        # The integers are too large to store in binary format.
+        return None
+
+    def get_stats(self, column_type, num_histogram_bins=10):
+        # The column type may differ from the type that was detected (for example, when a schema widens it).
+        # Returns None if the statistics cannot be saved.
+        if column_type == b"s" or self.column_type == b"s":
+            min_value, max_value = self.min_value, self.max_value
+            conversion_function = bytes
+        else:
+            min_value, max_value = self.min_number, self.max_number
+            conversion_function = fastnumbers.fast_int if column_type == b"i" else fastnumbers.fast_float
+
+            # Statistics are serialized with msgpack, which cannot store integers this large, so there are none for this column.
+            if any(isinstance(x, int) and not _MIN_SERIALIZABLE_INT <= x <= _MAX_SERIALIZABLE_INT for x in (min_value, max_value)):
+                return None
+
+        # The histogram boundaries divide the sample into bins that each hold about the same number of values.
+        sorted_sample = sorted([conversion_function(value) for value in self.sample])
+        histogram = []
+        if len(sorted_sample) > 0:
+            histogram = [sorted_sample[round(i * (len(sorted_sample) - 1) / num_histogram_bins)] for i in range(num_histogram_bins + 1)]
+
+        return {"min": min_value, "max": max_value, "num_empty": self.num_empty, "num_distinct": self.get_num_distinct(), "histogram": histogram}
+
+    def _add_to_sample(self, value):
+        # This uses reservoir sampling (Algorithm L). Rather than drawing a random number for each
+        # value, we draw the position of the next value that will replace one in the sample.
+        if len(self.sample) < self.max_sample_size:
+            self.sample.append(value)
+            self.next_sample_position += 1
+
+            if len(self.sample) == self.max_sample_size:
+                self.sample_weight = 1.0
+                self._skip_sample_values()
+        else:
+            self.sample[self.random.randrange(self.max_sample_size)] = value
+            self._skip_sample_values()
+
+    def _skip_sample_values(self):
+        self.sample_weight *= math.exp(math.log(1.0 - self.random.random()) / self.max_sample_size)
+        self.next_sample_position = self.num_values + math.floor(math.log(1.0 - self.random.random()) / math.log(1.0 - self.sample_weight)) + 1
+
+    def _merge_samples(self, other):
+        if len(self.sample) + len(other.sample) <= self.max_sample_size:
+            # Neither sample is full, so each one contains every value it has seen.
+            self.sample = self.sample + other.sample
+        else:
+            # Take values from each sample in proportion to the number of values it represents.
+            num_from_self = round(self.max_sample_size * self.num_values / (self.num_values + other.num_values))
+            num_from_self = max(self.max_sample_size - len(other.sample), min(len(self.sample), num_from_self))
+
+            self.sample = self.random.sample(self.sample, num_from_self) + self.random.sample(other.sample, self.max_sample_size - num_from_self)
+
+        self.num_values += other.num_values
+        self.next_sample_position = self.num_values + 1
+
+        if len(self.sample) == self.max_sample_size:
+            self.sample_weight = min([x for x in (self.sample_weight, other.sample_weight, 1.0) if x is not None])
+            self._skip_sample_values()
+
+    def _discard_values(self):
+        self.sketch = HyperLogLog()
+        for value in self.values:
+            self.sketch.add(value)
+
+        if self.track_bigrams:
+            self.bigrams = self.get_bigrams()
+
+        self.values = None
+
+class HyperLogLog:
+    """
+    This class estimates the number of distinct values it has seen using a fixed amount of memory.
+
+    Args:
+        precision (int): The number of bits used to select a register. The relative error is about 1.04 / sqrt(2 ** precision).
+    """
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def add(self, value):
+        # Use a hash that is stable across processes so that sketches can be merged.
+        hash_value = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), byteorder="little")
+        register_index = hash_value & (len(self.registers) - 1)
+        remaining_bits = hash_value >> self.precision
+        rank = (64 - self.precision) - remaining_bits.bit_length() + 1
+
+        if rank > self.registers[register_index]:
+            self.registers[register_index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        num_registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        raw_estimate = alpha * num_registers ** 2 / sum(2.0 ** -r for r in self.registers)
+
+        # Use linear counting when the estimate is small and some registers are still empty.
+        num_empty_registers = self.registers.count(0)
+        if raw_estimate <= 2.5 * num_registers and num_empty_registers > 0:
+            return round(num_registers * math.log(num_registers / num_empty_registers))
+
+        return round(raw_estimate)
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+_TYPE_RANKS = {b"i": 0, b"f": 1, b"s": 2}
+
+# These are the smallest and largest integers that msgpack can store.
+_MIN_SERIALIZABLE_INT = -2 ** 63
+_MAX_SERIALIZABLE_INT = 2 ** 64 - 1
+
+def _is_float32_exact(number):
+    try:
+        return struct.unpack("<f", struct.pack("<f", number))[0] == number
+    except OverflowError:
+        return False
+
+def _get_bigrams(value):
+    return [value[start_i:(start_i + 2)] for start_i in range(0, len(value), 2)]
@@ -1,10 +1,15 @@
 import f4py
 import fastnumbers
+import numpy as np
 #from joblib import Parallel, delayed
 import operator
-import os
 import re
 
+try:
+    from re import _parser as _regex_parser
+except ImportError:
+    import sre_parse as _regex_parser
+
 """
 This class is used to indicate that no filtering should be performed.
 """
@@ -18,8 +23,36 @@ class NoFilter:
     def _filter_column_values(self, data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
         return row_indices
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        return set(range(end_index))
+    def _get_scan_cost(self, column_coords_dict, decompression_type):
+        # This is a rough estimate of the number of bytes that must be evaluated per row when scanning the data file.
+        return 0
+
+    def _is_vectorized(self, column_coords_dict, decompression_type):
+        return True
+
+    def _excluded_by_stats(self, column_stats_dict):
+        # Returns True if the column statistics show that no row can pass this filter.
+        return False
+
+    def _excluded_by_bloom_filters(self, data_file_path):
+        # Returns True if Bloom filters show that no row can pass this filter.
+        return False
+
+    def _get_index_search_filters(self):
+        # Returns filters (for one column) that can narrow the range of keys in a sorted index.
+        return []
+
+    def _get_bitmap(self, data_file_path, column_type_dict):
+        # Returns a bitmap of the rows that pass this filter if bitmap indexes can be used (otherwise, None).
+        return None
+
+    def _has_index(self, data_file_path, column_type_dict):
+        # Returns True if an index can be used to find the rows that pass this filter (otherwise, the data file is scanned).
+        return False
+
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        # When max_num_rows is specified, a filter may return only the first max_num_rows matching rows.
+        return f4py.RowSet(start=0, end=end_index if max_num_rows is None else min(end_index, max_num_rows))
 
 class __SimpleBaseFilter(NoFilter):
     def __init__(self, column_name, value):
@@ -38,25 +71,102 @@ class __SimpleBaseFilter(NoFilter):
         return set([self.column_name])
 
     def _filter_column_values(self, data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
+        row_indices = _select_zone_rows(data_file_path, row_indices, self, self.column_name)
+        row_indices = _select_bloom_filter_rows(data_file_path, row_indices, self)
+        coords = column_coords_dict[self.column_name]
+        passes_values_function = self._get_passes_values_function(coords)
+
+        # When the data are not compressed, we can evaluate many values at once.
+        if not decompression_type and passes_values_function:
+            try:
+                return _filter_column_values_vectorized(data_file_path, row_indices, coords, passes_values_function)
+            except OverflowError:
+                # Some integers are too large for NumPy, so we check each value.
+                pass
+
         with f4py.Parser(data_file_path, fixed_file_extensions=[""], stats_file_extensions=[".ll"]) as parser:
             line_length = parser._get_stat(".ll")
-            coords = column_coords_dict[self.column_name]
             data_file_handle = parser._get_file_handle("")
 
             # This avoids having to check the decompression type each time we parse a value.
             decompressor = f4py.get_decompressor(decompression_type, decompressor)
-            parse_function = parser._get_parse_row_value_function(decompression_type)
+            # Binary-encoded values are passed to numeric filters as numbers.
+            parse_function = parser._get_parse_row_value_function(decompression_type, coords, self._get_conversion_function() != f4py.do_nothing)
 
-            passing_row_indices = set()
+            passing_row_indices = []
             for i in row_indices:
                 if self.passes(parse_function(i, coords, line_length, data_file_handle, decompression_type, decompressor, bigram_size_dict, self.column_name)):
-                    passing_row_indices.add(i)
+                    passing_row_indices.append(i)
 
-            return passing_row_indices
+            # Row sets are iterated in sorted order, so the passing row indices are sorted.
+            return f4py.RowSet(passing_row_indices, is_sorted=True)
 
     def _get_conversion_function(self):
         return f4py.do_nothing
 
+    def _get_bloom_filter_value(self):
+        # Filters that only pass rows with a particular value return that value so Bloom filters can be checked.
+        return None
+
+    def _find_bloom_filter_blocks(self, data_file_path):
+        # Returns the blocks of rows that may contain passing rows (and the block size), or None if there is no Bloom filter to check.
+        value = self._get_bloom_filter_value()
+        bloom_filter_file_path = f4py.IndexBuilder._get_bloom_filter_file_path(data_file_path, self.column_name.decode())
+
+        if value is None or not f4py.file_exists(bloom_filter_file_path):
+            return None
+
+        return f4py.IndexSearcher._find_bloom_filter_blocks(bloom_filter_file_path, value)
+
+    def _excluded_by_bloom_filters(self, data_file_path):
+        bloom_filter_blocks = self._find_bloom_filter_blocks(data_file_path)
+
+        return bloom_filter_blocks is not None and len(bloom_filter_blocks[0]) == 0
+
+    def _get_bitmap(self, data_file_path, column_type_dict):
+        bitmap_index_file_path = f4py.IndexBuilder._get_bitmap_index_file_path(data_file_path, self.column_name.decode())
+
+        if not self._can_use_index_keys(column_type_dict) or not f4py.file_exists(bitmap_index_file_path):
+            return None
+
+        return f4py.IndexSearcher._filter_using_bitmap(bitmap_index_file_path, self.passes)
+
+    def _has_index(self, data_file_path, column_type_dict):
+        return self._can_use_index_keys(column_type_dict) and any(f4py.file_exists(index_file_path) for index_file_path in self._get_index_file_paths(data_file_path))
+
+    def _can_use_index_keys(self, column_type_dict):
+        # Index keys are stored as values of the column's type (for example, numbers rather than the text in the data file).
+        return True
+
+    def _get_index_file_paths(self, data_file_path):
+        # Returns the paths of the index files (which may not exist) that this filter can use.
+        return [f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode()), f4py.IndexBuilder._get_bitmap_index_file_path(data_file_path, self.column_name.decode())]
+
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        # Columns without an index that this filter can use are scanned.
+        if not self._has_index(data_file_path, column_type_dict):
+            return self._filter_column_values(data_file_path, f4py.RowSet(start=0, end=end_index), column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        return self._filter_using_index(data_file_path, end_index, column_type_dict, max_num_rows)
+
+    def _get_passes_values_function(self, column_coords):
+        # Filters that can evaluate an array of values at once return a function that does so.
+        return None
+
+    def _get_scan_cost(self, column_coords_dict, decompression_type):
+        coords = column_coords_dict[self.column_name]
+
+        if self._is_vectorized(column_coords_dict, decompression_type):
+            return coords[1] - coords[0]
+
+        return (coords[1] - coords[0]) * _ROW_BY_ROW_COST_FACTOR
+
+    def _is_vectorized(self, column_coords_dict, decompression_type):
+        return not decompression_type and self._get_passes_values_function(column_coords_dict[self.column_name]) is not None
+
+    def _get_values_conversion_function(self):
+        return _strip_values
+
 #    def __str__(self):
 #        return f"{type(self).__name__}____{self.column_name.decode()}____{self.value}"
 
@@ -66,10 +176,32 @@ class __OperatorFilter(__SimpleBaseFilter):
 
         self.oper = oper
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
+    def _get_index_file_paths(self, data_file_path):
+        # Hash indexes can only be used to find values that are equal.
+        index_file_paths = super()._get_index_file_paths(data_file_path)
+
+        if self.oper == operator.eq:
+            index_file_paths.append(f4py.IndexBuilder._get_hash_index_file_path(data_file_path, self.column_name.decode()))
+
+        return index_file_paths
+
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        if self._excluded_by_bloom_filters(data_file_path):
+            return f4py.RowSet()
+
+        if self.oper == operator.eq:
+            hash_index_file_path = f4py.IndexBuilder._get_hash_index_file_path(data_file_path, self.column_name.decode())
+
+            if f4py.file_exists(hash_index_file_path):
+                return f4py.IndexSearcher._filter_using_hash(hash_index_file_path, [self.value], max_num_rows)
+
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
         index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode())
 
-        return f4py.IndexSearcher._filter_using_operator(index_file_path, self, end_index, num_processes)
+        return f4py.IndexSearcher._filter_using_operator(index_file_path, self, max_num_rows)
 
     def _check_column_types(self, column_index_dict, column_type_dict, expected_column_type, expected_column_type_description):
         if column_type_dict[column_index_dict[self.column_name]] != expected_column_type:
@@ -78,6 +210,44 @@ class __OperatorFilter(__SimpleBaseFilter):
     def passes(self, value):
         return self.oper(self._get_conversion_function()(value), self.value)
 
+    def _excluded_by_stats(self, column_stats_dict):
+        column_stats = column_stats_dict.get(self.column_name)
+
+        if not column_stats or column_stats["min"] is None:
+            return False
+
+        if self.oper == operator.eq:
+            # Zone maps also store the distinct values when there are only a few of them.
+            if column_stats.get("values") is not None and self.value not in column_stats["values"]:
+                return True
+
+            return self.value < column_stats["min"] or self.value > column_stats["max"]
+        elif self.oper == operator.gt:
+            return column_stats["max"] <= self.value
+        elif self.oper == operator.ge:
+            return column_stats["max"] < self.value
+        elif self.oper == operator.lt:
+            return column_stats["min"] >= self.value
+        elif self.oper == operator.le:
+            return column_stats["min"] > self.value
+
+        return False
+
+    def _get_bloom_filter_value(self):
+        return self.value if self.oper == operator.eq else None
+
+    def _get_index_search_filters(self):
+        return [] if self.oper == operator.ne else [self]
+
+    def _get_passes_values_function(self, column_coords):
+        return self._passes_values
+
+    def _passes_values(self, values):
+        return self._passes_converted_values(self._get_values_conversion_function()(values))
+
+    def _passes_converted_values(self, values):
+        return self.oper(values, self.value)
+
 class StringFilter(__OperatorFilter):
     def __init__(self, column_name, oper, value):
         self.check_argument(value, "value", str)
@@ -99,6 +269,13 @@ class FloatFilter(__OperatorFilter):
     def _get_conversion_function(self):
         return fastnumbers.fast_float
 
+    def _get_values_conversion_function(self):
+        return _convert_values_to_float
+
+    def _get_bloom_filter_value(self):
+        # Bloom filters are not built for float columns.
+        return None
+
 class IntFilter(__OperatorFilter):
     def __init__(self, column_name, oper, value):
         self.check_argument(value, "value", int)
@@ -111,40 +288,187 @@ class IntFilter(__OperatorFilter):
     def _get_conversion_function(self):
         return fastnumbers.fast_int
 
+    def _get_values_conversion_function(self):
+        return _convert_values_to_int
+
+class InFilter(__SimpleBaseFilter):
+    """
+    This class is used to find rows where a column equals any of the specified values. Each value is
+    handled like an equality filter, so Bloom filters, hash indexes and indexes are used when they exist.
+
+    Args:
+        column_name (str): The name of the column.
+        values (list): The values to look for. These must all be strings, all be integers, or all be floats.
+    """
+    def __init__(self, column_name, values):
+        self.check_argument(values, "values", list)
+
+        if len(values) == 0:
+            raise Exception("At least one value must be specified for an InFilter.")
+
+        filter_classes = {str: StringFilter, int: IntFilter, float: FloatFilter}
+        if type(values[0]) not in filter_classes or any(type(value) != type(values[0]) for value in values):
+            raise Exception("The values for an InFilter must all be strings, all be integers, or all be floats.")
+
+        self.equality_filters = [filter_classes[type(value)](column_name, operator.eq, value) for value in values]
+        super().__init__(column_name, [fltr.value for fltr in self.equality_filters])
+
+        self.value_set = set(self.value)
+
+    def _check_types(self, column_type_dict):
+        self.equality_filters[0]._check_types(column_type_dict)
+
+    def passes(self, value):
+        return self._get_conversion_function()(value) in self.value_set
+
+    def _get_conversion_function(self):
+        return self.equality_filters[0]._get_conversion_function()
+
+    def _get_values_conversion_function(self):
+        return self.equality_filters[0]._get_values_conversion_function()
+
+    def _get_passes_values_function(self, column_coords):
+        return self._passes_values
+
+    def _passes_values(self, values):
+        return self._passes_converted_values(self._get_values_conversion_function()(values))
+
+    def _passes_converted_values(self, values):
+        return np.isin(values, self.value)
+
+    def _excluded_by_stats(self, column_stats_dict):
+        return all(fltr._excluded_by_stats(column_stats_dict) for fltr in self.equality_filters)
+
+    def _check_bloom_filter(self, data_file_path):
+        # Returns whether each block of rows may contain each value, or None if there is no Bloom filter to check.
+        bloom_filter_file_path = f4py.IndexBuilder._get_bloom_filter_file_path(data_file_path, self.column_name.decode())
+
+        if self.equality_filters[0]._get_bloom_filter_value() is None or not f4py.file_exists(bloom_filter_file_path):
+            return None
+
+        return f4py.IndexSearcher._check_bloom_filter(bloom_filter_file_path, self.value)
+
+    def _find_bloom_filter_blocks(self, data_file_path):
+        bloom_filter_check = self._check_bloom_filter(data_file_path)
+
+        if bloom_filter_check is None:
+            return None
+
+        may_contain, num_rows_per_block = bloom_filter_check
+
+        return np.flatnonzero(may_contain.any(axis=0)), num_rows_per_block
+
+    def _get_index_file_paths(self, data_file_path):
+        return super()._get_index_file_paths(data_file_path) + [f4py.IndexBuilder._get_hash_index_file_path(data_file_path, self.column_name.decode())]
+
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        # Values that the Bloom filter shows are not present do not need to be looked up.
+        values = self.value
+        bloom_filter_check = self._check_bloom_filter(data_file_path)
+
+        if bloom_filter_check is not None:
+            values = [value for value, may_contain in zip(values, bloom_filter_check[0].any(axis=1)) if may_contain]
+
+        if len(values) == 0:
+            return f4py.RowSet()
+
+        hash_index_file_path = f4py.IndexBuilder._get_hash_index_file_path(data_file_path, self.column_name.decode())
+
+        if f4py.file_exists(hash_index_file_path):
+            return f4py.IndexSearcher._filter_using_hash(hash_index_file_path, values)
+
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
+        index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode())
+
+        return f4py.IndexSearcher._filter_using_values(index_file_path, values)
+
 class StartsWithFilter(__SimpleBaseFilter):
     def __init__(self, column_name, value):
         self.check_argument(value, "value", str)
         super().__init__(column_name, value.encode())
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
+    def _can_use_index_keys(self, column_type_dict):
+        # The text of numeric values (such as 1.10) is not stored in indexes, so these columns are scanned.
+        return column_type_dict[self.column_name] == "s"
+
+    def _get_index_file_paths(self, data_file_path):
+        return super()._get_index_file_paths(data_file_path) + [f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, self.column_name.decode())]
+
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
         index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode())
 
-        return f4py.IndexSearcher._get_passing_row_indices_with_filter(index_file_path, self, end_index, num_processes)
+        if f4py.file_exists(index_file_path):
+            return f4py.IndexSearcher._filter_using_prefix(index_file_path, self.value)
+        else:
+            # Values that start with the prefix contain it, so only values with its trigrams are checked.
+            trigram_index_file_path = f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, self.column_name.decode())
+
+            return f4py.IndexSearcher._filter_using_trigrams(trigram_index_file_path, [self.value], self.passes)
 
     def passes(self, value):
         return value.startswith(self.value)
 
+    def _get_passes_values_function(self, column_coords):
+        # Binary-encoded values must be formatted as text, one at a time.
+        if len(column_coords) > 2:
+            return None
+
+        return self._passes_values
+
+    def _passes_values(self, values):
+        return np.char.startswith(_strip_values(values), self.value)
+
 class EndsWithFilter(StartsWithFilter):
     def passes(self, value):
         return value.endswith(self.value)
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
+    def _passes_values(self, values):
+        return np.char.endswith(_strip_values(values), self.value)
+
+    def _get_index_file_paths(self, data_file_path):
+        return _get_substring_index_file_paths(data_file_path, self.column_name.decode()) + [f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode(), f4py.reverse_string)]
+
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
         custom_index_function = f4py.reverse_string
         custom_index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode(), custom_index_function)
 
-        if os.path.exists(custom_index_file_path):
-            custom_fltr = f4py.StartsWithFilter(self.column_name.decode(), custom_index_function(self.value).decode())
+        trigram_index_file_path = f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, self.column_name.decode())
 
-            return f4py.IndexSearcher._get_passing_row_indices_with_filter(custom_index_file_path, custom_fltr, end_index, num_processes)
-        else:
-            index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode())
+        if f4py.file_exists(custom_index_file_path):
+            # The values in this index are reversed, so we look for the reversed suffix at the start.
+            return f4py.IndexSearcher._filter_using_prefix(custom_index_file_path, custom_index_function(self.value))
+
+        return f4py.IndexSearcher._filter_using_trigrams(trigram_index_file_path, [self.value], self.passes)
+
+class ContainsFilter(StartsWithFilter):
+    def passes(self, value):
+        return self.value in value
+
+    def _passes_values(self, values):
+        return np.char.find(_strip_values(values), self.value) >= 0
 
-            with f4py.IndexSearcher._get_index_parser(index_file_path) as index_parser:
-                line_length = index_parser._get_stat(".ll")
-                coords = index_parser._parse_data_coords([0, 1])
-                file_handle = index_parser._get_file_handle("")
+    def _get_index_file_paths(self, data_file_path):
+        return _get_substring_index_file_paths(data_file_path, self.column_name.decode())
 
-                return f4py.IndexSearcher._get_passing_row_indices(self, index_parser, line_length, coords[0], coords[1], file_handle, 0, end_index)
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
+        trigram_index_file_path = f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, self.column_name.decode())
+
+        return f4py.IndexSearcher._filter_using_trigrams(trigram_index_file_path, [self.value], self.passes)
 
 class LikeFilter(__SimpleBaseFilter):
     def __init__(self, column_name, regular_expression):
@@ -153,22 +477,39 @@ class LikeFilter(__SimpleBaseFilter):
         self.check_argument(regular_expression, "regular_expression", str)
         self.value = re.compile(self.value)
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.column_name.decode())
+    def _can_use_index_keys(self, column_type_dict):
+        # Like StartsWithFilter, this compares text, so only indexes of string columns can be used.
+        return column_type_dict[self.column_name] == "s"
+
+    def _get_index_file_paths(self, data_file_path):
+        return _get_substring_index_file_paths(data_file_path, self.column_name.decode())
 
-        with f4py.IndexSearcher._get_index_parser(index_file_path) as index_parser:
-            line_length = index_parser._get_stat(".ll")
-            coords = index_parser._parse_data_coords([0, 1])
-            file_handle = index_parser._get_file_handle("")
+    def _filter_using_index(self, data_file_path, end_index, column_type_dict, max_num_rows=None):
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
 
-            return f4py.IndexSearcher._get_passing_row_indices(self, index_parser, line_length, coords[0], coords[1], file_handle, 0, end_index)
+        return self._filter_using_trigram_index(data_file_path, end_index)
+
+    def _filter_using_trigram_index(self, data_file_path, end_index):
+        trigram_index_file_path = f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, self.column_name.decode())
+        literals = [literal.encode() for literal in _get_required_literals(self.value)]
+
+        return f4py.IndexSearcher._filter_using_trigrams(trigram_index_file_path, literals, self._matches)
 
     def passes(self, value):
-        return self.value.search(value.decode())
+        return self._matches(value)
+
+    def _matches(self, value):
+        return self.value.search(value.decode()) is not None
 
 class NotLikeFilter(LikeFilter):
     def passes(self, value):
-        return not self.value.search(value.decode())
+        return not self._matches(value)
+
+    def _filter_using_trigram_index(self, data_file_path, end_index):
+        # The trigram index finds the rows that match, and the other rows pass this filter.
+        return f4py.RowSet(start=0, end=end_index) - super()._filter_using_trigram_index(data_file_path, end_index)
 
 class HeadFilter(NoFilter):
     def __init__(self, n, select_columns):
@@ -184,19 +525,19 @@ class HeadFilter(NoFilter):
             return parser.get_num_rows()
 
     def _filter_column_values(self, data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
-        return set(range(min(self._get_num_rows(data_file_path), self.n))) & row_indices
+        return f4py.RowSet(start=0, end=min(self._get_num_rows(data_file_path), self.n)) & row_indices
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        return set(range(min(self._get_num_rows(data_file_path), self.n)))
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        return f4py.RowSet(start=0, end=min(self._get_num_rows(data_file_path), self.n))
 
 class TailFilter(HeadFilter):
     def _filter_column_values(self, data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
         num_rows = self._get_num_rows(data_file_path)
-        return set(range(num_rows - self.n, num_rows)) & row_indices
+        return f4py.RowSet(start=max(0, num_rows - self.n), end=num_rows) & row_indices
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
         num_rows = self._get_num_rows(data_file_path)
-        return set(range(num_rows - self.n, num_rows))
+        return f4py.RowSet(start=max(0, num_rows - self.n), end=num_rows)
 
 class __CompositeFilter(NoFilter):
     def __init__(self, filter1, filter2):
@@ -210,6 +551,12 @@ class __CompositeFilter(NoFilter):
     def _get_column_name_set(self):
         return self.filter1._get_column_name_set() | self.filter2._get_column_name_set()
 
+    def _get_scan_cost(self, column_coords_dict, decompression_type):
+        return self.filter1._get_scan_cost(column_coords_dict, decompression_type) + self.filter2._get_scan_cost(column_coords_dict, decompression_type)
+
+    def _is_vectorized(self, column_coords_dict, decompression_type):
+        return self.filter1._is_vectorized(column_coords_dict, decompression_type) and self.filter2._is_vectorized(column_coords_dict, decompression_type)
+
 #    def get_sub_filters(self):
 #        return self.filter1.get_sub_filters() + self.filter2.get_sub_filters()
 
@@ -243,30 +590,57 @@ class AndFilter(__CompositeFilter):
         row_indices_1 = self.filter1._filter_column_values(data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
         return self.filter2._filter_column_values(data_file_path, row_indices_1, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        # Currently, this combination of two-column filters is supported. Add more later.
-        if isinstance(self.filter1, StringFilter) and self.filter1.oper == operator.eq:
-            if isinstance(self.filter2, IntRangeFilter):
-                two_column_index_name = f4py.IndexSearcher._get_two_column_index_name(self.filter1, self.filter2.filter1)
-                two_column_index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, two_column_index_name)
+    def _excluded_by_stats(self, column_stats_dict):
+        return self.filter1._excluded_by_stats(column_stats_dict) or self.filter2._excluded_by_stats(column_stats_dict)
+
+    def _excluded_by_bloom_filters(self, data_file_path):
+        return self.filter1._excluded_by_bloom_filters(data_file_path) or self.filter2._excluded_by_bloom_filters(data_file_path)
+
+    def _get_bitmap(self, data_file_path, column_type_dict):
+        bitmap_1 = self.filter1._get_bitmap(data_file_path, column_type_dict)
+
+        if bitmap_1 is None:
+            return None
 
-                if os.path.exists(two_column_index_file_path):
-                    with f4py.IndexSearcher._get_index_parser(two_column_index_file_path) as index_parser:
-                        coords = index_parser._parse_data_coords([0, 1, 2])
+        bitmap_2 = self.filter2._get_bitmap(data_file_path, column_type_dict)
 
-                        # Find range for string column
-                        lower_position, upper_position = f4py.IndexSearcher._find_bounds_for_range(index_parser, coords[0], self.filter1, self.filter1, end_index, num_processes)
+        return None if bitmap_2 is None else bitmap_1 & bitmap_2
 
-                        # Find range for int column
-                        lower_position, upper_position = f4py.IndexSearcher._find_bounds_for_range(index_parser, coords[1], self.filter2.filter1, self.filter2.filter2, upper_position, num_processes, lower_position)
+    def _has_index(self, data_file_path, column_type_dict):
+        return self.filter1._has_index(data_file_path, column_type_dict) or self.filter2._has_index(data_file_path, column_type_dict) or _plan_composite_index_search(data_file_path, _get_conjuncts(self)) is not None
 
-                        # Get row indices for the overlapping range
-                        return f4py.IndexSearcher._retrieve_matching_row_indices(index_parser, coords[2], (lower_position, upper_position), num_processes)
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
 
-        row_indices_1 = self.filter1._filter_indexed_column_values(data_file_path, end_index, num_processes)
-        row_indices_2 = self.filter2._filter_indexed_column_values(data_file_path, end_index, num_processes)
+        # A composite index may be able to find the rows that pass several of the filters at once.
+        plan = _plan_composite_index_search(data_file_path, _get_conjuncts(self))
 
-        return row_indices_1 & row_indices_2
+        if plan:
+            index_file_path, search_filters, mask_filters, other_filters = plan
+            row_indices = f4py.IndexSearcher._filter_using_composite(index_file_path, search_filters, mask_filters)
+        else:
+            row_indices = f4py.RowSet(start=0, end=end_index)
+            other_filters = [self.filter1, self.filter2]
+
+        # Filters that can use an index are applied first. The remaining filters are evaluated by
+        # scanning the data file, but only for the rows that passed the other filters.
+        indexed_filters = []
+        scanned_filters = []
+        for fltr in other_filters:
+            (indexed_filters if fltr._has_index(data_file_path, column_type_dict) else scanned_filters).append(fltr)
+
+        for fltr in indexed_filters:
+            if len(row_indices) == 0:
+                return row_indices
+
+            row_indices = row_indices & fltr._filter_indexed_column_values(data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        for fltr in scanned_filters:
+            row_indices = fltr._filter_column_values(data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        return row_indices
 
 #    def filter_indexed_column_values_parallel(self, fltr_results_dict):
 #        row_indices_1, row_indices_2 = self.get_sub_filter_row_indices(fltr_results_dict)
@@ -290,9 +664,37 @@ class OrFilter(__CompositeFilter):
 
         return row_indices_1 | row_indices_2
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        row_indices_1 = self.filter1._filter_indexed_column_values(data_file_path, end_index, num_processes)
-        row_indices_2 = self.filter2._filter_indexed_column_values(data_file_path, end_index, num_processes)
+    def _excluded_by_stats(self, column_stats_dict):
+        return self.filter1._excluded_by_stats(column_stats_dict) and self.filter2._excluded_by_stats(column_stats_dict)
+
+    def _excluded_by_bloom_filters(self, data_file_path):
+        return self.filter1._excluded_by_bloom_filters(data_file_path) and self.filter2._excluded_by_bloom_filters(data_file_path)
+
+    def _get_bitmap(self, data_file_path, column_type_dict):
+        bitmap_1 = self.filter1._get_bitmap(data_file_path, column_type_dict)
+
+        if bitmap_1 is None:
+            return None
+
+        bitmap_2 = self.filter2._get_bitmap(data_file_path, column_type_dict)
+
+        return None if bitmap_2 is None else bitmap_1 | bitmap_2
+
+    def _has_index(self, data_file_path, column_type_dict):
+        # Otherwise, every row must be scanned for at least one of the filters.
+        return self.filter1._has_index(data_file_path, column_type_dict) and self.filter2._has_index(data_file_path, column_type_dict)
+
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        if not self._has_index(data_file_path, column_type_dict):
+            return self._filter_column_values(data_file_path, f4py.RowSet(start=0, end=end_index), column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
+        # The first rows of the union must be among the first rows that pass each filter.
+        row_indices_1 = self.filter1._filter_indexed_column_values(data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows)
+        row_indices_2 = self.filter2._filter_indexed_column_values(data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows)
 
         return row_indices_1 | row_indices_2
 
@@ -308,15 +710,58 @@ class __RangeFilter(__CompositeFilter):
             raise Exception("The lower_bound_value must be less than or equal to the upper_bound_value.")
 
     def _filter_column_values(self, data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
+        row_indices = _select_zone_rows(data_file_path, row_indices, self, self.filter1.column_name)
+
+        # Evaluate both bounds in a single pass over the column when the data are not compressed.
+        if not decompression_type:
+            try:
+                return _filter_column_values_vectorized(data_file_path, row_indices, column_coords_dict[self.filter1.column_name], self._passes_values)
+            except OverflowError:
+                pass
+
         return AndFilter(self.filter1, self.filter2)._filter_column_values(data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
 
-    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes):
-        index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.filter1.column_name.decode())
+    def _get_scan_cost(self, column_coords_dict, decompression_type):
+        # Both bounds are evaluated in one pass over the column.
+        return self.filter1._get_scan_cost(column_coords_dict, decompression_type)
+
+    def _is_vectorized(self, column_coords_dict, decompression_type):
+        return not decompression_type
+
+    def _excluded_by_stats(self, column_stats_dict):
+        # No value can be at least the lower bound and at most the upper bound.
+        return self.filter1._excluded_by_stats(column_stats_dict) or self.filter2._excluded_by_stats(column_stats_dict)
+
+    def _get_index_search_filters(self):
+        return [self.filter1, self.filter2]
+
+    def _passes_values(self, values):
+        values = self.filter1._get_values_conversion_function()(values)
+
+        return self.filter1._passes_converted_values(values) & self.filter2._passes_converted_values(values)
+
+    def _get_bitmap(self, data_file_path, column_type_dict):
+        bitmap_index_file_path = f4py.IndexBuilder._get_bitmap_index_file_path(data_file_path, self.filter1.column_name.decode())
+
+        if not f4py.file_exists(bitmap_index_file_path):
+            return None
 
-        with f4py.IndexSearcher._get_index_parser(index_file_path) as index_parser:
-            coords = index_parser._parse_data_coords([0, 1])
+        return f4py.IndexSearcher._filter_using_bitmap(bitmap_index_file_path, lambda value: self.filter1.passes(value) and self.filter2.passes(value))
 
-            return f4py.IndexSearcher._find_row_indices_for_range(index_parser, coords[0], coords[1], self.filter1, self.filter2, end_index, num_processes)
+    def _has_index(self, data_file_path, column_type_dict):
+        return self.filter1._has_index(data_file_path, column_type_dict)
+
+    def _filter_indexed_column_values(self, data_file_path, end_index, num_processes, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows=None):
+        if not self._has_index(data_file_path, column_type_dict):
+            return self._filter_column_values(data_file_path, f4py.RowSet(start=0, end=end_index), column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        bitmap = self._get_bitmap(data_file_path, column_type_dict)
+        if bitmap is not None:
+            return f4py.RowSet.from_bitmap(bitmap, end_index)
+
+        index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, self.filter1.column_name.decode())
+
+        return f4py.IndexSearcher._filter_using_range(index_file_path, self.filter1, self.filter2)
 
     def _get_conversion_function(self):
         return f4py.do_nothing
@@ -346,4 +791,177 @@ class StringRangeFilter(__RangeFilter):
         filter1 = StringFilter(column_name, operator.ge, lower_bound_value)
         filter2 = StringFilter(column_name, operator.le, upper_bound_value)
 
-        super().__init__(filter1, filter2)
\ No newline at end of file
+        super().__init__(filter1, filter2)
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# The number of rows that are evaluated at once, which limits memory use.
+_VECTORIZED_BLOCK_SIZE = 1000000
+
+# Evaluating values one row at a time (in Python) is roughly this many times slower than evaluating them in bulk.
+_ROW_BY_ROW_COST_FACTOR = 100
+
+def _get_substring_index_file_paths(data_file_path, column_name):
+    # A sorted index does not help to find substrings (every key would need to be checked), so scanning is used instead.
+    return [f4py.IndexBuilder._get_bitmap_index_file_path(data_file_path, column_name), f4py.IndexBuilder._get_trigram_index_file_path(data_file_path, column_name)]
+
+def _select_zone_rows(data_file_path, row_indices, fltr, column_name):
+    # If the column has a zone map, skip blocks of rows that cannot contain values that pass the filter.
+    zone_map_file_path = f4py.IndexBuilder._get_zone_map_file_path(data_file_path, column_name.decode())
+
+    if len(row_indices) == 0 or not f4py.file_exists(zone_map_file_path):
+        return row_indices
+
+    zone_map = f4py.read_cached_object_from_file(zone_map_file_path)
+    num_rows_per_zone = zone_map["num_rows_per_zone"]
+
+    keep_zone_indices = [zone_index for zone_index, zone in enumerate(zone_map["zones"]) if not fltr._excluded_by_stats({column_name: zone})]
+
+    if len(keep_zone_indices) == len(zone_map["zones"]):
+        return row_indices
+
+    return _select_block_rows(row_indices, keep_zone_indices, num_rows_per_zone)
+
+def _select_bloom_filter_rows(data_file_path, row_indices, fltr):
+    # If the column has a Bloom filter for each block of rows, skip blocks that cannot contain the value.
+    if len(row_indices) == 0:
+        return row_indices
+
+    bloom_filter_blocks = fltr._find_bloom_filter_blocks(data_file_path)
+
+    if bloom_filter_blocks is None:
+        return row_indices
+
+    keep_block_indices, num_rows_per_block = bloom_filter_blocks
+
+    return _select_block_rows(row_indices, keep_block_indices, num_rows_per_block)
+
+def _select_block_rows(row_indices, block_indices, num_rows_per_block):
+    # Adjacent blocks are combined so that the remaining rows are stored as few ranges as possible.
+    ranges = []
+    for block_index in block_indices:
+        if ranges and ranges[-1][1] == block_index * num_rows_per_block:
+            ranges[-1][1] += num_rows_per_block
+        else:
+            ranges.append([block_index * num_rows_per_block, (block_index + 1) * num_rows_per_block])
+
+    return f4py.RowSet.union_all([row_indices & f4py.RowSet(start=start, end=end) for start, end in ranges])
+
+def _get_conjuncts(fltr):
+    # Returns the filters that must all pass, looking within nested AndFilters.
+    if isinstance(fltr, AndFilter):
+        return _get_conjuncts(fltr.filter1) + _get_conjuncts(fltr.filter2)
+
+    return [fltr]
+
+def _plan_composite_index_search(data_file_path, conjuncts):
+    # Equality filters on the first columns of a composite index, plus any filters on the next column,
+    # narrow the range of keys that must be considered. Filters on the remaining columns of the index
+    # are evaluated using the keys in this range. We choose the index that narrows the range using the
+    # most columns (and then covers the most filters). Returns None unless at least two filters are covered.
+    best_plan = None
+    best_score = None
+
+    for index_columns in f4py.IndexSearcher._find_composite_indexes(data_file_path):
+        column_positions = {column_name.encode(): i for i, column_name in enumerate(index_columns)}
+        covered_filters = []
+        other_filters = []
+
+        for fltr in conjuncts:
+            search_filters = fltr._get_index_search_filters()
+
+            if len(search_filters) > 0 and search_filters[0].column_name in column_positions:
+                covered_filters.extend([(column_positions[search_filter.column_name], search_filter) for search_filter in search_filters])
+            else:
+                other_filters.append(fltr)
+
+        num_prefix_columns = 0
+        while num_prefix_columns in [i for i, fltr in covered_filters if fltr.oper == operator.eq]:
+            num_prefix_columns += 1
+
+        search_filters = sorted([(i, fltr) for i, fltr in covered_filters if i <= num_prefix_columns], key=lambda x: x[0])
+        mask_filters = [(i, fltr) for i, fltr in covered_filters if i > num_prefix_columns]
+
+        score = (len(set([i for i, fltr in search_filters])), len(conjuncts) - len(other_filters))
+
+        if score[0] > 0 and score[1] >= 2 and (best_score is None or score > best_score):
+            index_file_path = f4py.IndexBuilder._get_index_file_path(data_file_path, f4py.IndexSearcher._get_composite_index_name(index_columns))
+            best_plan = (index_file_path, search_filters, mask_filters, other_filters)
+            best_score = score
+
+    return best_plan
+
+def _filter_column_values_vectorized(data_file_path, row_indices, column_coords, passes_values_function):
+    if len(row_indices) == 0:
+        return row_indices
+
+    # When the rows are contiguous, we can slice the column rather than gathering values.
+    is_contiguous = row_indices.is_range()
+    row_indices = row_indices.to_array()
+
+    with f4py.Parser(data_file_path, fixed_file_extensions=[""], stats_file_extensions=[".ll"]) as parser:
+        passing_mask = _get_passing_mask(parser, column_coords, row_indices, is_contiguous, passes_values_function)
+
+    return f4py.RowSet(row_indices[passing_mask], is_sorted=True)
+
+def _get_passing_mask(parser, column_coords, row_indices, is_contiguous, passes_values_function):
+    # The column view refers to the memory map, so it must go out of scope before the file is closed.
+    column_view = parser._get_column_view(column_coords)
+    passing_mask = np.empty(len(row_indices), dtype=bool)
+
+    for block_start in range(0, len(row_indices), _VECTORIZED_BLOCK_SIZE):
+        block_end = min(block_start + _VECTORIZED_BLOCK_SIZE, len(row_indices))
+
+        if is_contiguous:
+            values = column_view[row_indices[block_start]:(row_indices[block_end - 1] + 1)]
+        else:
+            values = column_view[row_indices[block_start:block_end]]
+
+        passing_mask[block_start:block_end] = passes_values_function(values)
+
+    return passing_mask
+
+def _get_required_literals(regular_expression):
+    # Returns strings that any text matching the (compiled) regular expression must contain. These are runs of
+    # literal characters that are not optional. Anything else (such as a character class or an alternation) ends
+    # a run and is skipped. Nothing is returned for case-insensitive expressions.
+    if regular_expression.flags & re.IGNORECASE:
+        return []
+
+    literals = []
+    _add_required_literals(_regex_parser.parse(regular_expression.pattern, regular_expression.flags), literals)
+
+    return [literal for literal in literals if len(literal) > 0]
+
+def _add_required_literals(parsed_pattern, literals):
+    literal = ""
+
+    for op, argument in parsed_pattern:
+        if op == _regex_parser.LITERAL:
+            literal += chr(argument)
+            continue
+
+        literals.append(literal)
+        literal = ""
+
+        if op == _regex_parser.SUBPATTERN:
+            group, add_flags, del_flags, group_pattern = argument
+
+            if not add_flags & re.IGNORECASE:
+                _add_required_literals(group_pattern, literals)
+        elif op in (_regex_parser.MAX_REPEAT, _regex_parser.MIN_REPEAT) and argument[0] > 0:
+            # The repeated pattern must occur at least once.
+            _add_required_literals(argument[2], literals)
+
+    literals.append(literal)
+
+def _strip_values(values):
+    return np.char.rstrip(values, b" ")
+
+def _convert_values_to_float(values):
+    return values.astype(np.float64)
+
+def _convert_values_to_int(values):
+    return values.astype(np.int64)
@@ -1,120 +1,354 @@
 import f4py
+import hashlib
+from joblib import Parallel, delayed
+import math
+import numpy as np
+import os
+import tempfile
 
 class IndexBuilder:
     #####################################################
     # Class (static) functions
     #####################################################
-    # index_columns should be a list. Elements within it can be two-element lists.
-    def build_indexes(f4_file_path, index_columns, verbose=False):
-        if isinstance(index_columns, str):
-            IndexBuilder._build_one_column_index(f4_file_path, index_columns, verbose)
-        elif isinstance(index_columns, list):
-            for index_column in index_columns:
-                if isinstance(index_column, list):
-                    if len(index_column) != 2:
-                        raise Exception("If you pass a list as an index_column, it must have exactly two elements.")
-
-                    IndexBuilder._build_two_column_index(f4_file_path, index_column[0], index_column[1], verbose)
-                else:
-                    if not isinstance(index_column, str):
-                        raise Exception("When specifying an index column name, it must be a string.")
-
-                    IndexBuilder._build_one_column_index(f4_file_path, index_column, verbose, f4py.do_nothing)
-        else:
-            raise Exception("When specifying index_columns, it must either be a string or a list.")
+    # index_columns should be a list. Elements within it can be lists of column names, which are used
+    # to build composite indexes (sorted by the first column, then the second, etc.).
+    # The values for all of the indexes are read in a single pass. Each index is built by sorting
+    # runs of num_rows_per_run rows (num_processes at a time) and then merging them, so memory use
+    # depends on num_rows_per_run rather than the number of rows.
+    # Runs are saved in a temporary directory within tmp_dir_path (or the system default).
+    def build_indexes(f4_file_path, index_columns, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None):
+        index_specs = IndexBuilder._get_index_specs(f4_file_path, index_columns)
+        IndexBuilder._build_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path)
+        IndexBuilder._add_to_single_file(f4_file_path)
 
     # This function is specifically for the EndsWithFilter.
-    def build_endswith_index(f4_file_path, index_column, verbose=False):
-        IndexBuilder._build_one_column_index(f4_file_path, index_column, verbose, f4py.reverse_string)
+    def build_endswith_index(f4_file_path, index_column, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None):
+        index_specs = [IndexBuilder._get_one_column_index_spec(f4_file_path, index_column, f4py.reverse_string)]
+        IndexBuilder._build_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path)
+        IndexBuilder._add_to_single_file(f4_file_path)
+
+    def build_zone_maps(f4_file_path, zone_map_columns, num_rows_per_zone=10000, verbose=False):
+        """
+        Build a zone map for each of the specified columns. A zone map stores the minimum and
+        maximum values (and, when there are only a few, the distinct values) within each block
+        of rows. When a column has no index, blocks that cannot match a filter are skipped.
+        This is most effective when the values are sorted or clustered.
+
+        Args:
+            f4_file_path (str): The path to an existing F4 file.
+            zone_map_columns (list): The names of the columns (or a single column name).
+            num_rows_per_zone (int): The number of rows in each block.
+            verbose (bool): Whether to print progress messages.
+        """
+        IndexBuilder._build_zone_maps(f4_file_path, zone_map_columns, num_rows_per_zone, verbose)
+
+    def build_bloom_filters(f4_file_path, bloom_filter_columns, num_rows_per_block=None, false_positive_rate=0.01, verbose=False):
+        """
+        Build a Bloom filter for each of the specified string or integer columns. When a filter checks
+        whether a column equals a value that is not present, the Bloom filter usually shows this
+        without reading the data file or an index. When num_rows_per_block is specified, a separate
+        Bloom filter is stored for each block of rows, so blocks that cannot contain the value are also
+        skipped when the column must be scanned.
+
+        Args:
+            f4_file_path (str): The path to an existing F4 file.
+            bloom_filter_columns (list): The names of the columns (or a single column name).
+            num_rows_per_block (int): The number of rows in each block. None means that all rows are in one block.
+            false_positive_rate (float): The approximate proportion of missing values that will not be detected.
+            verbose (bool): Whether to print progress messages.
+        """
+        IndexBuilder._build_bloom_filters(f4_file_path, bloom_filter_columns, num_rows_per_block, false_positive_rate, verbose)
+
+    def build_hash_indexes(f4_file_path, hash_index_columns, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None):
+        """
+        Build a hash index for each of the specified string or integer columns. A hash index finds the
+        rows where a column equals a value (for a StringFilter or IntFilter with operator.eq, or for an
+        InFilter) in constant time, regardless of the number of rows. It is used instead of a sorted
+        index for these filters, but it cannot be used for other operators.
+
+        Args:
+            f4_file_path (str): The path to an existing F4 file.
+            hash_index_columns (list): The names of the columns (or a single column name).
+            verbose (bool): Whether to print progress messages.
+            num_processes (int): The number of processes used to sort the values.
+            num_rows_per_run (int): The number of rows that are sorted at a time (see build_indexes).
+            tmp_dir_path (str): Where the sorted runs are saved (the system default when None).
+        """
+        IndexBuilder._build_hash_indexes(f4_file_path, hash_index_columns, verbose, num_processes, num_rows_per_run, tmp_dir_path)
+
+    def build_bitmap_indexes(f4_file_path, bitmap_index_columns, max_num_values=1000, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None):
+        """
+        Build a bitmap index for each of the specified string or integer columns, which should have few
+        distinct values (such as categorical columns). For each distinct value, the index stores which
+        rows have the value, as a bitmap or (when that is smaller) as a list of row indices. Filters on
+        these columns, and combinations of them with AndFilter and OrFilter, are then evaluated with
+        bitwise operations.
+
+        Args:
+            f4_file_path (str): The path to an existing F4 file.
+            bitmap_index_columns (list): The names of the columns (or a single column name).
+            max_num_values (int): The maximum number of distinct values that a column may have.
+            verbose (bool): Whether to print progress messages.
+            num_processes (int): The number of processes used to sort the values.
+            num_rows_per_run (int): The number of rows that are sorted at a time (see build_indexes).
+            tmp_dir_path (str): Where the sorted runs are saved (the system default when None).
+        """
+        IndexBuilder._build_bitmap_indexes(f4_file_path, bitmap_index_columns, max_num_values, verbose, num_processes, num_rows_per_run, tmp_dir_path)
+
+    def build_trigram_indexes(f4_file_path, trigram_index_columns, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None):
+        """
+        Build a trigram index for each of the specified string columns. For each sequence of three
+        bytes (trigram), the index lists the distinct values that contain it. A ContainsFilter,
+        LikeFilter or NotLikeFilter then only checks the values that contain every trigram of the
+        literal text that a match requires, and the data file is not read.
+
+        Args:
+            f4_file_path (str): The path to an existing F4 file.
+            trigram_index_columns (list): The names of the columns (or a single column name).
+            verbose (bool): Whether to print progress messages.
+            num_processes (int): The number of processes used to sort the values.
+            num_rows_per_run (int): The number of rows that are sorted at a time (see build_indexes).
+            tmp_dir_path (str): Where the sorted runs are saved (the system default when None).
+        """
+        IndexBuilder._build_trigram_indexes(f4_file_path, trigram_index_columns, verbose, num_processes, num_rows_per_run, tmp_dir_path)
+
+    #####################################################
+    # Non-public functions
+    #####################################################
+
+    # key_chunks can provide the (unconverted) values for some columns, as a list of arrays for
+    # consecutive chunks of rows, so that these values do not need to be read from the data file.
+    # Builder uses this to build indexes from values that it saved while converting a file.
+    def _build_zone_maps(f4_file_path, zone_map_columns, num_rows_per_zone=10000, verbose=False, key_chunks={}):
+        if isinstance(zone_map_columns, str):
+            zone_map_columns = [zone_map_columns]
+
+        if not isinstance(zone_map_columns, list) or len(zone_map_columns) == 0 or not all(isinstance(column, str) for column in zone_map_columns):
+            raise Exception("When specifying zone_map_columns, it must be a string or a list of strings.")
+
+        if not isinstance(num_rows_per_zone, int) or num_rows_per_zone < 1:
+            raise Exception("The num_rows_per_zone value must be a positive integer.")
+
+        with f4py.Parser(f4_file_path) as parser:
+            select_columns = parser._prepare_query(f4py.NoFilter(), zone_map_columns)[0]
+            zone_maps = [[] for column_name in select_columns]
+
+            f4py.print_message(f"Summarizing zones of {num_rows_per_zone} rows for {f4_file_path}.", verbose)
+            for start_index in range(0, parser.get_num_rows(), num_rows_per_zone):
+                column_keys = _get_column_keys(parser, zone_map_columns, key_chunks, start_index, min(parser.get_num_rows(), start_index + num_rows_per_zone))
+
+                for i, column_name in enumerate(select_columns):
+                    zone_maps[i].append(_summarize_zone(column_keys[column_name.decode()]))
+
+        for column_name, zones in zip(select_columns, zone_maps):
+            f4py.write_str_to_file(IndexBuilder._get_zone_map_file_path(f4_file_path, column_name.decode()), f4py.serialize({"num_rows_per_zone": num_rows_per_zone, "zones": zones}))
+
+        IndexBuilder._add_to_single_file(f4_file_path)
+        f4py.print_message(f"Done building zone maps for {f4_file_path}.", verbose)
+
+    def _build_bloom_filters(f4_file_path, bloom_filter_columns, num_rows_per_block=None, false_positive_rate=0.01, verbose=False, key_chunks={}):
+        if isinstance(bloom_filter_columns, str):
+            bloom_filter_columns = [bloom_filter_columns]
+
+        if not isinstance(bloom_filter_columns, list) or len(bloom_filter_columns) == 0 or not all(isinstance(column, str) for column in bloom_filter_columns):
+            raise Exception("When specifying bloom_filter_columns, it must be a string or a list of strings.")
+
+        if num_rows_per_block is not None and (not isinstance(num_rows_per_block, int) or num_rows_per_block < 1):
+            raise Exception("The num_rows_per_block value must be a positive integer or None.")
 
-    def _build_one_column_index(f4_file_path, index_column, verbose, custom_index_function):
-        # TODO: Add logic to verify that index_column is valid. But where?
-        f4py.print_message(f"Saving index for {f4_file_path} and {index_column}.", verbose)
-        index_column_encoded = index_column.encode()
+        if not isinstance(false_positive_rate, float) or not 0.0 < false_positive_rate < 1.0:
+            raise Exception("The false_positive_rate value must be a float between 0 and 1.")
 
         with f4py.Parser(f4_file_path) as parser:
-            f4py.print_message(f"Getting column meta information for {index_column} index for {f4_file_path}.", verbose)
-            select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = parser._get_column_meta(set([index_column_encoded]), [])
-
-            file_handle = parser._get_file_handle("")
-            line_length = parser._get_stat(".ll")
-            index_column_type = column_type_dict[index_column_encoded]
-            coords = column_coords_dict[index_column_encoded]
-            values_positions = []
-
-            decompressor = f4py.get_decompressor(decompression_type, decompressor)
-            parse_function = parser._get_parse_row_value_function(decompression_type)
-
-            f4py.print_message(f"Parsing values and positions for {index_column} index for {f4_file_path}.", verbose)
-            for row_index in range(parser.get_num_rows()):
-                value = parse_function(row_index, coords, line_length, file_handle, decompression_type, decompressor, bigram_size_dict, index_column_encoded)
-                values_positions.append([value, row_index])
-
-#            if len(column_decompression_dict) > 0:
-                # recompression_dict = {0: {}}
-
- #               for row_index in range(parser.get_num_rows()):
-#                    value = parser._parse_row_value(row_index, coords, line_length, file_handle, decompression_type, decompressor, bigram_size_dict, index_column_encoded)
-                    #decompressed_value = f4py.decompress(value, column_decompression_dict[index_column_encoded], bigram_size)
-                    # recompression_dict[0][decompressed_value] = value
-                    #values_positions.append([decompressed_value, row_index])
-#            else:
-#                 for row_index in range(parser.get_num_rows()):
-#                     value = parser._parse_row_value(row_index, coords, line_length, file_handle)
-#                     values_positions.append([value, row_index])
-
-            f4py.print_message(f"Building index file for {index_column} index for {f4_file_path}.", verbose)
-            IndexBuilder._customize_values_positions(values_positions, [index_column_type], f4py.sort_first_column, custom_index_function)
-
-            #if len(column_decompression_dict) > 0:
-                # IndexBuilder._recompress_values(values_positions, [0], recompression_dict)
-
-            index_file_path = IndexBuilder._get_index_file_path(parser.data_file_path, index_column, custom_index_function)
-            IndexBuilder._save_index(values_positions, index_file_path)
-
-        f4py.print_message(f"Done building index file for {index_column} index for {f4_file_path}.", verbose)
-
-    # TODO: Combine this function with the above one and make it generic enough to handle indexes with more columns.
-    def _build_two_column_index(f4_file_path, index_column_1, index_column_2, verbose):
-        if not isinstance(index_column_1, str) or not isinstance(index_column_2, str):
+            select_columns, column_type_dict = parser._prepare_query(f4py.NoFilter(), bloom_filter_columns)[:2]
+
+            for column_name in select_columns:
+                if column_type_dict[column_name] == "f":
+                    raise Exception(f"Bloom filters can only be built for string and integer columns, but {column_name.decode()} is a float column.")
+
+            num_rows = parser.get_num_rows()
+            if num_rows_per_block is None:
+                num_rows_per_block = max(1, num_rows)
+
+            # Each value is hashed num_hashes times, and each block has the same number of bits, so a
+            # value can be checked against every block at once. The number of bits is based on the
+            # number of distinct values, which we estimate from the column statistics when we can.
+            num_hashes = max(1, round(-math.log2(false_positive_rate)))
+            num_bits_list = []
+            for column_name in select_columns:
+                column_stats = parser._get_column_stats_dict().get(column_name)
+                num_values = min(num_rows_per_block, column_stats["num_distinct"]) if column_stats else num_rows_per_block
+                num_bits_list.append(8 * math.ceil(max(1, num_values) * num_hashes / math.log(2) / 8))
+
+            bits_list = [[] for column_name in select_columns]
+
+            f4py.print_message(f"Building Bloom filters for blocks of {num_rows_per_block} rows for {f4_file_path}.", verbose)
+            for start_index in range(0, num_rows, num_rows_per_block):
+                column_keys = _get_column_keys(parser, bloom_filter_columns, key_chunks, start_index, min(num_rows, start_index + num_rows_per_block))
+
+                for i, column_name in enumerate(select_columns):
+                    bits = np.zeros(num_bits_list[i], dtype=bool)
+                    bits[IndexBuilder._get_bloom_filter_positions(np.unique(column_keys[column_name.decode()]).tolist(), num_hashes, num_bits_list[i]).ravel()] = True
+                    bits_list[i].append(np.packbits(bits, bitorder="little").tobytes())
+
+        for column_name, num_bits, bits in zip(select_columns, num_bits_list, bits_list):
+            bloom_filter = {"num_rows_per_block": num_rows_per_block, "num_hashes": num_hashes, "num_bits": num_bits, "bits": b"".join(bits)}
+            f4py.write_str_to_file(IndexBuilder._get_bloom_filter_file_path(f4_file_path, column_name.decode()), f4py.serialize(bloom_filter))
+
+        IndexBuilder._add_to_single_file(f4_file_path)
+        f4py.print_message(f"Done building Bloom filters for {f4_file_path}.", verbose)
+
+    def _build_hash_indexes(f4_file_path, hash_index_columns, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None, key_chunks={}):
+        for column_name, positions, keys in IndexBuilder._sort_column_values(f4_file_path, hash_index_columns, "hash_index_columns", "Hash indexes", "si", IndexBuilder._get_hash_index_file_path, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+            IndexBuilder._save_hash_index(IndexBuilder._get_hash_index_file_path(f4_file_path, column_name), positions, keys)
+
+        IndexBuilder._add_to_single_file(f4_file_path)
+        f4py.print_message(f"Done building hash indexes for {f4_file_path}.", verbose)
+
+    def _build_bitmap_indexes(f4_file_path, bitmap_index_columns, max_num_values=1000, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None, key_chunks={}):
+        if not isinstance(max_num_values, int) or max_num_values < 1:
+            raise Exception("The max_num_values value must be a positive integer.")
+
+        for column_name, positions, keys in IndexBuilder._sort_column_values(f4_file_path, bitmap_index_columns, "bitmap_index_columns", "Bitmap indexes", "si", IndexBuilder._get_bitmap_index_file_path, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+            group_starts, group_keys = _get_key_groups(keys)
+
+            if len(group_keys) > max_num_values:
+                raise Exception(f"A bitmap index cannot be built for {column_name} because it has more than {max_num_values} distinct values.")
+
+            IndexBuilder._save_bitmap_index(IndexBuilder._get_bitmap_index_file_path(f4_file_path, column_name), positions, group_starts, group_keys)
+
+        IndexBuilder._add_to_single_file(f4_file_path)
+        f4py.print_message(f"Done building bitmap indexes for {f4_file_path}.", verbose)
+
+    def _build_trigram_indexes(f4_file_path, trigram_index_columns, verbose=False, num_processes=1, num_rows_per_run=10000000, tmp_dir_path=None, key_chunks={}):
+        for column_name, positions, keys in IndexBuilder._sort_column_values(f4_file_path, trigram_index_columns, "trigram_index_columns", "Trigram indexes", "s", IndexBuilder._get_trigram_index_file_path, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+            IndexBuilder._save_trigram_index(IndexBuilder._get_trigram_index_file_path(f4_file_path, column_name), positions, keys)
+
+        IndexBuilder._add_to_single_file(f4_file_path)
+        f4py.print_message(f"Done building trigram indexes for {f4_file_path}.", verbose)
+
+    def _sort_column_values(f4_file_path, column_names, argument_name, index_description, column_types, get_index_file_path, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+        # Generates the name, row positions and keys (sorted by key and then by position) for each
+        # column. Each column must have one of the specified types. The values are sorted in runs (like the
+        # values for other indexes), and the merged blocks are saved in memory-mapped arrays, so the
+        # values for a column are not all kept in memory. The arrays must be used before the next column is generated.
+        if isinstance(column_names, str):
+            column_names = [column_names]
+
+        if not isinstance(column_names, list) or len(column_names) == 0 or not all(isinstance(column, str) for column in column_names):
+            raise Exception(f"When specifying {argument_name}, it must be a string or a list of strings.")
+
+        with f4py.Parser(f4_file_path) as parser:
+            select_columns, column_type_dict = parser._prepare_query(f4py.NoFilter(), column_names)[:2]
+
+        for column_name in select_columns:
+            column_type = column_type_dict[column_name]
+
+            if column_type not in column_types:
+                type_names = " and ".join(_COLUMN_TYPE_NAMES[x] for x in column_types)
+                raise Exception(f"{index_description} can only be built for {type_names} columns, but {column_name.decode()} is a{'n' if column_type == 'i' else ''} {_COLUMN_TYPE_NAMES[column_type]} column.")
+
+        index_specs = [(get_index_file_path(f4_file_path, column_name.decode()), [column_name.decode()], f4py.do_nothing) for column_name in select_columns]
+
+        if tmp_dir_path:
+            os.makedirs(tmp_dir_path, exist_ok=True)
+
+        with tempfile.TemporaryDirectory(dir=tmp_dir_path) as array_dir_path:
+            for index_spec, num_rows, dtypes, blocks in IndexBuilder._sort_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+                position_dtype = np.uint32 if num_rows < 2 ** 32 else np.uint64
+                positions = _create_array_file(os.path.join(array_dir_path, "positions.npy"), position_dtype, num_rows)
+                keys = _create_array_file(os.path.join(array_dir_path, "keys.npy"), dtypes[1], num_rows)
+
+                start_index = 0
+                for block in blocks:
+                    positions[start_index:(start_index + len(block[0]))] = block[0]
+                    keys[start_index:(start_index + len(block[0]))] = block[1]
+                    start_index += len(block[0])
+
+                yield index_spec[1][0], positions, keys
+                del positions, keys
+
+    def _get_index_specs(f4_file_path, index_columns):
+        # Each index is described by the path of its file, the columns it contains and the function used to customize its values.
+        if isinstance(index_columns, str):
+            index_columns = [index_columns]
+
+        if not isinstance(index_columns, list):
+            raise Exception("When specifying index_columns, it must either be a string or a list.")
+
+        index_specs = []
+        for index_column in index_columns:
+            if isinstance(index_column, list):
+                index_specs.append(IndexBuilder._get_composite_index_spec(f4_file_path, index_column))
+            else:
+                index_specs.append(IndexBuilder._get_one_column_index_spec(f4_file_path, index_column, f4py.do_nothing))
+
+        return index_specs
+
+    def _get_one_column_index_spec(f4_file_path, index_column, custom_index_function):
+        if not isinstance(index_column, str):
             raise Exception("When specifying an index column name, it must be a string.")
 
-        f4py.print_message(f"Saving index for {index_column_1} and {index_column_2} for {f4_file_path}.", verbose)
+        return IndexBuilder._get_index_file_path(f4_file_path, index_column, custom_index_function), [index_column], custom_index_function
+
+    def _get_composite_index_spec(f4_file_path, index_columns):
+        if len(index_columns) < 2:
+            raise Exception("If you pass a list as an index_column, it must have at least two elements.")
+
+        for index_column in index_columns:
+            if not isinstance(index_column, str):
+                raise Exception("When specifying an index column name, it must be a string.")
+
+        index_name = f4py.IndexSearcher._get_composite_index_name(index_columns)
+
+        return IndexBuilder._get_index_file_path(f4_file_path, index_name), list(index_columns), f4py.do_nothing
 
-        index_name = "____".join([index_column_1, index_column_2])
-        index_column_1_encoded = index_column_1.encode()
-        index_column_2_encoded = index_column_2.encode()
+    def _build_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks={}):
+        for index_spec, num_rows, dtypes, blocks in IndexBuilder._sort_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+            IndexBuilder._write_binary_index(index_spec[0], num_rows, dtypes, blocks)
+
+    def _sort_indexes(f4_file_path, index_specs, verbose, num_processes, num_rows_per_run, tmp_dir_path, key_chunks):
+        # For each index, this generates the index spec, the number of rows, the types of the arrays and
+        # blocks of sorted rows (each with the row positions followed by the keys for each column). The
+        # blocks must be used before the next index is generated, because the runs are then removed.
+        if not isinstance(num_processes, int) or num_processes < 1:
+            raise Exception("The num_processes value must be a positive integer.")
+
+        if not isinstance(num_rows_per_run, int) or num_rows_per_run < 1:
+            raise Exception("The num_rows_per_run value must be a positive integer.")
 
         with f4py.Parser(f4_file_path) as parser:
-            f4py.print_message(f"Getting column meta information for {index_name} index and {f4_file_path}.", verbose)
-            select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = parser._get_column_meta(set([index_column_1_encoded, index_column_2_encoded]), [])
-            # TODO: Add logic to verify that index_column_1 and index_column_2 are valid.
+            num_rows = parser.get_num_rows()
 
-            file_handle = parser._get_file_handle("")
-            line_length = parser._get_stat(".ll")
-            index_column_1_type = column_type_dict[index_column_1_encoded]
-            index_column_2_type = column_type_dict[index_column_2_encoded]
-            coords_1 = column_coords_dict[index_column_1_encoded]
-            coords_2 = column_coords_dict[index_column_2_encoded]
+        if num_processes > 1:
+            # Split large files into enough runs that each process can sort one.
+            num_rows_per_run = min(num_rows_per_run, max(_MIN_ROWS_PER_PARALLEL_RUN, math.ceil(num_rows / num_processes)))
 
-            decompressor = f4py.get_decompressor(decompression_type, decompressor)
-            parse_function = parser._get_parse_row_value_function(decompression_type)
+        run_bounds = [(start_index, min(num_rows, start_index + num_rows_per_run)) for start_index in range(0, num_rows, num_rows_per_run)]
+        index_names = ", ".join([index_file_path for index_file_path, index_columns, custom_index_function in index_specs])
 
-            values_positions = []
-            f4py.print_message(f"Parsing values and positions for {index_name} index and {f4_file_path}.", verbose)
-            for row_index in range(parser.get_num_rows()):
-                value_1 = parse_function(row_index, coords_1, line_length, file_handle, decompression_type, decompressor, bigram_size_dict, index_column_1_encoded)
-                value_2 = parse_function(row_index, coords_2, line_length, file_handle, decompression_type, decompressor, bigram_size_dict, index_column_2_encoded)
+        if len(run_bounds) <= 1:
+            f4py.print_message(f"Sorting values for {index_names}.", verbose)
 
-                values_positions.append([value_1, value_2, row_index])
+            for index_spec, arrays in zip(index_specs, _sort_index_runs(f4_file_path, index_specs, key_chunks, 0, num_rows)):
+                yield index_spec, num_rows, [array.dtype for array in arrays], [arrays]
+            return
 
-            f4py.print_message(f"Building index file for {index_name} and {f4_file_path}.", verbose)
-            IndexBuilder._customize_values_positions(values_positions, [index_column_1_type, index_column_2_type], f4py.sort_first_two_columns, f4py.do_nothing)
+        if tmp_dir_path:
+            os.makedirs(tmp_dir_path, exist_ok=True)
 
-            index_file_path = IndexBuilder._get_index_file_path(parser.data_file_path, index_name)
-            IndexBuilder._save_index(values_positions, index_file_path)
+        with tempfile.TemporaryDirectory(dir=tmp_dir_path) as run_dir_path:
+            f4py.print_message(f"Sorting {len(run_bounds)} runs of values for {index_names}.", verbose)
+            run_file_paths = Parallel(n_jobs=num_processes)(delayed(_save_index_runs)(f4_file_path, index_specs, key_chunks, start_index, end_index, os.path.join(run_dir_path, str(i))) for i, (start_index, end_index) in enumerate(run_bounds))
 
-        f4py.print_message(f"Done building two-column index file for {index_name} and {f4_file_path}.", verbose)
+            for j, index_spec in enumerate(index_specs):
+                f4py.print_message(f"Merging runs for {index_spec[0]}.", verbose)
+                runs = [[np.load(file_path, mmap_mode="r") for file_path in file_paths[j]] for file_paths in run_file_paths]
+                dtypes = [np.result_type(*[run[i].dtype for run in runs]) for i in range(len(runs[0]))]
+
+                # Together, the blocks that are merged at a time hold about as many rows as one run.
+                num_rows_per_block = max(1000, num_rows_per_run // len(runs))
+                yield index_spec, num_rows, dtypes, _merge_index_runs(runs, num_rows_per_block)
 
     def _customize_values_positions(values_positions, column_types, sort_function, custom_index_function):
         # Iterate through each "column" except the last one (which has row_indices) and convert the data.
@@ -139,6 +373,132 @@ class IndexBuilder:
     #             compressed_value = recompression_dict[column_index][value]
     #             values_positions[row_index][column_index] = compressed_value
 
+    def _write_binary_index(index_file_path, num_rows, dtypes, blocks):
+        # The row index (position) for each key and the sorted keys for each column are stored as
+        # arrays, so they can be memory mapped and searched with NumPy. Strings are stored with a
+        # fixed width (like the data file). A footer describes where each array is stored. Each
+        # block holds the next rows of every array, so the arrays can be written incrementally.
+        dtypes = [np.dtype(np.uint32 if num_rows <= 2 ** 32 else np.uint64)] + [np.dtype(dtype) for dtype in dtypes[1:]]
+
+        array_offsets = []
+        end_offset = 0
+        for dtype in dtypes:
+            end_offset += -end_offset % _INDEX_ALIGNMENT
+            array_offsets.append(end_offset)
+            end_offset += num_rows * dtype.itemsize
+
+        array_locations = [[offset, dtype.str] for offset, dtype in zip(array_offsets, dtypes)]
+        footer = f4py.serialize({"format_version": _INDEX_FORMAT_VERSION, "num_rows": num_rows, "positions": array_locations[0], "keys": array_locations[1:]})
+
+        # Cached memory maps for a previous version of this index must not be used.
+        f4py.clear_file_cache(index_file_path)
+
+        with open(index_file_path, "wb") as index_file:
+            num_written_rows = 0
+
+            for block in blocks:
+                for array, dtype, offset in zip(block, dtypes, array_offsets):
+                    index_file.seek(offset + num_written_rows * dtype.itemsize)
+                    index_file.write(array.astype(dtype, copy=False).tobytes())
+
+                num_written_rows += len(block[0])
+
+            # Any gaps between the arrays are filled with zeros.
+            index_file.seek(end_offset)
+            index_file.write(footer)
+            index_file.write(len(footer).to_bytes(8, byteorder="little"))
+            index_file.write(_INDEX_MAGIC)
+
+    def _save_hash_index(hash_index_file_path, positions, keys):
+        group_starts, group_keys = _get_key_groups(keys)
+
+        # Each slot of the hash table stores a group index plus one (zero means the slot is empty).
+        # We use linear probing, and the table is at most half full, so there are few collisions.
+        # Groups are inserted in rounds: in each round, every group that has not been inserted checks
+        # the next slot in its probe sequence, and one group is inserted into each empty slot.
+        slots = np.zeros(1 << (2 * len(group_keys) - 1).bit_length(), dtype=np.uint32 if len(group_keys) < 2 ** 32 else np.uint64)
+        slot_mask = np.uint64(len(slots) - 1)
+        hashes = IndexBuilder._get_hash_index_hashes(group_keys)
+        probe_offsets = np.zeros(len(group_keys), dtype=np.uint64)
+        pending_groups = np.arange(len(group_keys))
+
+        while len(pending_groups) > 0:
+            candidate_slots = (hashes[pending_groups] + probe_offsets[pending_groups]) & slot_mask
+            empty_candidates = np.flatnonzero(slots[candidate_slots] == 0)
+            inserted_slots, first_candidates = np.unique(candidate_slots[empty_candidates], return_index=True)
+            slots[inserted_slots] = pending_groups[empty_candidates[first_candidates]] + 1
+
+            is_pending = np.ones(len(pending_groups), dtype=bool)
+            is_pending[empty_candidates[first_candidates]] = False
+            pending_groups = pending_groups[is_pending]
+            probe_offsets[pending_groups] += np.uint64(1)
+
+        position_dtype = np.uint32 if len(keys) < 2 ** 32 else np.uint64
+        arrays = {"slots": slots, "group_starts": group_starts.astype(position_dtype), "keys": group_keys, "positions": positions.astype(position_dtype, copy=False)}
+
+        IndexBuilder._write_index_arrays(hash_index_file_path, arrays, {}, _HASH_INDEX_MAGIC)
+
+    def _save_bitmap_index(bitmap_index_file_path, positions, group_starts, group_keys):
+        # For each distinct key, the rows are stored as a bitmap (one bit per row, with the first row in the lowest bit)
+        # or as an array of row indices, whichever is smaller. The keys are stored in the footer.
+        num_rows = len(positions)
+        num_bitmap_bytes = (num_rows + 7) // 8
+        position_dtype = np.uint32 if num_rows < 2 ** 32 else np.uint64
+
+        arrays = {}
+        for i in range(len(group_keys)):
+            group_positions = positions[group_starts[i]:group_starts[i + 1]]
+
+            if len(group_positions) * np.dtype(position_dtype).itemsize <= num_bitmap_bytes:
+                arrays[f"positions_{i}"] = group_positions.astype(position_dtype)
+            else:
+                is_in_group = np.zeros(num_rows, dtype=bool)
+                is_in_group[group_positions] = True
+                arrays[f"bitmap_{i}"] = np.packbits(is_in_group, bitorder="little")
+
+        IndexBuilder._write_index_arrays(bitmap_index_file_path, arrays, {"num_rows": num_rows, "keys": group_keys.tolist()}, _BITMAP_INDEX_MAGIC)
+
+    def _save_trigram_index(trigram_index_file_path, positions, keys):
+        # The rows are grouped by distinct key (as in a hash index). For each trigram (in sorted order), the
+        # postings are the groups whose keys contain it, from posting_starts[i] to posting_starts[i + 1].
+        group_starts, group_keys = _get_key_groups(keys)
+        trigrams, posting_starts, postings = _get_trigram_postings(group_keys)
+
+        position_dtype = np.uint32 if len(keys) < 2 ** 32 else np.uint64
+        arrays = {"group_starts": group_starts.astype(position_dtype), "keys": group_keys, "positions": positions.astype(position_dtype, copy=False), "trigrams": trigrams, "posting_starts": posting_starts, "postings": postings}
+
+        IndexBuilder._write_index_arrays(trigram_index_file_path, arrays, {}, _TRIGRAM_INDEX_MAGIC)
+
+    def _write_index_arrays(index_file_path, arrays, footer_dict, magic):
+        # The arrays (a dictionary) are stored so they can be memory mapped. The footer indicates where each array
+        # is stored, along with any other information in footer_dict. The file ends with the length of the footer
+        # (8 bytes) and a marker that indicates the type of index.
+        array_locations = {}
+        end_offset = 0
+        for name, array in arrays.items():
+            end_offset += -end_offset % _INDEX_ALIGNMENT
+            array_locations[name] = [end_offset, array.dtype.str, len(array)]
+            end_offset += array.nbytes
+
+        footer = f4py.serialize(dict(footer_dict, format_version=_INDEX_FORMAT_VERSION, arrays=array_locations))
+
+        # Cached memory maps for a previous version of this index must not be used.
+        f4py.clear_file_cache(index_file_path)
+
+        with open(index_file_path, "wb") as index_file:
+            for name, array in arrays.items():
+                index_file.seek(array_locations[name][0])
+
+                # Large arrays may be memory mapped, so they are written in blocks.
+                for start_index in range(0, len(array), _NUM_ROWS_PER_BLOCK):
+                    index_file.write(array[start_index:(start_index + _NUM_ROWS_PER_BLOCK)].tobytes())
+
+            index_file.seek(end_offset)
+            index_file.write(footer)
+            index_file.write(len(footer).to_bytes(8, byteorder="little"))
+            index_file.write(magic)
+
+    # This saves an index in text format, which is used for column names.
     def _save_index(values_positions, index_file_path):
         column_dict = {}
         for i in range(len(values_positions[0])):
@@ -172,10 +532,297 @@ class IndexBuilder:
         #f4py.write_str_to_file(index_file_path + ".ll", str(rows_max_length + 1).encode())
         f4py.write_str_to_file(index_file_path + ".ll", str(rows_max_length).encode())
 
+    def _add_to_single_file(f4_file_path):
+        # Indexes for a single-file F4 file are stored within that file.
+        if f4py.is_single_file(f4_file_path):
+            f4py.combine_into_single_file(f4_file_path)
+
+    def _get_zone_map_file_path(data_file_path, column_name):
+        return f"{data_file_path}.zm_{column_name}"
+
+    def _get_bloom_filter_file_path(data_file_path, column_name):
+        return f"{data_file_path}.bf_{column_name}"
+
+    def _get_bloom_filter_positions(values, num_hashes, num_bits):
+        # This uses double hashing: the positions for a value are h1 + i * h2 for i in range(num_hashes).
+        # The hash must be stable across processes and versions of Python, so we do not use hash().
+        digests = b"".join([hashlib.blake2b(_get_bloom_filter_key(value), digest_size=16).digest() for value in values])
+        hashes = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+        h1 = hashes[:, [0]]
+        h2 = hashes[:, [1]] | np.uint64(1)
+
+        # Unsigned integer overflow wraps around, which is fine for hashing.
+        return (h1 + np.arange(num_hashes, dtype=np.uint64) * h2) % np.uint64(num_bits)
+
+    def _get_hash_index_hashes(values):
+        # The hashes must be stable across processes and versions of Python, so we do not use hash().
+        # Strings are hashed with FNV-1a (one byte at a time, for all values at once), including the
+        # padding at the end of fixed-width values. Integers are mixed with the SplitMix64 finalizer.
+        # Unsigned integer overflow wraps around, which is fine for hashing.
+        if values.dtype.kind == "S":
+            value_bytes = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), values.dtype.itemsize)
+            hashes = np.full(len(values), 14695981039346656037, dtype=np.uint64)
+
+            for i in range(values.dtype.itemsize):
+                hashes = (hashes ^ value_bytes[:, i]) * np.uint64(1099511628211)
+
+            return hashes
+
+        hashes = values.astype(np.int64).view(np.uint64)
+        hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+
+        return hashes ^ (hashes >> np.uint64(31))
+
+    def _get_hash_index_file_path(data_file_path, column_name):
+        return f"{data_file_path}.hidx_{column_name}"
+
+    def _get_bitmap_index_file_path(data_file_path, column_name):
+        return f"{data_file_path}.bidx_{column_name}"
+
+    def _get_trigram_index_file_path(data_file_path, column_name):
+        return f"{data_file_path}.tidx_{column_name}"
+
     def _get_index_file_path(data_file_path, index_name, custom_index_function=f4py.do_nothing):
         index_file_path_extension = f".idx_{index_name}"
 
         if custom_index_function != f4py.do_nothing:
             index_file_path_extension = f"{index_file_path_extension}_{custom_index_function.__name__}"
 
-        return f"{data_file_path}{index_file_path_extension}"
\ No newline at end of file
+        return f"{data_file_path}{index_file_path_extension}"
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# A binary index file ends with a footer, the length of the footer (8 bytes), and this marker.
+_INDEX_MAGIC = b"F4INDEX2"
+_INDEX_FORMAT_VERSION = 2
+_INDEX_ALIGNMENT = 8
+
+# These mark the end of hash, bitmap and trigram index files (which have different footers).
+_HASH_INDEX_MAGIC = b"F4HASH02"
+_BITMAP_INDEX_MAGIC = b"F4BITMP2"
+_TRIGRAM_INDEX_MAGIC = b"F4TRGM02"
+
+_COLUMN_TYPE_NAMES = {"s": "string", "i": "integer", "f": "float"}
+
+# Large arrays (which may be memory mapped) are compared and written in blocks of this many rows.
+_NUM_ROWS_PER_BLOCK = 1000000
+
+# When multiple processes are used, files are only split into runs that have at least this many rows.
+_MIN_ROWS_PER_PARALLEL_RUN = 100000
+
+def _get_index_keys(f4_file_path, index_specs, key_chunks, start_index, end_index):
+    # Returns the keys for each index. Each column is read (or taken from key_chunks) only once.
+    column_names = list(dict.fromkeys([column_name for index_spec in index_specs for column_name in index_spec[1]]))
+
+    with f4py.Parser(f4_file_path) as parser:
+        column_keys = _get_column_keys(parser, column_names, key_chunks, start_index, end_index)
+
+    for column_name, values in column_keys.items():
+        if values.dtype == object:
+            raise Exception(f"The values in {column_name} are too large to be indexed.")
+
+    index_keys = []
+    for index_file_path, index_columns, custom_index_function in index_specs:
+        keys = []
+
+        for values in [column_keys[index_column] for index_column in index_columns]:
+            if custom_index_function != f4py.do_nothing and len(values) > 0:
+                values = np.array([custom_index_function(value) for value in values.tolist()], dtype=values.dtype)
+
+            keys.append(values)
+
+        index_keys.append(keys)
+
+    return index_keys
+
+def _get_column_keys(parser, column_names, key_chunks, start_index, end_index):
+    # Returns the values in the specified rows for each column (by name). Values are taken from key_chunks
+    # when they are available, and the other columns are read in a single pass.
+    select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = parser._prepare_query(f4py.NoFilter(), column_names)
+    read_columns = [column_name for column_name in select_columns if column_name.decode() not in key_chunks]
+
+    column_values = {}
+    if len(read_columns) > 0:
+        row_indices = f4py.RowSet(start=start_index, end=end_index)
+        column_values = dict(zip(read_columns, parser._get_converted_column_values(row_indices, read_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict)))
+
+    column_keys = {}
+    for column_name in select_columns:
+        if column_name in column_values:
+            values = column_values[column_name]
+        else:
+            values = _convert_key_values(_slice_key_chunks(key_chunks[column_name.decode()], start_index, end_index), column_type_dict[column_name])
+
+        # Keys have the same types that filters use when they scan the data.
+        if values.dtype != object:
+            if column_type_dict[column_name] == "f":
+                values = values.astype(np.float64)
+            elif column_type_dict[column_name] == "i":
+                values = values.astype(np.int64)
+
+        column_keys[column_name.decode()] = values
+
+    return column_keys
+
+def _get_key_groups(keys):
+    # The keys are sorted, so the rows for each distinct key (group) are contiguous. This returns the position where
+    # each group starts (followed by the number of keys) and the key for each group. The keys may be memory mapped,
+    # so they are compared in blocks (each of which overlaps the previous block by one key).
+    group_starts = [np.zeros(min(1, len(keys)), dtype=np.int64)]
+
+    for start_index in range(1, len(keys), _NUM_ROWS_PER_BLOCK):
+        block_keys = np.asarray(keys[(start_index - 1):(start_index + _NUM_ROWS_PER_BLOCK)])
+        group_starts.append(np.flatnonzero(block_keys[1:] != block_keys[:-1]) + start_index)
+
+    group_starts = np.append(np.concatenate(group_starts), len(keys))
+
+    return group_starts, np.asarray(keys[group_starts[:-1]])
+
+def _create_array_file(file_path, dtype, num_rows):
+    # Memory maps cannot be empty.
+    if num_rows == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.lib.format.open_memmap(file_path, mode="w+", dtype=dtype, shape=(num_rows,))
+
+def _get_trigram_postings(group_keys):
+    # Returns the distinct trigrams (each stored as an integer, with the first byte in the highest bits), where
+    # the postings for each trigram start (followed by the number of postings), and the postings (group indices,
+    # in ascending order for each trigram). Keys are padded with zeros, so trigrams are only taken within each key.
+    key_lengths = np.char.str_len(group_keys)
+    key_bytes = np.ascontiguousarray(group_keys).view(np.uint8).reshape(len(group_keys), group_keys.dtype.itemsize)
+
+    # Each trigram is combined with a group index, so np.unique removes duplicates and sorts by trigram and then by group.
+    trigram_groups = [np.zeros(0, dtype=np.uint64)]
+    for i in range(group_keys.dtype.itemsize - 2):
+        groups = np.flatnonzero(key_lengths >= i + 3)
+        trigrams = (key_bytes[groups, i].astype(np.uint64) << np.uint64(16)) | (key_bytes[groups, i + 1].astype(np.uint64) << np.uint64(8)) | key_bytes[groups, i + 2]
+        trigram_groups.append((trigrams << np.uint64(32)) | groups.astype(np.uint64))
+
+    trigram_groups = np.unique(np.concatenate(trigram_groups))
+    trigrams, posting_starts = np.unique(trigram_groups >> np.uint64(32), return_index=True)
+    postings = trigram_groups & np.uint64(0xffffffff)
+
+    return trigrams.astype(np.uint32), np.append(posting_starts, len(postings)).astype(np.uint64), postings.astype(np.uint32)
+
+def _slice_key_chunks(chunks, start_index, end_index):
+    arrays = []
+    chunk_start_index = 0
+
+    for chunk in chunks:
+        chunk_end_index = chunk_start_index + len(chunk)
+
+        if chunk_end_index > start_index and chunk_start_index < end_index:
+            arrays.append(chunk[max(0, start_index - chunk_start_index):(min(end_index, chunk_end_index) - chunk_start_index)])
+
+        chunk_start_index = chunk_end_index
+
+    if len(arrays) == 0:
+        return np.array(chunks[0][:0])
+
+    return np.concatenate(arrays)
+
+def _convert_key_values(values, column_type):
+    # These values are stored the same way as in the data file, so we convert them like the Parser does.
+    if values.dtype.kind != "S":
+        return values
+
+    if column_type == "s":
+        return np.char.rstrip(values, b" ")
+
+    if column_type == "f":
+        return values.astype(np.float64)
+
+    try:
+        return values.astype(np.int64)
+    except OverflowError:
+        return values.astype(object)
+
+def _sort_index_runs(f4_file_path, index_specs, key_chunks, start_index, end_index):
+    # For each index, returns the row positions followed by the keys for each column, sorted by the keys. The sort
+    # is stable (lexsort uses the last key as the primary key), so rows with the same keys stay in row order.
+    sorted_runs = []
+
+    for keys in _get_index_keys(f4_file_path, index_specs, key_chunks, start_index, end_index):
+        order = np.lexsort(keys[::-1])
+        sorted_runs.append([order + start_index] + [values[order] for values in keys])
+
+    return sorted_runs
+
+def _save_index_runs(f4_file_path, index_specs, key_chunks, start_index, end_index, run_file_prefix):
+    # For each index, returns the paths of the files that store the sorted run.
+    run_file_paths = []
+
+    for j, arrays in enumerate(_sort_index_runs(f4_file_path, index_specs, key_chunks, start_index, end_index)):
+        run_file_paths.append([])
+
+        for i, array in enumerate(arrays):
+            run_file_paths[-1].append(f"{run_file_prefix}_{j}_{i}.npy")
+            np.save(run_file_paths[-1][-1], array)
+
+    return run_file_paths
+
+def _merge_index_runs(runs, num_rows_per_block):
+    # This generates merged blocks of rows from sorted runs. Rows are ordered by their keys and then
+    # by position, so the order is the same as if all rows had been sorted at once. From each run,
+    # we look at the next num_rows_per_block rows. The last of these rows that comes first (the
+    # threshold) is the last row we can be sure to output now.
+    run_positions = [0] * len(runs)
+
+    while True:
+        active_runs = [i for i, run in enumerate(runs) if run_positions[i] < len(run[0])]
+
+        if len(active_runs) == 0:
+            return
+
+        threshold = None
+        for i in active_runs:
+            last_position = min(len(runs[i][0]), run_positions[i] + num_rows_per_block) - 1
+            last_row = tuple(array[last_position] for array in runs[i][1:]) + (runs[i][0][last_position],)
+
+            if threshold is None or last_row < threshold:
+                threshold = last_row
+
+        block_arrays = []
+        for i in active_runs:
+            run_arrays = [array[run_positions[i]:(run_positions[i] + num_rows_per_block)] for array in runs[i]]
+            num_block_rows = _count_rows_up_to(run_arrays[1:] + run_arrays[:1], threshold)
+
+            block_arrays.append([np.asarray(array[:num_block_rows]) for array in run_arrays])
+            run_positions[i] += num_block_rows
+
+        block = [np.concatenate([arrays[j] for arrays in block_arrays]) for j in range(len(runs[0]))]
+        order = np.lexsort([block[0]] + block[:0:-1])
+
+        yield [array[order] for array in block]
+
+def _count_rows_up_to(sorted_arrays, threshold):
+    # The rows are sorted by the first array, then the second, etc. This returns the number of rows
+    # that are less than or equal to the threshold by narrowing the range of rows that tie with it.
+    lower_position, upper_position = 0, len(sorted_arrays[0])
+
+    for array, value in zip(sorted_arrays, threshold):
+        tied_values = array[lower_position:upper_position]
+        lower_position, upper_position = lower_position + int(np.searchsorted(tied_values, value, side="left")), lower_position + int(np.searchsorted(tied_values, value, side="right"))
+
+    return upper_position
+
+def _get_bloom_filter_key(value):
+    # Integers are hashed as text so that the keys do not depend on how the values were stored.
+    if isinstance(value, bytes):
+        return value
+
+    return str(value).encode()
+
+# Zones with more distinct values than this only store the minimum and maximum.
+_MAX_ZONE_VALUES = 16
+
+def _summarize_zone(values):
+    # The unique values are sorted, so the first and last are the minimum and maximum.
+    unique_values = np.unique(values)
+    min_value, max_value = unique_values[[0, -1]].tolist()
+
+    return {"min": min_value, "max": max_value, "values": unique_values.tolist() if len(unique_values) <= _MAX_ZONE_VALUES else None}
@@ -1,8 +1,6 @@
 import f4py
 import fastnumbers
-from itertools import chain
-from joblib import Parallel, delayed
-import math
+import numpy as np
 import operator
 
 class IndexSearcher:
@@ -41,197 +39,333 @@ class IndexSearcher:
             # Else the element can only be present in right subarray
             return IndexSearcher._binary_identifier_search(parser, line_length, value_coords, file_handle, value_to_find, mid + 1, r)
 
-    def _filter_using_operator(index_file_path, fltr, end_index, num_processes):
-        if end_index == 0:
-            return set()
+    def _filter_using_operator(index_file_path, fltr, max_num_rows=None):
+        keys, positions = IndexSearcher._read_index(index_file_path)
 
-        with IndexSearcher._get_index_parser(index_file_path) as index_parser:
-            line_length = index_parser._get_stat(".ll")
-            coords = index_parser._parse_data_coords([0, 1])
-            file_handle = index_parser._get_file_handle("")
+        if fltr.oper == operator.ne:
+            lower_position, upper_position = IndexSearcher._find_bounds(keys[0], fltr, operator.eq)
 
-            if fltr.oper == operator.eq:
-                return IndexSearcher._find_row_indices_for_range(index_parser, coords[0], coords[1], fltr, fltr, end_index, num_processes)
-            else:
-                if fltr.oper == operator.ne:
-                    lower_position, upper_position = IndexSearcher._find_bounds_for_range(index_parser, coords[0], fltr, fltr, end_index, num_processes)
+            return IndexSearcher._retrieve_matching_row_indices(positions, (0, lower_position)) | IndexSearcher._retrieve_matching_row_indices(positions, (upper_position, len(positions)))
 
-                    lower_positions = (0, lower_position)
-                    upper_positions = (upper_position, end_index)
+        bounds = IndexSearcher._find_bounds(keys[0], fltr, fltr.oper)
 
-                    lower_row_indices = IndexSearcher._retrieve_matching_row_indices(index_parser, coords[1], lower_positions, num_processes)
-                    upper_row_indices = IndexSearcher._retrieve_matching_row_indices(index_parser, coords[1], upper_positions, num_processes)
+        if fltr.oper == operator.eq:
+            # Rows with the same value are stored in row order.
+            return IndexSearcher._retrieve_matching_row_indices(positions, bounds, True, max_num_rows)
 
-                    return lower_row_indices | upper_row_indices
-                else:
-                    if fltr.oper == operator.gt:
-                        positions = IndexSearcher._find_positions_g(index_parser, line_length, coords[0], file_handle, fltr, 0, end_index, operator.le)
-                    elif fltr.oper == operator.ge:
-                        positions = IndexSearcher._find_positions_g(index_parser, line_length, coords[0], file_handle, fltr, 0, end_index, operator.lt)
-                    elif fltr.oper == operator.lt:
-                        positions = IndexSearcher._find_positions_l(index_parser, line_length, coords[0], file_handle, fltr, 0, end_index, fltr.oper)
-                    elif fltr.oper == operator.le:
-                        positions = IndexSearcher._find_positions_l(index_parser, line_length, coords[0], file_handle, fltr, 0, end_index, fltr.oper)
+        return IndexSearcher._retrieve_matching_row_indices(positions, bounds)
 
-                    return IndexSearcher._retrieve_matching_row_indices(index_parser, coords[1], positions, num_processes)
+    def _filter_using_range(index_file_path, filter1, filter2):
+        keys, positions = IndexSearcher._read_index(index_file_path)
 
-    def _find_positions_g(index_parser, line_length, value_coords, file_handle, fltr, start_index, end_index, all_false_operator):
-        smallest_value = index_parser._parse_row_value(start_index, value_coords, line_length, file_handle)
-        if smallest_value == b"":
-            return start_index, end_index
+        return IndexSearcher._retrieve_matching_row_indices(positions, IndexSearcher._find_bounds_for_range(keys[0], filter1, filter2))
 
-        if not all_false_operator(fltr._get_conversion_function()(smallest_value), fltr.value):
-            return start_index, end_index
+    def _filter_using_prefix(index_file_path, prefix):
+        keys, positions = IndexSearcher._read_index(index_file_path)
 
-        largest_value = index_parser._parse_row_value(end_index - 1, value_coords, line_length, file_handle)
-        if largest_value == b"":
-            return start_index, start_index
+        # Every value that starts with the prefix is at least the prefix and less than the upper bound.
+        lower_position = np.searchsorted(keys[0], prefix, side="left")
+        upper_bound = _get_prefix_upper_bound(prefix)
+        upper_position = len(positions) if upper_bound is None else np.searchsorted(keys[0], upper_bound, side="left")
 
-        matching_position = IndexSearcher._search(index_parser, line_length, value_coords, file_handle, fltr, 0, end_index, all_false_operator)
+        return IndexSearcher._retrieve_matching_row_indices(positions, (lower_position, upper_position))
 
-        return matching_position + 1, end_index
+    def _filter_using_values(index_file_path, values):
+        # Returns the rows where the keys equal any of the values.
+        keys, positions = IndexSearcher._read_index(index_file_path)
+        values = np.unique(np.array(values))
 
-    def _find_positions_l(index_parser, line_length, value_coords, file_handle, fltr, start_index, end_index, all_true_operator):
-        smallest_value = index_parser._parse_row_value(start_index, value_coords, line_length, file_handle)
-        if smallest_value == b"":
-            return start_index, start_index
+        lower_positions = np.searchsorted(keys[0], values, side="left")
+        upper_positions = np.searchsorted(keys[0], values, side="right")
+        bounds_list = [(lower_position, upper_position) for lower_position, upper_position in zip(lower_positions.tolist(), upper_positions.tolist()) if upper_position > lower_position]
 
-        if not all_true_operator(fltr._get_conversion_function()(smallest_value), fltr.value):
-            return start_index, start_index
+        return IndexSearcher._retrieve_row_indices_for_groups(positions, bounds_list)
 
-        largest_value = index_parser._parse_row_value(end_index - 1, value_coords, line_length, file_handle)
-        if largest_value == b"":
-            return start_index, end_index
+    def _filter_using_hash(hash_index_file_path, values, max_num_rows=None):
+        # Returns the rows where the column equals any of the values. Each value is found in constant time.
+        hash_index = IndexSearcher._read_hash_index(hash_index_file_path)
+        group_starts = hash_index["group_starts"]
+        group_indices = IndexSearcher._find_hash_index_groups(hash_index, values)
+        bounds_list = [(int(group_starts[group_index]), int(group_starts[group_index + 1])) for group_index in group_indices.tolist()]
 
-        if all_true_operator(fltr._get_conversion_function()(largest_value), fltr.value):
-            return start_index, end_index
+        return IndexSearcher._retrieve_row_indices_for_groups(hash_index["positions"], bounds_list, max_num_rows)
 
-        matching_position = IndexSearcher._search(index_parser, line_length, value_coords, file_handle, fltr, 0, end_index, all_true_operator)
+    def _find_hash_index_groups(hash_index, values):
+        # Returns the indices of the groups (distinct keys) that equal any of the values. Like when the
+        # index was built, each value that has not been found checks the next slot of its probe sequence.
+        slots = hash_index["slots"]
+        keys = hash_index["keys"]
 
-        return start_index, matching_position + 1
+        if keys.dtype.kind == "S":
+            # Longer values would be truncated, and they cannot be present.
+            values = [value for value in values if len(value) <= keys.dtype.itemsize]
+        else:
+            values = [value for value in values if -2 ** 63 <= value < 2 ** 63]
 
-    # TODO: It should be feasible to combine this function with _search_with_filter
-    #      to avoid duplicating similar code.
-    def _search(index_parser, line_length, value_coords, file_handle, fltr, l, r, search_operator):
-        mid = l + (r - l) // 2
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int64)
 
-        conversion_function = fltr._get_conversion_function()
-        mid_value = conversion_function(index_parser._parse_row_value(mid, value_coords, line_length, file_handle))
+        values = np.unique(np.array(values, dtype=keys.dtype))
+        slot_mask = np.uint64(len(slots) - 1)
+        hashes = f4py.IndexBuilder._get_hash_index_hashes(values)
+        probe_offsets = np.zeros(len(values), dtype=np.uint64)
+        pending_values = np.arange(len(values))
+        group_indices = []
 
-        if search_operator(mid_value, fltr.value):
-            next_value = index_parser._parse_row_value(mid + 1, value_coords, line_length, file_handle)
+        while len(pending_values) > 0:
+            slot_values = slots[(hashes[pending_values] + probe_offsets[pending_values]) & slot_mask].astype(np.int64)
+            is_found = slot_values > 0
+            is_found[is_found] = keys[slot_values[is_found] - 1] == values[pending_values[is_found]]
 
-            # TODO: Does this work if we have a blank data value? Modify to be like search_with_filter?
-            if next_value == b"":
-                return mid
-            elif not search_operator(conversion_function(next_value), fltr.value):
-                return mid
-            else:
-                return IndexSearcher._search(index_parser, line_length, value_coords, file_handle, fltr, mid, r, search_operator)
-        else:
-            return IndexSearcher._search(index_parser, line_length, value_coords, file_handle, fltr, l, mid, search_operator)
+            group_indices.append(slot_values[is_found] - 1)
+
+            # Values stop probing when they are found or reach an empty slot.
+            pending_values = pending_values[(slot_values > 0) & ~is_found]
+            probe_offsets[pending_values] += np.uint64(1)
+
+        return np.concatenate(group_indices)
+
+    def _retrieve_row_indices_for_groups(positions, bounds_list, max_num_rows=None):
+        # Each group of positions has the same key, so the positions within it are in row order.
+        if len(bounds_list) == 0:
+            return f4py.RowSet()
+
+        if len(bounds_list) == 1:
+            return IndexSearcher._retrieve_matching_row_indices(positions, bounds_list[0], True, max_num_rows)
+
+        return f4py.RowSet(np.concatenate([positions[lower_position:upper_position] for lower_position, upper_position in bounds_list]))
+
+    def _filter_using_composite(index_file_path, search_filters, mask_filters):
+        # search_filters narrow the range of positions, so they must be for a prefix of the index columns, where
+        # all columns but the last have an equality filter. mask_filters are evaluated on the keys within this range.
+        # Both are lists of (the position of the column within the index, filter) tuples.
+        keys, positions = IndexSearcher._read_index(index_file_path)
+        bounds = (0, len(positions))
+
+        for i, fltr in search_filters:
+            bounds = IndexSearcher._find_bounds(keys[i], fltr, fltr.oper, bounds[0], bounds[1])
+
+        # When every column has an equality filter, the positions are in row order.
+        is_sorted = len(set([i for i, fltr in search_filters if fltr.oper == operator.eq])) == len(keys)
+
+        if len(mask_filters) == 0:
+            return IndexSearcher._retrieve_matching_row_indices(positions, bounds, is_sorted)
+
+        passes = np.ones(bounds[1] - bounds[0], dtype=bool)
+        for i, fltr in mask_filters:
+            passes &= fltr._passes_converted_values(keys[i][bounds[0]:bounds[1]])
+
+        return f4py.RowSet(positions[bounds[0]:bounds[1]][passes], is_sorted=is_sorted)
+
+    def _find_bounds(keys, fltr, oper, start_position=0, end_position=None):
+        # Returns the range of positions (within start_position and end_position) where the keys pass the operator.
+        if end_position is None:
+            end_position = len(keys)
+
+        lower_side, upper_side = _SEARCH_SIDES[oper]
+        search_keys = keys[start_position:end_position]
 
-    def _search_with_filter(index_parser, line_length, value_coords, file_handle, left_index, right_index, overall_end_index, fltr):
-        mid_index = (left_index + right_index) // 2
+        lower_position = start_position if lower_side is None else start_position + int(np.searchsorted(search_keys, fltr.value, side=lower_side))
+        upper_position = end_position if upper_side is None else start_position + int(np.searchsorted(search_keys, fltr.value, side=upper_side))
 
-        if mid_index == 0:
-            return 0
+        return lower_position, max(lower_position, upper_position)
 
-        conversion_function = fltr._get_conversion_function()
-        mid_value = conversion_function(index_parser._parse_row_value(mid_index, value_coords, line_length, file_handle))
+    def _find_bounds_for_range(keys, filter1, filter2, start_position=0, end_position=None):
+        lower_position = IndexSearcher._find_bounds(keys, filter1, filter1.oper, start_position, end_position)[0]
+        upper_position = IndexSearcher._find_bounds(keys, filter2, filter2.oper, start_position, end_position)[1]
 
-        if fltr.passes(mid_value):
-            if mid_index == right_index:
-                return mid_index
+        return lower_position, max(lower_position, upper_position)
 
-            next_index = mid_index + 1
+    def _retrieve_matching_row_indices(positions, bounds, is_sorted=False, max_num_rows=None):
+        # Only specify is_sorted (or max_num_rows) when all the keys within the bounds are the same,
+        # so the positions are in row order. The row indices are then a view of the index file.
+        lower_position, upper_position = bounds
 
-            if next_index == overall_end_index:
-                return next_index
+        if max_num_rows is not None:
+            upper_position = min(upper_position, lower_position + max_num_rows)
 
-            next_value = conversion_function(index_parser._parse_row_value(next_index, value_coords, line_length, file_handle))
+        return f4py.RowSet(positions[lower_position:upper_position], is_sorted=is_sorted)
 
-            if fltr.passes(next_value):
-                return IndexSearcher._search_with_filter(index_parser, line_length, value_coords, file_handle, next_index, right_index, overall_end_index, fltr)
+    def _read_index(index_file_path):
+        # Returns a list with the sorted keys for each indexed column and an array with the
+        # corresponding row indices. These arrays are views of a memory-mapped file.
+        handle = f4py.open_cached_read_file(index_file_path)
+
+        try:
+            footer = _read_index_footer(handle, index_file_path, _INDEX_MAGIC)
+            num_rows = footer["num_rows"]
+
+            arrays = []
+            for offset, dtype in [footer["positions"]] + footer["keys"]:
+                if num_rows == 0:
+                    arrays.append(np.zeros(0, dtype=dtype))
+                else:
+                    arrays.append(np.frombuffer(handle, dtype=dtype, count=num_rows, offset=offset))
+        finally:
+            # The arrays keep the memory map open for as long as they are used.
+            f4py.release_cached_read_file(handle)
+
+        return arrays[1:], arrays[0]
+
+    def _read_hash_index(hash_index_file_path):
+        # Returns a dictionary with the hash table (slots), the start of each group of positions, the
+        # key for each group, and the positions.
+        return IndexSearcher._read_index_arrays(hash_index_file_path, _HASH_INDEX_MAGIC)[1]
+
+    def _read_index_arrays(index_file_path, magic):
+        # Returns the footer and a dictionary with the arrays in the index. These arrays are views of a memory-mapped file.
+        handle = f4py.open_cached_read_file(index_file_path)
+
+        try:
+            footer = _read_index_footer(handle, index_file_path, magic)
+            arrays = {}
+
+            for name, (offset, dtype, length) in footer["arrays"].items():
+                arrays[name] = np.frombuffer(handle, dtype=dtype, count=length, offset=offset) if length > 0 else np.zeros(0, dtype=dtype)
+        finally:
+            f4py.release_cached_read_file(handle)
+
+        return footer, arrays
+
+    def _filter_using_bitmap(bitmap_index_file_path, passes_function):
+        # Returns a bitmap (one bit per row, with the first row in the lowest bit) of the rows where the key passes.
+        # Each distinct key is checked once. Keys of integer columns are numbers, which integer filters convert
+        # the same way as text. Filters that compare text only use bitmap indexes of string columns.
+        footer, arrays = IndexSearcher._read_index_arrays(bitmap_index_file_path, _BITMAP_INDEX_MAGIC)
+        num_rows = footer["num_rows"]
+        passing_key_indices = [i for i, key in enumerate(footer["keys"]) if passes_function(key)]
+
+        bitmap = np.zeros((num_rows + 7) // 8, dtype=np.uint8)
+        array_positions = []
+        for i in passing_key_indices:
+            if f"bitmap_{i}" in arrays:
+                bitmap |= arrays[f"bitmap_{i}"]
             else:
-                return mid_index + 1
-        else:
-            if left_index == mid_index:
-                return mid_index
+                array_positions.append(arrays[f"positions_{i}"])
 
-            return IndexSearcher._search_with_filter(index_parser, line_length, value_coords, file_handle, left_index, mid_index, overall_end_index, fltr)
+        if len(array_positions) > 0:
+            is_in_array = np.zeros(num_rows, dtype=bool)
+            is_in_array[np.concatenate(array_positions)] = True
+            bitmap |= np.packbits(is_in_array, bitorder="little")
 
-    def _find_matching_row_indices(index_file_path, position_coords, positions):
-        # To make this paralellizable, we pass just a file path rather than index_parser.
-        with IndexSearcher._get_index_parser(index_file_path) as index_parser:
-            line_length = index_parser._get_stat(".ll")
-            file_handle = index_parser._get_file_handle("")
+        return bitmap
 
-            matching_row_indices = set()
-            for i in range(positions[0], positions[1]):
-                matching_row_indices.add(fastnumbers.fast_int(index_parser._parse_row_value(i, position_coords, line_length, file_handle)))
+    def _filter_using_trigrams(trigram_index_file_path, literals, matches_function):
+        # Returns the rows where the key matches. A matching key must contain each literal (bytes), so only keys that
+        # contain every trigram of the literals are checked. Each distinct key is checked once.
+        trigram_index = IndexSearcher._read_index_arrays(trigram_index_file_path, _TRIGRAM_INDEX_MAGIC)[1]
+        keys = trigram_index["keys"]
+        group_starts = trigram_index["group_starts"]
 
-            return matching_row_indices
+        candidate_groups = IndexSearcher._find_trigram_candidates(trigram_index, literals)
+        if candidate_groups is None:
+            candidate_groups = np.arange(len(keys))
 
-    def _retrieve_matching_row_indices(index_parser, position_coords, positions, num_processes):
-        # This is a rough threshold for determine whether it is worth the overhead to parallelize.
-        num_indices = positions[1] - positions[0]
+        is_matching = np.fromiter((matches_function(key) for key in keys[candidate_groups].tolist()), dtype=bool, count=len(candidate_groups))
+        matching_groups = candidate_groups[is_matching]
 
-        if num_processes == 1 or num_indices < 100:
-            return IndexSearcher._find_matching_row_indices(index_parser.data_file_path, position_coords, positions)
-        else:
-            chunk_size = math.ceil(num_indices / num_processes)
-            position_chunks = []
-            for i in range(positions[0], positions[1], chunk_size):
-                position_chunks.append((i, min(positions[1], i + chunk_size)))
+        if len(matching_groups) > _MAX_GROUPS_TO_RETRIEVE:
+            # When many groups match, it is faster to select their positions with a mask.
+            is_group_matching = np.zeros(len(keys), dtype=bool)
+            is_group_matching[matching_groups] = True
 
-            return set(chain.from_iterable(Parallel(n_jobs=num_processes)(
-                delayed(IndexSearcher._find_matching_row_indices)(index_parser.data_file_path, position_coords, position_chunk)
-                for position_chunk in position_chunks)))
+            return f4py.RowSet(trigram_index["positions"][np.repeat(is_group_matching, np.diff(group_starts))])
 
-    def _find_bounds_for_range(index_parser, value_coords, filter1, filter2, end_index, num_processes, start_index=0):
-        line_length = index_parser._get_stat(".ll")
-        file_handle = index_parser._get_file_handle("")
+        bounds_list = list(zip(group_starts[matching_groups].tolist(), group_starts[matching_groups + 1].tolist()))
 
-        lower_positions = IndexSearcher._find_positions_g(index_parser, line_length, value_coords, file_handle, filter1, start_index, end_index, operator.lt)
-        upper_positions = IndexSearcher._find_positions_l(index_parser, line_length, value_coords, file_handle, filter2, lower_positions[0], lower_positions[1], operator.le)
+        return IndexSearcher._retrieve_row_indices_for_groups(trigram_index["positions"], bounds_list)
 
-        lower_position = max(lower_positions[0], upper_positions[0])
-        upper_position = min(lower_positions[1], upper_positions[1])
+    def _find_trigram_candidates(trigram_index, literals):
+        # Returns the groups whose keys contain every trigram in the literals (or None if the literals have no trigrams).
+        trigrams = np.array(sorted(set(trigram for literal in literals for trigram in _get_trigrams(literal))), dtype=np.uint32)
+        if len(trigrams) == 0:
+            return None
 
-        return lower_position, upper_position
+        index_trigrams = trigram_index["trigrams"]
+        trigram_positions = np.searchsorted(index_trigrams, trigrams)
+        # If any trigram is not in the index, no key can match.
+        if np.any(trigram_positions >= len(index_trigrams)) or np.any(index_trigrams[trigram_positions] != trigrams):
+            return np.zeros(0, dtype=np.int64)
 
-    def _find_row_indices_for_range(index_parser, value_coords, position_coords, filter1, filter2, end_index, num_processes):
-        lower_position, upper_position = IndexSearcher._find_bounds_for_range(index_parser, value_coords, filter1, filter2, end_index, num_processes)
+        posting_starts = trigram_index["posting_starts"]
+        posting_lists = [trigram_index["postings"][posting_starts[i]:posting_starts[i + 1]] for i in trigram_positions]
 
-        return IndexSearcher._retrieve_matching_row_indices(index_parser, position_coords, (lower_position, upper_position), num_processes)
+        # Intersecting the shortest lists first keeps the intermediate results small.
+        posting_lists.sort(key=len)
+        candidate_groups = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            candidate_groups = np.intersect1d(candidate_groups, posting_list, assume_unique=True)
 
-    def _get_passing_row_indices(fltr, parser, line_length, coords_value, coords_position, file_handle, start_index, end_index):
-        passing_row_indices = set()
+        return candidate_groups
 
-        for i in range(start_index, end_index):
-            if fltr.passes(parser._parse_row_value(i, coords_value, line_length, file_handle)):
-                passing_row_indices.add(fastnumbers.fast_int(parser._parse_row_value(i, coords_position, line_length, file_handle)))
+    def _find_bloom_filter_blocks(bloom_filter_file_path, value):
+        # Returns the indices of the blocks of rows that may contain the value.
+        may_contain, num_rows_per_block = IndexSearcher._check_bloom_filter(bloom_filter_file_path, [value])
 
-        return passing_row_indices
+        return np.flatnonzero(may_contain[0]), num_rows_per_block
 
-    def _get_passing_row_indices_with_filter(index_file_path, fltr, end_index, num_processes):
-        with f4py.IndexSearcher._get_index_parser(index_file_path) as index_parser:
-            line_length = index_parser._get_stat(".ll")
-            coords = index_parser._parse_data_coords([0, 1])
-            file_handle = index_parser._get_file_handle("")
+    def _check_bloom_filter(bloom_filter_file_path, values):
+        # Returns a matrix that indicates whether each block of rows (column) may contain each value (row).
+        bloom_filter = f4py.read_cached_object_from_file(bloom_filter_file_path)
+        num_bits = bloom_filter["num_bits"]
+        bits = np.frombuffer(bloom_filter["bits"], dtype=np.uint8).reshape(-1, num_bits // 8)
 
-            lower_range = f4py.IndexSearcher._find_positions_g(index_parser, line_length, coords[0], file_handle, fltr, 0, end_index, operator.lt)
+        positions = f4py.IndexBuilder._get_bloom_filter_positions(values, bloom_filter["num_hashes"], num_bits)
+        masks = np.left_shift(np.uint64(1), positions % np.uint64(8)).astype(np.uint8)
+        may_contain = np.all((bits[:, positions // np.uint64(8)] & masks) != 0, axis=2).T
 
-            if lower_range[0] == end_index:
-                return set()
+        return may_contain, bloom_filter["num_rows_per_block"]
 
-            upper_position = IndexSearcher._search_with_filter(index_parser, line_length, coords[0], file_handle, lower_range[0], lower_range[1], end_index, fltr)
+    def _get_composite_index_name(column_names):
+        return _COMPOSITE_INDEX_SEPARATOR.join(column_names)
 
-            return f4py.IndexSearcher._retrieve_matching_row_indices(index_parser, coords[1], (lower_range[0], upper_position), num_processes)
+    def _find_composite_indexes(data_file_path):
+        # Returns the column names (in order) for each composite index of this file.
+        index_names = [extension[len(".idx_"):] for extension in f4py.list_file_extensions(data_file_path, ".idx_")]
 
-    def _get_two_column_index_name(filter1, filter2):
-        return "____".join([filter1.column_name.decode(), filter2.column_name.decode()])
+        return [index_name.split(_COMPOSITE_INDEX_SEPARATOR) for index_name in index_names if _COMPOSITE_INDEX_SEPARATOR in index_name]
 
     def _get_index_parser(index_file_path):
-        return f4py.Parser(index_file_path, fixed_file_extensions=["", ".cc"], stats_file_extensions=[".ll", ".mccl"])
\ No newline at end of file
+        return f4py.Parser(index_file_path, fixed_file_extensions=["", ".cc"], stats_file_extensions=[".ll", ".mccl"])
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# This must match the marker at the end of files that IndexBuilder saves.
+_INDEX_MAGIC = b"F4INDEX2"
+
+# These must match the markers at the end of files that IndexBuilder saves for hash, bitmap and trigram indexes.
+_HASH_INDEX_MAGIC = b"F4HASH02"
+_BITMAP_INDEX_MAGIC = b"F4BITMP2"
+_TRIGRAM_INDEX_MAGIC = b"F4TRGM02"
+
+# When more groups than this match in a trigram index, their positions are selected with a mask rather than one group at a time.
+_MAX_GROUPS_TO_RETRIEVE = 100
+
+# The names of columns in a composite index are joined with this.
+_COMPOSITE_INDEX_SEPARATOR = "____"
+
+# For each operator, these indicate how to search for the first and last positions that pass (None means the start or end).
+_SEARCH_SIDES = {operator.eq: ("left", "right"), operator.gt: ("right", None), operator.ge: ("left", None), operator.lt: (None, "left"), operator.le: (None, "right")}
+
+def _read_index_footer(handle, index_file_path, magic):
+    if len(handle) < 16 or handle[-8:] != magic:
+        raise Exception(f"{index_file_path} is not a valid index file. It may have been built by an older version of f4py, so please rebuild it.")
+
+    footer_length = int.from_bytes(handle[-16:-8], byteorder="little")
+
+    return f4py.deserialize(handle[(len(handle) - 16 - footer_length):-16])
+
+def _get_trigrams(value):
+    # Returns each sequence of three bytes in the value as an integer (as stored in a trigram index).
+    return [(value[i] << 16) | (value[i + 1] << 8) | value[i + 2] for i in range(len(value) - 2)]
+
+def _get_prefix_upper_bound(prefix):
+    # Returns the smallest value that is greater than every value that starts with the prefix (None if there is none).
+    prefix = prefix.rstrip(b"\xff")
+
+    if prefix == b"":
+        return None
+
+    return prefix[:-1] + bytes([prefix[-1] + 1])
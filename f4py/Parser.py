@@ -1,11 +1,14 @@
 import f4py
 import fastnumbers
-import glob
 from itertools import chain
 from joblib import Parallel, delayed
 import math
+import numpy as np
 import os
+import shutil
+import struct
 import sys
+import tempfile
 import zstandard
 
 class Parser:
@@ -26,24 +29,42 @@ class Parser:
 
         self.data_file_path = data_file_path
 
-        # Cache file handles in a dictionary.
-        self.__file_handles = {}
-        for ext in fixed_file_extensions:
-            self.__file_handles[ext] = self._set_file_handle(ext)
+        # Worker processes are created when first needed and kept until this parser is closed.
+        self.__parallel = None
+        self.__parallel_key = None
+        self.__last_query_plan = None
+        self.__column_stats_dict = None
 
-        # Cache statistics in a dictionary.
+        # Cache file handles in a dictionary. The underlying memory maps are shared with other parsers in this process.
+        self.__file_handles = {}
         self.__stats = {}
-        for ext in stats_file_extensions:
-            self.__stats[ext] = f4py.read_int_from_file(data_file_path, ext)
+
+        try:
+            for ext in fixed_file_extensions:
+                self.__file_handles[ext] = self._set_file_handle(ext)
+
+            # Cache statistics in a dictionary.
+            for ext in stats_file_extensions:
+                self.__stats[ext] = f4py.read_cached_int_from_file(data_file_path, ext)
+        except:
+            # Otherwise, the shared memory maps would never be released.
+            self.__exit__(None, None, None)
+            raise
 
     def __enter__(self):
         return self
 
     def __exit__(self, the_type, value, traceback):
+        if self.__parallel:
+            self.__parallel.__exit__(None, None, None)
+            self.__parallel = None
+
         for handle in self.__file_handles.values():
-            handle.close()
+            f4py.release_cached_read_file(handle)
 
-    def query_and_save(self, fltr, select_columns, out_file_path=None, out_file_type="tsv", num_processes=1, lines_per_chunk=10):
+        self.__file_handles = {}
+
+    def query_and_save(self, fltr, select_columns, out_file_path=None, out_file_type="tsv", num_processes=1, lines_per_chunk=10, limit=None, offset=0):
         """
         Query the data file using zero or more filters.
 
@@ -55,106 +76,173 @@ class Parser:
             select_columns (list): A list of strings that indicate the names of columns that should be selected. If this is an empty list, all columns will be selected.
             out_file_path(str): A path to a file that will store the output data. If None is specified, the data will be directed to standard output.
             out_file_type (str): The output file type. Currently, the only supported value is tsv.
-        """
-        if not fltr:
-            raise Exception("A filter must be specified.")
-
-        if not isinstance(fltr, f4py.NoFilter):
-            raise Exception("An object that inherits from NoFilter must be specified.")
+            num_processes (int or str): The number of processes to use. If this is "auto", the number of processes (and whether to use threads or processes) is chosen based on the estimated amount of work. When an index can be used, matching rows are found in a single process.
+            limit (int): The maximum number of matching rows to save. If specified (or if offset is specified), the data file is scanned in a single process and scanning stops once enough rows have been found (see QueryPlan.limited_scan).
+            offset (int): The number of matching rows to skip before saving rows.
 
+        Returns:
+            A QueryPlan object that describes how the query was executed.
+        """
         if out_file_type != "tsv":
             raise Exception("The only out_file_type currently supported is tsv.")
 
-        if select_columns:
-            if not isinstance(select_columns, list):
-                raise Exception("You must specify select_column as a list.")
+        select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = self._prepare_query(fltr, select_columns)
+
+        keep_row_indices = self._get_keep_row_indices(fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_processes, limit, offset)
+        rows = self._generate_rows(keep_row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        if out_file_path:
+            output_num_processes = _choose_output_num_processes(len(keep_row_indices), num_processes)
+            self.__last_query_plan.output_num_processes = output_num_processes
+
+            if output_num_processes > 1:
+                self._save_rows_in_parallel(keep_row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict, out_file_path, output_num_processes, lines_per_chunk)
+            else:
+                # Write output (in chunks)
+                with open(out_file_path, 'wb') as out_file:
+                    out_file.write(b"\t".join(select_columns) + b"\n") # Header line
+                    _write_rows(out_file, rows, lines_per_chunk)
         else:
-            select_columns = []
+            sys.stdout.buffer.write(b"\t".join(select_columns) + b"\n") # Header line
 
-        # Store column indices and types in dictionaries so we only have to retrieve
-        # each once, even if we use the same column in multiple filters.
-        select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = self._get_column_meta(fltr._get_column_name_set(), select_columns)
+            for i, out_values in enumerate(rows):
+                if i > 0:
+                    sys.stdout.buffer.write(b"\n")
 
-        fltr._check_types(column_type_dict)
+                sys.stdout.buffer.write(b"\t".join(out_values))
 
-        has_index = len(glob.glob(self.data_file_path + ".idx_*")) > 0
+        return self.__last_query_plan
 
-        if has_index:
-#TODO: Remove this stuff if we don't need it after testing on huge files.
-#            sub_filters = fltr.get_sub_filters()
-
-#            if num_processes == 1 or len(sub_filters) == 1:
-            keep_row_indices = sorted(fltr._filter_indexed_column_values(self.data_file_path, self.get_num_rows(), num_processes))
-#            else:
-#                fltr_results_dict = {}
-
-##                for f in sub_filters:
-##                    fltr_results_dict[str(f)] = f.filter_indexed_column_values(self.data_file_path, self.compression_level, column_index_dict, column_type_dict, column_coords_dict, self.get_num_rows(), num_processes)
-
-                # This is a parallelization of the above code.
-                # At least in some cases, it slows things down more than it speeds things up.
-#                fltr_results = Parallel(n_jobs = num_processes)(delayed(f.filter_indexed_column_values)(self.data_file_path, self.compression_level, column_index_dict, column_type_dict, column_coords_dict, self.get_num_rows(), num_processes) for f in sub_filters)
-#                for i in range(len(sub_filters)):
-#                    fltr_results_dict[str(sub_filters[i])] = fltr_results[i]
-#
-#                keep_row_indices = sorted(fltr.filter_indexed_column_values_parallel(fltr_results_dict))
-        else:
-            if num_processes == 1:
-                row_indices = set(range(self.get_num_rows()))
-                keep_row_indices = sorted(fltr._filter_column_values(self.data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict))
-            else:
-                # Loop through the rows in parallel and find matching row indices.
-                keep_row_indices = sorted(chain.from_iterable(Parallel(n_jobs = num_processes)(delayed(fltr._filter_column_values)(self.data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict) for row_indices in self._generate_row_chunks(num_processes))))
+    def query(self, fltr, select_columns=None, batch_size=None, num_rows_per_scan=10000, limit=None, offset=0):
+        """
+        Query the data file using zero or more filters and iterate over the matching rows.
 
-        select_column_coords = [column_coords_dict[name] for name in select_columns]
+        Rows are produced lazily in row order. When no index is available, the data file is
+        scanned in blocks as rows are requested, so a consumer that stops early also stops the scan.
 
-        # This avoids having to check the decompression type each time we parse a value.
-        decompressor = f4py.get_decompressor(decompression_type, decompressor)
-        parse_function = self._get_parse_row_values_function(decompression_type)
+        Args:
+            fltr (BaseFilter): A filter.
+            select_columns (list): A list of strings that indicate the names of columns that should be selected. If this is an empty list, all columns will be selected (in the order they appear in the file).
+            batch_size (int): If specified, lists of up to this many rows are produced rather than individual rows.
+            num_rows_per_scan (int): The number of rows that are evaluated by the filter at a time (when no index is available).
+            limit (int): The maximum number of matching rows to produce.
+            offset (int): The number of matching rows to skip before producing rows.
+
+        Returns:
+            A generator of rows. Each row is a list of values (bytes) for the select columns.
+        """
+        _check_limit_and_offset(limit, offset)
+        select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = self._prepare_query(fltr, select_columns)
 
-        if out_file_path:
-            # Write output (in chunks)
-            with open(out_file_path, 'wb') as out_file:
-                out_file.write(b"\t".join(select_columns) + b"\n") # Header line
-                
-                out_lines = []
-                for row_index in keep_row_indices:
-                    out_values = parse_function(row_index, select_column_coords, decompression_type, decompressor, bigram_size_dict, select_columns)
-                    out_lines.append(b"\t".join(out_values))
-
-                    if len(out_lines) % lines_per_chunk == 0:
-                        out_file.write(b"\n".join(out_lines) + b"\n")
-                        out_lines = []
-
-                if len(out_lines) > 0:
-                    out_file.write(b"\n".join(out_lines) + b"\n")
-        else:
-            sys.stdout.buffer.write(b"\t".join(select_columns) + b"\n") # Header line
+        row_index_blocks = self._generate_keep_row_index_blocks(fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_rows_per_scan, limit, offset)
+        rows = self._generate_rows(chain.from_iterable(row_index_blocks), select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
 
-            for row_index in keep_row_indices:
-                out_values = parse_function(row_index, select_column_coords, decompression_type, decompressor, bigram_size_dict, select_columns)
-                sys.stdout.buffer.write(b"\t".join(out_values))
+        if not batch_size:
+            return rows
 
-                if row_index != keep_row_indices[-1]:
-                    sys.stdout.buffer.write(b"\n")
+        return self._generate_batches(rows, batch_size)
+
+    def query_to_numpy(self, fltr, select_columns=None, num_processes=1, limit=None, offset=0):
+        """
+        Query the data file and return the values for the select columns as NumPy arrays.
+
+        The arrays are built directly from the fixed-width values in the data file using the stored column types.
+
+        Args:
+            fltr (BaseFilter): A filter.
+            select_columns (list): A list of strings that indicate the names of columns that should be selected. If this is an empty list, all columns will be selected.
+            num_processes (int or str): The number of processes used to find matching rows (or "auto").
+            limit (int): The maximum number of matching rows to return.
+            offset (int): The number of matching rows to skip.
+
+        Returns:
+            A dictionary with column names as keys and arrays as values. Integer columns become int64 arrays, float columns
+            become float64 arrays, and string columns become byte-string arrays. Binary-encoded columns keep their stored
+            type and, when the matching rows are contiguous, refer to the data file rather than copying it.
+        """
+        select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = self._prepare_query(fltr, select_columns)
+
+        keep_row_indices = self._get_keep_row_indices(fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_processes, limit, offset)
+        column_values = self._get_converted_column_values(keep_row_indices, select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        return {column_name.decode(): values for column_name, values in zip(select_columns, column_values)}
+
+    def query_to_pandas(self, fltr, select_columns=None, num_processes=1, limit=None, offset=0):
+        """
+        Query the data file and return the values for the select columns as a pandas DataFrame.
+
+        This function accepts the same arguments as query_to_numpy. String values are decoded as UTF-8. pandas must be installed.
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            raise Exception("pandas must be installed to use query_to_pandas.")
+
+        columns = self.query_to_numpy(fltr, select_columns, num_processes, limit, offset)
+
+        return pd.DataFrame({column_name: _decode_column_values(values) for column_name, values in columns.items()}, copy=False)
+
+    def query_to_arrow(self, fltr, select_columns=None, num_processes=1, limit=None, offset=0):
+        """
+        Query the data file and return the values for the select columns as a pyarrow Table.
+
+        This function accepts the same arguments as query_to_numpy. String values are decoded as UTF-8. pyarrow must be installed.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise Exception("pyarrow must be installed to use query_to_arrow.")
+
+        columns = self.query_to_numpy(fltr, select_columns, num_processes, limit, offset)
+
+        return pa.table({column_name: pa.array(np.ascontiguousarray(_decode_column_values(values))) for column_name, values in columns.items()})
 
     def head(self, n = 10, select_columns=None, out_file_path=None, out_file_type="tsv"):
         if not select_columns:
             select_columns = []
-        self.query_and_save(f4py.HeadFilter(n, select_columns), select_columns, out_file_path=out_file_path, out_file_type=out_file_type)
+        self.query_and_save(f4py.NoFilter(), select_columns, out_file_path=out_file_path, out_file_type=out_file_type, limit=n)
 
     def tail(self, n = 10, select_columns=None, out_file_path=None, out_file_type="tsv"):
         if not select_columns:
             select_columns = []
         self.query_and_save(f4py.TailFilter(n, select_columns), select_columns, out_file_path=out_file_path, out_file_type=out_file_type)
 
+    def get_last_query_plan(self):
+        """
+        Returns a QueryPlan object that describes how the most recent query was executed.
+        """
+        return self.__last_query_plan
+
+    def get_column_stats(self, column_name):
+        """
+        Returns statistics about the values in a column, which were calculated when the F4 file was built.
+
+        Args:
+            column_name (str): The name of a column.
+
+        Returns:
+            A dictionary with the minimum (min) and maximum (max) values, the number of empty values (num_empty),
+            the approximate number of distinct values (num_distinct), and the boundaries of an equi-depth
+            histogram (histogram). Values are bytes for string columns and numbers for numeric columns.
+        """
+        column_stats = self._get_column_stats_dict().get(column_name.encode())
+
+        if column_stats is None:
+            raise Exception(f"No statistics are available for a column named {column_name}.")
+
+        return column_stats
+
     def get_num_rows(self):
-        return int(len(self.__file_handles[""]) / self.__stats[".ll"])
-        #return self.__stats[".nrow"]
+        if ".nrow" not in self.__stats:
+            self.__stats[".nrow"] = self._read_count(".nrow", lambda: int(len(self.__file_handles[""]) / self.__stats[".ll"]))
+
+        return self.__stats[".nrow"]
 
     def get_num_cols(self):
-        return int(len(self.__file_handles[".cc"]) / self.__stats[".mccl"]) - 1
-        #return self.__stats[".ncol"]
+        if ".ncol" not in self.__stats:
+            self.__stats[".ncol"] = self._read_count(".ncol", lambda: int(len(self.__file_handles[".cc"]) / self.__stats[".mccl"]) - 1)
+
+        return self.__stats[".ncol"]
 
     def get_column_type_from_name(self, column_name):
         try:
@@ -176,17 +264,211 @@ class Parser:
 
     def _set_file_handle(self, ext):
         if ext not in self.__file_handles:
-            self.__file_handles[ext] = f4py.open_read_file(self.data_file_path, ext)
+            self.__file_handles[ext] = f4py.open_cached_read_file(self.data_file_path, ext)
 
         return self._get_file_handle(ext)
 
     def _get_stat(self, ext):
         return self.__stats[ext]
 
+    def _read_count(self, ext, calculate_count):
+        # Builder saves the numbers of rows and columns. Files from older versions of this package (and
+        # the files that parsers use for indexes) do not have them, so they are calculated from the file sizes.
+        if f4py.file_exists(self.data_file_path, ext):
+            return f4py.read_cached_int_from_file(self.data_file_path, ext)
+
+        return calculate_count()
+
+    def _get_parallel(self, num_processes, prefer="processes"):
+        # Reusing the same workers means that repeated queries do not pay process startup and import costs.
+        if self.__parallel is None or self.__parallel_key != (num_processes, prefer):
+            if self.__parallel:
+                self.__parallel.__exit__(None, None, None)
+
+            self.__parallel = Parallel(n_jobs=num_processes, prefer=prefer)
+            self.__parallel_key = (num_processes, prefer)
+            self.__parallel.__enter__()
+
+        return self.__parallel
+
     ##############################################
     # Non-public functions
     ##############################################
 
+    def _prepare_query(self, fltr, select_columns):
+        if not fltr:
+            raise Exception("A filter must be specified.")
+
+        if not isinstance(fltr, f4py.NoFilter):
+            raise Exception("An object that inherits from NoFilter must be specified.")
+
+        if select_columns:
+            if not isinstance(select_columns, list):
+                raise Exception("You must specify select_column as a list.")
+        else:
+            select_columns = []
+
+        # Store column indices and types in dictionaries so we only have to retrieve
+        # each once, even if we use the same column in multiple filters.
+        select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict = self._get_column_meta(fltr._get_column_name_set(), select_columns)
+
+        fltr._check_types(column_type_dict)
+
+        return select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict
+
+    def _get_column_stats_dict(self):
+        if self.__column_stats_dict is None:
+            self.__column_stats_dict = {}
+            stats_file_path = f"{self.data_file_path}.stats"
+
+            # F4 files that were built with a schema (or an older version of this package) have no statistics.
+            if f4py.file_exists(stats_file_path):
+                for column_name, column_stats in f4py.deserialize(f4py.read_bytes_from_file(stats_file_path)).items():
+                    self.__column_stats_dict[column_name.encode()] = column_stats
+
+        return self.__column_stats_dict
+
+    def _get_keep_row_indices(self, fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_processes, limit=None, offset=0):
+        if num_processes != "auto" and (not isinstance(num_processes, int) or num_processes < 1):
+            raise Exception("The num_processes value must be a positive integer or auto.")
+
+        _check_limit_and_offset(limit, offset)
+
+        self.__last_query_plan = f4py.QueryPlan(self.get_num_rows())
+        keep_row_indices = self._find_keep_row_indices(fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_processes, limit, offset, self.__last_query_plan)
+        self.__last_query_plan.num_matching_rows = len(keep_row_indices)
+
+        return keep_row_indices
+
+    def _find_keep_row_indices(self, fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_processes, limit, offset, query_plan):
+        if fltr._excluded_by_stats(self._get_column_stats_dict()):
+            # No row can pass the filter, so there is no need to read the data or indexes.
+            query_plan.excluded_by_stats = True
+            return f4py.RowSet()
+
+        if fltr._excluded_by_bloom_filters(self.data_file_path):
+            query_plan.excluded_by_bloom_filters = True
+            return f4py.RowSet()
+
+        has_index = fltr._has_index(self.data_file_path, column_type_dict)
+        query_plan.scan_backend = "serial"
+
+        if has_index:
+            # Index lookups (and any scans of the rows they leave) are done in this process, regardless of num_processes.
+            query_plan.used_index = True
+        else:
+            query_plan.estimated_scan_cost = self.get_num_rows() * fltr._get_scan_cost(column_coords_dict, decompression_type)
+
+        if limit is not None or offset:
+            # The data file is scanned in blocks (in this process, regardless of num_processes) so we can stop once enough matching rows have been found.
+            if not has_index:
+                query_plan.rows_per_chunk = _NUM_ROWS_PER_LIMITED_SCAN
+                query_plan.limited_scan = True
+
+            return f4py.RowSet.union_all(list(self._generate_keep_row_index_blocks(fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, _NUM_ROWS_PER_LIMITED_SCAN, limit, offset)))
+
+        if has_index:
+            return fltr._filter_indexed_column_values(self.data_file_path, self.get_num_rows(), 1, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        prefer = "processes"
+        if num_processes == "auto":
+            # Vectorized filters spend most of their time in NumPy, which releases the GIL, so threads
+            # are sufficient and avoid the overhead of processes.
+            num_processes = f4py.choose_num_processes(query_plan.estimated_scan_cost, _MIN_SCAN_COST_PER_PROCESS)
+            prefer = "threads" if fltr._is_vectorized(column_coords_dict, decompression_type) else "processes"
+
+        if num_processes == 1 or self.get_num_rows() == 0:
+            row_indices = f4py.RowSet(start=0, end=self.get_num_rows())
+            return fltr._filter_column_values(self.data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+        query_plan.scan_backend = prefer
+        query_plan.scan_num_processes = num_processes
+        query_plan.rows_per_chunk = math.ceil(self.get_num_rows() / num_processes)
+
+        # Loop through the rows in parallel. Each process receives only the start and end of a range
+        # of rows and marks the passing rows in a file-backed mask that all the processes share.
+        with tempfile.TemporaryDirectory(dir=_get_shared_memory_dir_path()) as tmp_dir_path:
+            mask_file_path = os.path.join(tmp_dir_path, "mask")
+            passing_mask = np.memmap(mask_file_path, dtype=bool, mode="w+", shape=(self.get_num_rows(),))
+
+            self._get_parallel(num_processes, prefer)(delayed(_mark_passing_rows)(fltr, self.data_file_path, row_indices.start, row_indices.end, column_coords_dict, decompression_type, decompressor, bigram_size_dict, mask_file_path) for row_indices in self._generate_row_blocks(query_plan.rows_per_chunk))
+
+            keep_row_indices = f4py.RowSet(np.flatnonzero(passing_mask), is_sorted=True)
+            del passing_mask
+
+        return keep_row_indices
+
+    def _generate_keep_row_index_blocks(self, fltr, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, num_rows_per_scan, limit=None, offset=0):
+        # The limit and offset must already have been checked (this is a generator, so errors would not be raised until it is used).
+        if limit == 0 or fltr._excluded_by_stats(self._get_column_stats_dict()) or fltr._excluded_by_bloom_filters(self.data_file_path):
+            return
+
+        if fltr._has_index(self.data_file_path, column_type_dict):
+            # This is the number of matching rows we need to find. None means all of them.
+            max_num_rows = None if limit is None else offset + limit
+            row_index_blocks = [fltr._filter_indexed_column_values(self.data_file_path, self.get_num_rows(), 1, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict, max_num_rows)]
+        else:
+            row_index_blocks = (fltr._filter_column_values(self.data_file_path, row_indices, column_coords_dict, decompression_type, decompressor, bigram_size_dict) for row_indices in self._generate_row_blocks(num_rows_per_scan))
+
+        # Skip the first offset matching rows and stop scanning once enough matching rows have been found.
+        num_rows_to_skip = offset
+        num_rows_to_keep = limit
+
+        for row_indices in row_index_blocks:
+            num_block_rows = len(row_indices)
+            row_indices = row_indices.slice(num_rows_to_skip, None if num_rows_to_keep is None else num_rows_to_skip + num_rows_to_keep)
+            num_rows_to_skip = max(0, num_rows_to_skip - num_block_rows)
+
+            if len(row_indices) > 0:
+                yield row_indices
+
+            if num_rows_to_keep is not None:
+                num_rows_to_keep -= len(row_indices)
+
+                if num_rows_to_keep == 0:
+                    break
+
+    def _generate_rows(self, row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
+        select_column_coords = [column_coords_dict[name] for name in select_columns]
+
+        # This avoids having to check the decompression type each time we parse a value.
+        decompressor = f4py.get_decompressor(decompression_type, decompressor)
+        parse_function = self._get_parse_row_values_function(decompression_type, select_column_coords)
+
+        for row_index in row_indices:
+            yield parse_function(row_index, select_column_coords, decompression_type, decompressor, bigram_size_dict, select_columns)
+
+    def _save_rows_in_parallel(self, keep_row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict, out_file_path, num_processes, lines_per_chunk):
+        # Each process decompresses and formats a contiguous range of the matching rows.
+        # The resulting chunks are then stitched together in order.
+        rows_per_chunk = math.ceil(len(keep_row_indices) / num_processes)
+        row_index_chunks = [keep_row_indices.slice(i, i + rows_per_chunk) for i in range(0, len(keep_row_indices), rows_per_chunk)]
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_file_path))) as tmp_dir_path:
+            chunk_file_paths = [os.path.join(tmp_dir_path, str(i)) for i in range(len(row_index_chunks))]
+
+            self._get_parallel(num_processes)(delayed(_save_rows_chunk)(self.data_file_path, row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict, chunk_file_path, lines_per_chunk) for row_indices, chunk_file_path in zip(row_index_chunks, chunk_file_paths))
+
+            with open(out_file_path, 'wb') as out_file:
+                out_file.write(b"\t".join(select_columns) + b"\n") # Header line
+
+                for chunk_file_path in chunk_file_paths:
+                    with open(chunk_file_path, 'rb') as chunk_file:
+                        shutil.copyfileobj(chunk_file, out_file)
+
+    def _generate_batches(self, rows, batch_size):
+        batch = []
+
+        for row in rows:
+            batch.append(row)
+
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if len(batch) > 0:
+            yield batch
+
     def _get_column_type_from_index(self, column_index):
         #return next(self.__parse_data_values(column_index, 2, [[0, 1]], self.__file_handles[".ct"])).decode()
         return next(self._parse_data_values(column_index, 1, [[0, 1]], self.__file_handles[".ct"])).decode()
@@ -195,7 +477,7 @@ class Parser:
         column_type_dict = {}
         column_coords_dict = {}
         column_index_name_dict = {}
-        #column_name_index_dict = {} #TODO
+        column_name_index_dict = {}
 
         if len(select_columns) == 0:
             with f4py.Parser(self.data_file_path + ".cn", fixed_file_extensions=["", ".cc"], stats_file_extensions=[".ll", ".mccl"]) as cn_parser:
@@ -207,10 +489,7 @@ class Parser:
                     column_index = fastnumbers.fast_int(values[1])
 
                     column_index_name_dict[column_index] = column_name
-                    #column_name_index_dict[column_name] = column_index
-
-                    if column_name in filter_column_set:
-                        column_type_dict[column_name] = row_index
+                    column_name_index_dict[column_name] = column_index
 
                 all_coords = self._parse_data_coords(range(self.get_num_cols()))
                 for row_index in range(self.get_num_cols()):
@@ -218,18 +497,20 @@ class Parser:
 
             all_columns = [x[1] for x in sorted(column_index_name_dict.items())]
             select_columns = all_columns
+
+            for column_name in all_columns:
+                column_type_dict[column_name] = self._get_column_type_from_index(column_name_index_dict[column_name])
         else:
             with f4py.IndexSearcher._get_index_parser(f"{self.data_file_path}.cn") as index_parser:
                 select_columns = [name.encode() for name in select_columns]
                 all_columns = list(filter_column_set | set(select_columns))
 
-                column_name_index_dict = {}
                 for column_name in all_columns:
                     column_index = self._get_column_index_from_name(index_parser, column_name.decode())
                     column_name_index_dict[column_name] = column_index
                     column_index_name_dict[column_index] = column_name
 
-                for column_name in filter_column_set:
+                for column_name in all_columns:
                     column_type_dict[column_name] = self._get_column_type_from_index(column_name_index_dict[column_name])
 
             all_column_indices = [column_name_index_dict[name] for name in all_columns]
@@ -238,12 +519,23 @@ class Parser:
             for i, column_name in enumerate(all_columns):
                 column_coords_dict[column_name] = all_coords[i]
 
+        # For binary-encoded columns, the struct format is stored as a third coordinate.
+        encodings_file_path = f"{self.data_file_path}.ce"
+        if f4py.file_exists(encodings_file_path):
+            encodings = f4py.read_str_from_file(encodings_file_path)
+
+            for column_name, coords in column_coords_dict.items():
+                encoding = encodings[column_name_index_dict[column_name]:(column_name_index_dict[column_name] + 1)]
+
+                if encoding != b"t":
+                    coords.append("<" + encoding.decode())
+
         decompression_type = None
         decompressor = None
         bigram_size_dict = {}
         decompressor_file_path = f"{self.data_file_path}.cmpr"
 
-        if os.path.exists(decompressor_file_path):
+        if f4py.file_exists(decompressor_file_path):
             decompression_text = f4py.read_str_from_file(decompressor_file_path)
 
             if decompression_text == b"z":
@@ -260,20 +552,9 @@ class Parser:
 
         return select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict
 
-    def _generate_row_chunks(self, num_processes):
-        rows_per_chunk = math.ceil(self.get_num_rows() / num_processes)
-
-        row_indices = set()
-
-        for row_index in range(self.get_num_rows()):
-            row_indices.add(row_index)
-
-            if len(row_indices) == rows_per_chunk:
-                yield row_indices
-                row_indices = set()
-
-        if len(row_indices) > 0:
-            yield row_indices
+    def _generate_row_blocks(self, rows_per_block):
+        for start_index in range(0, self.get_num_rows(), rows_per_block):
+            yield f4py.RowSet(start=start_index, end=min(start_index + rows_per_block, self.get_num_rows()))
 
     def _parse_data_coords(self, indices):
         data_coords = []
@@ -306,6 +587,43 @@ class Parser:
 
         return data_coords
 
+    def _get_column_view(self, column_coords):
+        # This array refers directly to the (uncompressed) data file, so no values are copied.
+        # Binary-encoded columns get a numeric type; other columns are fixed-width byte strings.
+        dtype = np.dtype(column_coords[2]) if len(column_coords) > 2 else np.dtype(f"S{column_coords[1] - column_coords[0]}")
+
+        return np.ndarray(shape=(self.get_num_rows(),), dtype=dtype, buffer=self.__file_handles[""], offset=column_coords[0], strides=(self.__stats[".ll"],))
+
+    def _get_converted_column_values(self, row_indices, select_columns, column_type_dict, column_coords_dict, decompression_type, decompressor, bigram_size_dict):
+        if decompression_type:
+            # Compressed values must be parsed one row at a time.
+            rows = self._generate_rows(row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+            column_values = list(zip(*rows)) if len(row_indices) > 0 else [[] for column_name in select_columns]
+            column_values = [np.array(values, dtype=bytes) for values in column_values]
+        else:
+            column_values = [self._get_column_values(column_coords_dict[column_name], row_indices) for column_name in select_columns]
+
+        return [_convert_column_values(values, column_type_dict[column_name]) for column_name, values in zip(select_columns, column_values)]
+
+    def _get_column_values(self, column_coords, row_indices):
+        if len(row_indices) == 0:
+            return self._get_column_view(column_coords)[:0].copy()
+
+        if len(column_coords) > 2 and row_indices.is_range():
+            # This array has its own memory map, so it remains valid after this parser is closed.
+            data = np.memmap(self.data_file_path, dtype=np.uint8, mode="r")
+            line_length = self.__stats[".ll"]
+
+            return np.ndarray(shape=(len(row_indices),), dtype=np.dtype(column_coords[2]), buffer=data, offset=row_indices.start * line_length + column_coords[0], strides=(line_length,))
+
+        # The column view refers to this parser's memory map, so we copy the selected values.
+        column_view = self._get_column_view(column_coords)
+
+        if row_indices.is_range():
+            return column_view[row_indices.start:row_indices.end].copy()
+
+        return column_view[row_indices.to_array()]
+
     def _parse_data_value(self, start_element, segment_length, coords, str_like_object):
         start_pos = start_element * segment_length
 
@@ -317,8 +635,10 @@ class Parser:
         for coords in data_coords:
             yield str_like_object[(start_pos + coords[0]):(start_pos + coords[1])].rstrip(b" ")
 
-    def _get_parse_row_value_function(self, decompression_type):
-        if not decompression_type:
+    def _get_parse_row_value_function(self, decompression_type, column_coords=None, as_number=False):
+        if column_coords and len(column_coords) > 2:
+            return self._parse_encoded_row_value if as_number else self._parse_encoded_row_value_as_text
+        elif not decompression_type:
             return self._parse_row_value
         elif decompression_type == "zstd":
             return self._parse_zstd_compressed_row_value
@@ -360,8 +680,20 @@ class Parser:
         value = self._parse_data_value(row_index, line_length, column_coords, file_handle).rstrip(b" ")
         return f4py.decompress(value, decompressor[column_name], bigram_size_dict[column_name])
 
-    def _get_parse_row_values_function(self, decompression_type):
-        if not decompression_type:
+    def _parse_encoded_row_value(self, row_index, column_coords, line_length, file_handle, decompression_type=None, decompressor=None, bigram_size_dict=None, column_name=None):
+        if decompression_type == "zstd":
+            line = decompressor.decompress(self._parse_data_value(row_index, line_length, [0, line_length], file_handle))
+            return struct.unpack_from(column_coords[2], line, column_coords[0])[0]
+
+        return struct.unpack_from(column_coords[2], file_handle, row_index * line_length + column_coords[0])[0]
+
+    def _parse_encoded_row_value_as_text(self, row_index, column_coords, line_length, file_handle, decompression_type=None, decompressor=None, bigram_size_dict=None, column_name=None):
+        return str(self._parse_encoded_row_value(row_index, column_coords, line_length, file_handle, decompression_type, decompressor, bigram_size_dict, column_name)).encode()
+
+    def _get_parse_row_values_function(self, decompression_type, column_coords=None):
+        if column_coords and any([len(coords) > 2 for coords in column_coords]):
+            return self._parse_encoded_row_values
+        elif not decompression_type:
             return self._parse_row_values
         elif decompression_type == "zstd":
             return self._parse_zstd_compressed_row_values
@@ -382,9 +714,24 @@ class Parser:
             values = list(self._parse_data_values(row_index, self.__stats[".ll"], column_coords, self.__file_handles[""]))
             return [f4py.decompress(values.pop(0), decompressor[column_name], bigram_size_dict[column_name]) for column_name in column_names]
 
+    def _parse_encoded_row_values(self, row_index, column_coords, decompression_type=None, decompressor=None, bigram_size_dict=None, column_names=None):
+        line_length = self.__stats[".ll"]
+        line = self._parse_data_value(row_index, line_length, [0, line_length], self.__file_handles[""])
+
+        if decompression_type == "zstd":
+            line = decompressor.decompress(line)
+
+        values = []
+        for coords in column_coords:
+            if len(coords) > 2:
+                values.append(str(struct.unpack_from(coords[2], line, coords[0])[0]).encode())
+            else:
+                values.append(line[coords[0]:coords[1]].rstrip(b" "))
+
+        return values
+
     def _get_decompression_dict(self, file_path, column_index_name_dict):
-        with open(file_path, "rb") as cmpr_file:
-            return f4py.deserialize(cmpr_file.read())
+        return f4py.deserialize(f4py.read_bytes_from_file(file_path))
 
     #     compression_dict = {}
     #     with open(file_path, "rb") as cmpr_file:
@@ -440,4 +787,87 @@ class Parser:
     #         for compressed_value, value in decompression_dict[select_column]["map"].items():
     #             inverted_dict[select_column]["map"][value] = compressed_value
     #
-    #     return inverted_dict
\ No newline at end of file
+    #     return inverted_dict
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# Output is only formatted in parallel when each process would get at least this many rows.
+_MIN_ROWS_PER_OUTPUT_PROCESS = 1000
+
+# When num_processes is auto, each worker should have at least this much work (in bytes that must be evaluated).
+_MIN_SCAN_COST_PER_PROCESS = 64 * 1024 * 1024
+
+# When a limit or offset is specified, this many rows are evaluated at a time, so the scan can stop once enough matching rows have been found.
+_NUM_ROWS_PER_LIMITED_SCAN = 10000
+
+def _check_limit_and_offset(limit, offset):
+    if limit is not None and (not isinstance(limit, int) or limit < 0):
+        raise Exception("The limit must be a non-negative integer.")
+
+    if not isinstance(offset, int) or offset < 0:
+        raise Exception("The offset must be a non-negative integer.")
+
+def _choose_output_num_processes(num_rows, num_processes):
+    if num_processes == "auto":
+        return f4py.choose_num_processes(num_rows, _MIN_ROWS_PER_OUTPUT_PROCESS)
+
+    if num_processes > 1 and num_rows >= num_processes * _MIN_ROWS_PER_OUTPUT_PROCESS:
+        return num_processes
+
+    return 1
+
+def _write_rows(out_file, rows, lines_per_chunk):
+    out_lines = []
+    for out_values in rows:
+        out_lines.append(b"\t".join(out_values))
+
+        if len(out_lines) % lines_per_chunk == 0:
+            out_file.write(b"\n".join(out_lines) + b"\n")
+            out_lines = []
+
+    if len(out_lines) > 0:
+        out_file.write(b"\n".join(out_lines) + b"\n")
+
+def _get_shared_memory_dir_path():
+    # On Linux, files in /dev/shm are kept in memory.
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+def _mark_passing_rows(fltr, data_file_path, start_index, end_index, column_coords_dict, decompression_type, decompressor, bigram_size_dict, mask_file_path):
+    # This function is run in a separate process.
+    row_indices = fltr._filter_column_values(data_file_path, f4py.RowSet(start=start_index, end=end_index), column_coords_dict, decompression_type, decompressor, bigram_size_dict)
+
+    if len(row_indices) > 0:
+        passing_mask = np.memmap(mask_file_path, dtype=bool, mode="r+", offset=start_index, shape=(end_index - start_index,))
+        passing_mask[row_indices.to_array() - start_index] = True
+        passing_mask.flush()
+
+def _save_rows_chunk(data_file_path, row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict, chunk_file_path, lines_per_chunk):
+    # This function is run in a separate process, so it opens its own parser.
+    with Parser(data_file_path) as parser:
+        with open(chunk_file_path, 'wb') as chunk_file:
+            _write_rows(chunk_file, parser._generate_rows(row_indices, select_columns, column_coords_dict, decompression_type, decompressor, bigram_size_dict), lines_per_chunk)
+
+def _convert_column_values(values, column_type):
+    # Binary-encoded values already have a numeric type.
+    if values.dtype.kind != "S":
+        return values
+
+    if column_type == "s":
+        return np.char.rstrip(values, b" ")
+
+    if column_type == "f":
+        return values.astype(np.float64)
+
+    try:
+        return values.astype(np.int64)
+    except OverflowError:
+        # Some integers are too large for int64, so we keep them as Python integers.
+        return np.array([fastnumbers.fast_int(value) for value in values], dtype=object)
+
+def _decode_column_values(values):
+    if values.dtype.kind == "S":
+        return np.char.decode(values, "utf-8")
+
+    return values
@@ -0,0 +1,34 @@
+class QueryPlan:
+    """
+    This class describes how a query was executed. It is returned by Parser.query_and_save and is
+    also available from Parser.get_last_query_plan. It is mainly useful for tuning num_processes.
+
+    Attributes:
+        num_rows (int): The number of rows in the data file.
+        excluded_by_stats (bool): Whether the column statistics showed that no rows could pass the filter, so neither the data file nor indexes were read.
+        excluded_by_bloom_filters (bool): Whether Bloom filters showed that no rows could pass the filter, so neither the data file nor indexes were read.
+        used_index (bool): Whether matching rows were found using an index rather than by scanning the data file.
+        scan_backend (str): How the data file was scanned: serial, threads or processes. When an index is used, the index (and any rows it does not rule out) is searched serially.
+        scan_num_processes (int): The number of workers (threads or processes) used to scan the data file.
+        rows_per_chunk (int): The number of rows evaluated at a time by each worker.
+        limited_scan (bool): Whether the data file was scanned in blocks in a single process (even if num_processes was greater than one or auto) because a limit or offset was specified, so the scan could stop once enough matching rows were found.
+        estimated_scan_cost (int): The estimated number of bytes that needed to be evaluated to scan the data file (None if an index was used).
+        num_matching_rows (int): The number of rows that passed the filter (after applying limit and offset).
+        output_num_processes (int): The number of processes used to format the output.
+    """
+    def __init__(self, num_rows):
+        self.num_rows = num_rows
+        self.excluded_by_stats = False
+        self.excluded_by_bloom_filters = False
+        self.used_index = False
+        self.scan_backend = None
+        self.scan_num_processes = 1
+        self.rows_per_chunk = num_rows
+        self.limited_scan = False
+        self.estimated_scan_cost = None
+        self.num_matching_rows = None
+        self.output_num_processes = 1
+
+    def __repr__(self):
+        attributes = ", ".join([f"{name}={value!r}" for name, value in self.__dict__.items()])
+        return f"QueryPlan({attributes})"
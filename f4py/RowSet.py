@@ -0,0 +1,146 @@
+import numpy as np
+
+class RowSet:
+    """
+    This class stores a set of row indices compactly and iterates over them in sorted order.
+    Contiguous rows are stored as a range (two integers). Other rows are stored as a sorted
+    array of unsigned integers, which uses much less memory than a Python set.
+
+    Args:
+        row_indices: An iterable or NumPy array of row indices. If None, the range from start to end is used.
+        start (int): The first row index in the range (used only when row_indices is None).
+        end (int): One more than the last row index in the range (used only when row_indices is None).
+        is_sorted (bool): Whether row_indices are already sorted and unique, in which case sorting is skipped.
+    """
+    def __init__(self, row_indices=None, start=0, end=0, is_sorted=False):
+        self.start = None
+        self.end = None
+        self.indices = None
+
+        if row_indices is None:
+            self._set_range(start, end)
+        else:
+            if not isinstance(row_indices, np.ndarray):
+                row_indices = np.fromiter(row_indices, dtype=np.int64)
+
+            if not is_sorted:
+                row_indices = np.unique(row_indices)
+
+            self._set_indices(row_indices)
+
+    def __len__(self):
+        if self.indices is None:
+            return self.end - self.start
+
+        return len(self.indices)
+
+    def __iter__(self):
+        if self.indices is None:
+            yield from range(self.start, self.end)
+        else:
+            # Convert to Python integers in blocks to limit memory use.
+            for block_start in range(0, len(self.indices), _ITERATION_BLOCK_SIZE):
+                yield from self.indices[block_start:(block_start + _ITERATION_BLOCK_SIZE)].tolist()
+
+    def __and__(self, other):
+        if self.is_range() and other.is_range():
+            return RowSet(start=max(self.start, other.start), end=min(self.end, other.end))
+
+        if self.is_range():
+            return other._select_within_range(self.start, self.end)
+
+        if other.is_range():
+            return self._select_within_range(other.start, other.end)
+
+        return RowSet(np.intersect1d(self.indices, other.indices, assume_unique=True), is_sorted=True)
+
+    def __or__(self, other):
+        if len(self) == 0:
+            return other
+
+        if len(other) == 0:
+            return self
+
+        # Overlapping or adjacent ranges can be combined without materializing them.
+        if self.is_range() and other.is_range() and self.start <= other.end and other.start <= self.end:
+            return RowSet(start=min(self.start, other.start), end=max(self.end, other.end))
+
+        return RowSet(np.union1d(self.to_array(), other.to_array()), is_sorted=True)
+
+    def __sub__(self, other):
+        if len(self) == 0 or len(other) == 0:
+            return self
+
+        if other.is_range():
+            if self.is_range() and (other.start <= self.start or other.end >= self.end):
+                # The result is still one range.
+                if other.start <= self.start:
+                    return RowSet(start=max(self.start, min(self.end, other.end)), end=self.end)
+
+                return RowSet(start=self.start, end=min(self.end, other.start))
+
+            indices = self.to_array()
+            return RowSet(indices[(indices < other.start) | (indices >= other.end)], is_sorted=True)
+
+        return RowSet(np.setdiff1d(self.to_array(), other.indices, assume_unique=True), is_sorted=True)
+
+    def is_range(self):
+        return self.indices is None
+
+    def to_array(self):
+        if self.indices is None:
+            return np.arange(self.start, self.end, dtype=_get_dtype(self.end))
+
+        return self.indices
+
+    def slice(self, start, stop=None):
+        # Select row indices by their (sorted) position, like slicing a list.
+        if self.indices is None:
+            stop = len(self) if stop is None else min(stop, len(self))
+            return RowSet(start=self.start + start, end=self.start + stop)
+
+        return RowSet(self.indices[start:stop], is_sorted=True)
+
+    def union_all(row_sets):
+        # This is faster than combining many row sets one pair at a time.
+        row_sets = [row_set for row_set in row_sets if len(row_set) > 0]
+
+        if len(row_sets) == 0:
+            return RowSet()
+
+        if len(row_sets) == 1:
+            return row_sets[0]
+
+        return RowSet(np.concatenate([row_set.to_array() for row_set in row_sets]))
+
+    def from_bitmap(bitmap, num_rows):
+        # The bitmap has one bit per row (packed into bytes), with the first row in the lowest bit.
+        return RowSet(np.flatnonzero(np.unpackbits(bitmap, count=num_rows, bitorder="little")), is_sorted=True)
+
+    def _set_range(self, start, end):
+        self.start = start
+        self.end = max(start, end)
+        self.indices = None
+
+    def _set_indices(self, sorted_indices):
+        if len(sorted_indices) == 0:
+            self._set_range(0, 0)
+        elif int(sorted_indices[-1]) - int(sorted_indices[0]) + 1 == len(sorted_indices):
+            self._set_range(int(sorted_indices[0]), int(sorted_indices[-1]) + 1)
+        else:
+            self.indices = sorted_indices.astype(_get_dtype(int(sorted_indices[-1])), copy=False)
+
+    def _select_within_range(self, start, end):
+        lower_position, upper_position = np.searchsorted(self.indices, [start, end])
+
+        return RowSet(self.indices[lower_position:upper_position], is_sorted=True)
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# The number of row indices that are converted to Python integers at a time during iteration.
+_ITERATION_BLOCK_SIZE = 100000
+
+def _get_dtype(max_row_index):
+    return np.uint32 if max_row_index < 2 ** 32 else np.uint64
@@ -1,8 +1,13 @@
 import datetime
 import gzip
 import fastnumbers
+import glob
 import math
 import mmap
+import os
+from collections import OrderedDict
+import shutil
+import threading
 #TODO
 #import msgpack
 import msgspec
@@ -10,17 +15,185 @@ from operator import itemgetter
 import zstandard
 
 def open_read_file(file_path, file_extension=""):
-    the_file = open(file_path + file_extension, 'rb')
-    return mmap.mmap(the_file.fileno(), 0, prot=mmap.PROT_READ)
+    physical_file_path, location = _resolve_file(file_path + file_extension)
+
+    if isinstance(location, bytes):
+        # Small files are stored within the footer of a single-file F4 file.
+        handle = mmap.mmap(-1, len(location))
+        handle.write(location)
+        handle.seek(0)
+
+        return handle
+
+    with open(physical_file_path, 'rb') as the_file:
+        if location is None:
+            return mmap.mmap(the_file.fileno(), 0, prot=mmap.PROT_READ)
+
+        return mmap.mmap(the_file.fileno(), location[1], prot=mmap.PROT_READ, offset=location[0])
+
+def open_cached_read_file(file_path, file_extension=""):
+    # Memory maps are shared by everything in this process that reads the same file, so repeated
+    # queries and filters do not reopen it. Files are identified by inode, modification time and
+    # size, so a file that has been rewritten is opened again. Each call must be paired with a
+    # call to release_cached_read_file.
+    full_file_path = file_path + file_extension
+    file_key = _get_file_key(full_file_path)
+
+    with _file_cache_lock:
+        entry = _file_cache.get(file_key)
+
+        if entry is None:
+            _remove_stale_cache_entries(full_file_path)
+
+            entry = [file_key, open_read_file(full_file_path), 0]
+            _file_cache[file_key] = entry
+            _file_cache_entries_by_handle[id(entry[1])] = entry
+
+        _file_cache.move_to_end(file_key)
+        entry[2] += 1
+
+        _evict_cached_files()
+
+        return entry[1]
+
+def release_cached_read_file(handle):
+    with _file_cache_lock:
+        entry = _file_cache_entries_by_handle.get(id(handle))
+
+        if entry is None:
+            _close_read_file(handle)
+            return
+
+        entry[2] -= 1
+
+        if entry[2] == 0 and _file_cache.get(entry[0]) is not entry:
+            # This file was removed from the cache while it was still in use.
+            _close_cache_entry(entry)
+        else:
+            _evict_cached_files()
+
+def read_cached_int_from_file(file_path, file_extension=""):
+    # Small files (such as line lengths) are read when every parser is created, so we cache their values.
+    full_file_path = file_path + file_extension
+    file_key = _get_file_key(full_file_path)
+
+    return _get_cached_value("int", file_key, read_int_from_file, full_file_path)
+
+def read_cached_object_from_file(file_path, file_extension=""):
+    # Deserialized objects are shared, so they must not be modified.
+    full_file_path = file_path + file_extension
+    file_key = _get_file_key(full_file_path)
+
+    return _get_cached_value("object", file_key, _read_object_from_file, full_file_path)
+
+def set_max_cached_files(max_cached_files):
+    # Memory maps that are not currently in use are closed (least recently used first) once more
+    # than this many files are open. Specify 0 to close each file as soon as it is no longer in use.
+    global _max_cached_files
+
+    if not isinstance(max_cached_files, int) or max_cached_files < 0:
+        raise Exception("max_cached_files must be a non-negative integer.")
+
+    with _file_cache_lock:
+        _max_cached_files = max_cached_files
+        _evict_cached_files()
+
+def clear_file_cache(file_path=None):
+    # If file_path is specified, only files whose paths start with it are removed from the cache. Files
+    # are identified by their size and modification time, which may not change when a file is rewritten
+    # quickly, so this should be called before rewriting files that may have been read.
+    with _file_cache_lock:
+        for entry in list(_file_cache.values()):
+            if file_path is not None and not entry[0][0].startswith(file_path):
+                continue
+
+            if entry[2] == 0:
+                _close_cache_entry(entry)
+            else:
+                # This will be closed when it is released.
+                del _file_cache[entry[0]]
+
+        for value_key in list(_value_cache):
+            if file_path is None or value_key[1][0].startswith(file_path):
+                del _value_cache[value_key]
+
+def read_bytes_from_file(file_path, file_extension=""):
+    physical_file_path, location = _resolve_file(file_path + file_extension)
+
+    if isinstance(location, bytes):
+        return location
+
+    with open(physical_file_path, 'rb') as the_file:
+        if location is None:
+            return the_file.read()
+
+        return os.pread(the_file.fileno(), location[1], location[0])
 
 def read_str_from_file(file_path, file_extension=""):
-    with open(file_path + file_extension, 'rb') as the_file:
-        return the_file.read().rstrip()
+    return read_bytes_from_file(file_path, file_extension).rstrip()
+
+def file_exists(file_path, file_extension=""):
+    # This also finds files that are stored within a single-file F4 file.
+    try:
+        _resolve_file(file_path + file_extension)
+        return True
+    except FileNotFoundError:
+        return False
+
+def list_file_extensions(file_path, prefix):
+    # Find the extensions of files (such as indexes) that accompany an F4 file and start with prefix.
+    directory = _get_single_file_directory(file_path) if os.path.isfile(file_path) else None
+
+    if directory is not None:
+        return sorted([extension for extension in directory if extension.startswith(prefix)])
+
+    return sorted([path[len(file_path):] for path in glob.glob(glob.escape(file_path + prefix) + "*")])
+
+def is_single_file(file_path):
+    return os.path.isfile(file_path) and _get_single_file_directory(file_path) is not None
+
+def combine_into_single_file(f4_file_path):
+    # The data stay at the start of the file, so their positions do not change. The other files
+    # are appended (aligned so they can be memory mapped), and a footer indicates where each one
+    # is stored. Files smaller than the alignment are stored within the footer itself, so the
+    # metadata for small queries can be read all at once. If f4_file_path is already a single
+    # file, new files are added and a new footer is written (the old footer is no longer used).
+    directory = _get_single_file_directory(f4_file_path)
+    clear_file_cache(f4_file_path)
+
+    if directory is None:
+        directory = {"": [0, os.path.getsize(f4_file_path)]}
+    else:
+        directory = dict(directory)
+
+    file_paths = sorted([path for path in glob.glob(glob.escape(f4_file_path) + ".*") if path[len(f4_file_path):].startswith(_SINGLE_FILE_EXTENSIONS)])
+
+    with open(f4_file_path, "ab") as f4_file:
+        for path in file_paths:
+            size = os.path.getsize(path)
+
+            with open(path, "rb") as the_file:
+                if size < _SINGLE_FILE_ALIGNMENT:
+                    directory[path[len(f4_file_path):]] = the_file.read()
+                else:
+                    f4_file.write(b"\0" * (-f4_file.tell() % _SINGLE_FILE_ALIGNMENT))
+                    directory[path[len(f4_file_path):]] = [f4_file.tell(), size]
+                    shutil.copyfileobj(the_file, f4_file)
+
+        footer = serialize({"format_version": _SINGLE_FILE_FORMAT_VERSION, "files": directory})
+        f4_file.write(footer)
+        f4_file.write(len(footer).to_bytes(8, byteorder="little"))
+        f4_file.write(_SINGLE_FILE_MAGIC)
+
+    for path in file_paths:
+        os.unlink(path)
 
 def read_int_from_file(file_path, file_extension=""):
     return fastnumbers.fast_int(read_str_from_file(file_path, file_extension))
 
 def write_str_to_file(file_path, the_string):
+    clear_file_cache(file_path)
+
     with open(file_path, 'wb') as the_file:
         the_file.write(the_string)
 
@@ -50,6 +223,10 @@ def format_column_items(the_list, max_value_length, suffix=""):
     formatter = "{:<" + str(max_value_length) + "}" + suffix
     return [formatter.format(value.decode()).encode() for value in the_list]
 
+def choose_num_processes(amount_of_work, min_work_per_process):
+    # Use as many processes as there are CPUs, as long as each one has enough work to justify its overhead.
+    return max(1, min(os.cpu_count() or 1, int(amount_of_work // min_work_per_process)))
+
 def print_message(message, verbose=False):
     if verbose:
         print(f"{message} - {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S.%f')}")
@@ -130,4 +307,134 @@ def serialize(obj):
 
 def deserialize(msg):
     return msgspec.msgpack.decode(msg)
-#    return msgpack.unpackb(msg, strict_map_key=False)
\ No newline at end of file
+#    return msgpack.unpackb(msg, strict_map_key=False)
+
+#####################################################
+# Class functions (non-public)
+#####################################################
+
+# Each entry is a list: [file key, memory map, number of users].
+_file_cache = OrderedDict()
+_file_cache_entries_by_handle = {}
+_file_cache_lock = threading.RLock()
+_max_cached_files = 64
+
+_value_cache = {}
+_MAX_CACHED_VALUES = 10000
+
+# A single-file F4 file ends with a footer, the length of the footer (8 bytes), and this marker.
+_SINGLE_FILE_MAGIC = b"F4SINGLE"
+_SINGLE_FILE_FORMAT_VERSION = 1
+_SINGLE_FILE_ALIGNMENT = max(4096, mmap.ALLOCATIONGRANULARITY)
+_SINGLE_FILE_EXTENSIONS = (".cc", ".mccl", ".ll", ".ct", ".mctl", ".ce", ".cmpr", ".cn", ".nrow", ".ncol", ".stats", ".zm_", ".bf_", ".idx_", ".hidx_", ".bidx_", ".tidx_")
+
+# The footer is usually smaller than this, so it can be read along with the marker in one call.
+_FOOTER_READ_SIZE = 65536
+
+def _get_file_key(full_file_path):
+    physical_file_path = _resolve_file(full_file_path)[0]
+    file_stat = os.stat(physical_file_path)
+
+    return (full_file_path, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+def _read_object_from_file(full_file_path):
+    return deserialize(read_bytes_from_file(full_file_path))
+
+def _get_cached_value(value_type, file_key, get_value_function, *args):
+    with _file_cache_lock:
+        if (value_type, file_key) in _value_cache:
+            return _value_cache[(value_type, file_key)]
+
+    value = get_value_function(*args)
+
+    with _file_cache_lock:
+        if len(_value_cache) >= _MAX_CACHED_VALUES:
+            _value_cache.clear()
+
+        _value_cache[(value_type, file_key)] = value
+
+    return value
+
+def _resolve_file(full_file_path):
+    # Returns the path of the file that holds the contents, along with where they are stored: None
+    # (the whole file), [offset, size] within a single-file F4 file, or the contents themselves.
+    if os.path.isfile(full_file_path):
+        directory = _get_single_file_directory(full_file_path)
+
+        return full_file_path, None if directory is None else directory[""]
+
+    # Look for a single-file F4 file whose path is a prefix of this path (for example, data.f4 for data.f4.cc).
+    position = len(full_file_path)
+    while True:
+        position = full_file_path.rfind(".", 0, position)
+
+        if position <= 0 or os.sep in full_file_path[position:]:
+            raise FileNotFoundError(f"{full_file_path} does not exist.")
+
+        container_file_path = full_file_path[:position]
+
+        if os.path.isfile(container_file_path):
+            directory = _get_single_file_directory(container_file_path)
+
+            if directory is not None and full_file_path[position:] in directory:
+                return container_file_path, directory[full_file_path[position:]]
+
+def _get_single_file_directory(file_path):
+    # Returns None if this is not a single-file F4 file.
+    file_stat = os.stat(file_path)
+    file_key = (file_path, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    return _get_cached_value("directory", file_key, _read_single_file_directory, file_path, file_stat.st_size)
+
+def _read_single_file_directory(file_path, file_size):
+    if file_size < 16:
+        return None
+
+    with open(file_path, "rb") as the_file:
+        tail = os.pread(the_file.fileno(), min(file_size, _FOOTER_READ_SIZE), max(0, file_size - _FOOTER_READ_SIZE))
+
+        if tail[-8:] != _SINGLE_FILE_MAGIC:
+            return None
+
+        footer_length = int.from_bytes(tail[-16:-8], byteorder="little")
+
+        if footer_length + 16 > len(tail):
+            tail = os.pread(the_file.fileno(), footer_length + 16, file_size - footer_length - 16)
+
+    footer = deserialize(tail[-(footer_length + 16):-16])
+
+    if footer["format_version"] > _SINGLE_FILE_FORMAT_VERSION:
+        raise Exception(f"{file_path} was saved with a newer version of the F4 format.")
+
+    return footer["files"]
+
+def _remove_stale_cache_entries(full_file_path):
+    for entry in [entry for entry in _file_cache.values() if entry[0][0] == full_file_path]:
+        if entry[2] == 0:
+            _close_cache_entry(entry)
+        else:
+            del _file_cache[entry[0]]
+
+def _evict_cached_files():
+    num_to_evict = len(_file_cache) - _max_cached_files
+
+    if num_to_evict <= 0:
+        return
+
+    # Files that are in use cannot be closed, so the cache can temporarily exceed its maximum size.
+    for entry in [entry for entry in _file_cache.values() if entry[2] == 0][:num_to_evict]:
+        _close_cache_entry(entry)
+
+def _close_cache_entry(entry):
+    if _file_cache.get(entry[0]) is entry:
+        del _file_cache[entry[0]]
+
+    del _file_cache_entries_by_handle[id(entry[1])]
+    _close_read_file(entry[1])
+
+def _close_read_file(handle):
+    try:
+        handle.close()
+    except BufferError:
+        # A NumPy array still refers to this memory map. It will be closed when that array is garbage collected.
+        pass
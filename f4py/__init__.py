@@ -1,6 +1,9 @@
 from f4py.Utilities import *
 from f4py.Builder import *
+from f4py.ColumnProfiler import *
 from f4py.Filters import *
 from f4py.IndexBuilder import *
 from f4py.IndexSearcher import *
-from f4py.Parser import *
\ No newline at end of file
+from f4py.Parser import *
+from f4py.QueryPlan import *
+from f4py.RowSet import *
\ No newline at end of file
@@ -1,10 +1,13 @@
+from contextlib import redirect_stdout
 import f4py
 import glob
 import gzip
-from io import TextIOWrapper, BytesIO
+from io import TextIOWrapper, BytesIO, StringIO
 import operator
 import os
+import re
 import sys
+import warnings
 
 def get_delimited_file_handle(file_path):
     if file_path.endswith(".gz"):
@@ -63,7 +66,7 @@ def fail_test(message):
     print(f"FAIL: {message}")
     sys.exit(1)
 
-def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, compression_type=None, index_columns=None):
+def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, compression_type=None, index_columns=None, numeric_encoding=None, single_file=False):
     print("-------------------------------------------------------")
     print(f"Running all tests for {in_file_path}")
     print(f"num_processes: {num_processes}")
@@ -71,13 +74,18 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     print(f"lines_per_chunk: {lines_per_chunk}")
     print(f"compression_type: {compression_type}")
     print(f"index_columns: {index_columns}")
+    print(f"numeric_encoding: {numeric_encoding}")
+    print(f"single_file: {single_file}")
     print("-------------------------------------------------------")
 
     # Clean up data files if they already exist
     for file_path in glob.glob(f"{f4_file_path}*"):
         os.unlink(file_path)
 
-    f4py.Builder().convert_delimited_file(in_file_path, f4_file_path, compression_type=compression_type, num_processes=num_processes, num_cols_per_chunk=num_cols_per_chunk, index_columns=index_columns)
+    f4py.Builder().convert_delimited_file(in_file_path, f4_file_path, compression_type=compression_type, num_processes=num_processes, index_columns=index_columns, numeric_encoding=numeric_encoding, single_file=single_file)
+
+    if single_file:
+        check_result("Single file", "Number of files", glob.glob(f"{f4_file_path}*"), [f4_file_path])
 
     try:
         parser = Parser("bogus_file_path")
@@ -90,6 +98,16 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_result("Parser properties", "Number of rows", parser.get_num_rows(), 5)
     check_result("Parser properties", "Number of columns", parser.get_num_cols(), 9)
 
+    with f4py.Parser(f4_file_path) as parser2:
+        check_result("File cache", "Parsers share memory maps", parser2._get_file_handle("") is parser._get_file_handle(""), True)
+
+    f4py.set_max_cached_files(0)
+    with f4py.IndexSearcher._get_index_parser(f"{f4_file_path}.cn") as index_parser:
+        handle = index_parser._get_file_handle("")
+    check_result("File cache", "Unused memory maps are closed", handle.closed, True)
+    check_result("File cache", "Memory maps in use stay open", parser._get_file_handle("").closed, False)
+    f4py.set_max_cached_files(64)
+
     check_result("Column types", "ID column", parser.get_column_type_from_name("ID"), "s")
     check_result("Column types", "FloatA column", parser.get_column_type_from_name("FloatA"), "f")
     check_result("Column types", "FloatB column", parser.get_column_type_from_name("FloatB"), "f")
@@ -100,6 +118,15 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_result("Column types", "CategoricalA column", parser.get_column_type_from_name("CategoricalA"), "s")
     check_result("Column types", "CategoricalB column", parser.get_column_type_from_name("CategoricalB"), "s")
 
+    check_result("Column statistics", "Integer column", parser.get_column_stats("IntA"), {"min": 5, "max": 8, "num_empty": 0, "num_distinct": 4, "histogram": [5, 5, 5, 5, 6, 6, 6, 7, 7, 8, 8]})
+    check_result("Column statistics", "Float column", (parser.get_column_stats("FloatB")["min"], parser.get_column_stats("FloatB")["max"]), (-99.9, 99.9))
+    check_result("Column statistics", "String column", (parser.get_column_stats("CategoricalB")["min"], parser.get_column_stats("CategoricalB")["max"]), (b"Brown", b"Yellow"))
+
+    plan = parser.query_and_save(f4py.OrFilter(f4py.IntFilter("IntA", operator.gt, 8), f4py.StringFilter("CategoricalB", operator.lt, "Brown")), ["ID"], out_file_path, num_processes=num_processes)
+    check_results("Filter outside of column statistics", read_file_into_lists(out_file_path), [[b"ID"]])
+    check_result("Filter outside of column statistics", "Excluded by statistics", plan.excluded_by_stats, True)
+    os.unlink(out_file_path)
+
     parser.query_and_save(f4py.NoFilter(), [], out_file_path, num_processes=num_processes, lines_per_chunk=lines_per_chunk)
     #print(out_file_path, in_file_path)
     check_results("No filters, select all columns", read_file_into_lists(out_file_path), read_file_into_lists(in_file_path))
@@ -121,6 +148,16 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_results("No filters, select two columns", read_file_into_lists(out_file_path), [[b"FloatA", b"CategoricalB"],[b"9.9", b"Brown"],[b"1.1", b"Yellow"],[b"2.2", b"Yellow"],[b"2.2", b"Brown"],[b"4.4", b"Orange"]])
     os.unlink(out_file_path)
 
+    columns = parser.query_to_numpy(f4py.IntFilter("IntA", operator.ge, 6), ["ID", "FloatA", "IntA"], num_processes=num_processes)
+    check_result("Query to NumPy", "Column names", list(columns), ["ID", "FloatA", "IntA"])
+    check_result("Query to NumPy", "String column", columns["ID"].tolist(), [b"E", b"B", b"C"])
+    check_result("Query to NumPy", "Float column", columns["FloatA"].tolist(), [9.9, 2.2, 2.2])
+    check_result("Query to NumPy", "Integer column", columns["IntA"].tolist(), [6, 8, 7])
+
+    columns = parser.query_to_numpy(f4py.NoFilter(), [], limit=2, offset=3)
+    check_result("Query to NumPy", "All columns", [values.tolist() for values in columns.values()], [[b"C", b"D"], [2.2, 4.4], [88.8, 44.4], [b"Med", b"Med"], [b"Med", b"Med"], [7, 5], [77, 44], [b"Orange", b"Brown"], [b"Brown", b"Orange"]])
+    check_result("Query to NumPy", "No matches", len(parser.query_to_numpy(f4py.StringFilter("ID", operator.eq, "Z"), ["IntB"])["IntB"]), 0)
+
     try:
         parser.query_and_save(f4py.NoFilter(), ["ID", "InvalidColumn"], out_file_path, num_processes=num_processes)
         fail_test("Invalid column name in select.")
@@ -262,6 +299,14 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_results("EndsWith filter on categorical column", read_file_into_lists(out_file_path), [[b"FloatA"]])
     os.unlink(out_file_path)
 
+    parser.query_and_save(f4py.ContainsFilter("CategoricalB", "ll"), ["FloatA"], out_file_path, num_processes=num_processes)
+    check_results("Contains filter on categorical column", read_file_into_lists(out_file_path), [[b"FloatA"],[b"1.1"],[b"2.2"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.ContainsFilter("CategoricalB", "x"), ["FloatA"], out_file_path, num_processes=num_processes)
+    check_results("Contains filter on categorical column", read_file_into_lists(out_file_path), [[b"FloatA"]])
+    os.unlink(out_file_path)
+
     parser.query_and_save(f4py.FloatRangeFilter("FloatA", -9.9, 4.4), ["FloatA"], out_file_path, num_processes=num_processes)
     check_results("FloatA within -9.9 and 4.4", read_file_into_lists(out_file_path), [[b"FloatA"], [b"1.1"], [b"2.2"], [b"2.2"], [b"4.4"]])
     os.unlink(out_file_path)
@@ -351,6 +396,52 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_results("Tail filter", read_file_into_lists(out_file_path), [[b"FloatA"], [b"2.2"], [b"2.2"], [b"4.4"]])
     os.unlink(out_file_path)
 
+    parser.query_and_save(f4py.StringFilter("CategoricalB", operator.eq, "Brown"), ["ID"], out_file_path, num_processes=num_processes, limit=1)
+    check_results("Limit", read_file_into_lists(out_file_path), [[b"ID"], [b"E"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.StringFilter("CategoricalB", operator.eq, "Brown"), ["ID"], out_file_path, num_processes=num_processes, limit=5, offset=1)
+    check_results("Limit and offset", read_file_into_lists(out_file_path), [[b"ID"], [b"C"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.IntFilter("IntA", operator.ge, 6), ["ID"], out_file_path, num_processes=num_processes, limit=2)
+    check_results("Limit with range of values", read_file_into_lists(out_file_path), [[b"ID"], [b"E"], [b"B"]])
+    os.unlink(out_file_path)
+
+    fltr = f4py.OrFilter(f4py.StringFilter("CategoricalB", operator.eq, "Orange"), f4py.IntFilter("IntA", operator.eq, 5))
+    check_result("Limit and offset", "OrFilter", list(parser.query(fltr, ["ID"], limit=1, offset=1)), [[b"D"]])
+    check_result("Limit and offset", "Zero limit", list(parser.query(fltr, ["ID"], limit=0)), [])
+
+    # CategoricalA has no single-column index, so it is scanned (in one process) until a matching row is found.
+    plan = parser.query_and_save(f4py.StringFilter("CategoricalA", operator.eq, "Red"), ["ID"], out_file_path, num_processes=num_processes, limit=1)
+    check_results("Limit", read_file_into_lists(out_file_path), [[b"ID"], [b"A"]])
+    check_result("Query plan", "Limited scan", (plan.limited_scan, plan.scan_num_processes), (True, 1))
+    os.unlink(out_file_path)
+
+    # Invalid values are reported when the query is created, not when the first row is requested.
+    for limit, offset in [(-1, 0), (1.5, 0), (None, -1)]:
+        try:
+            parser.query(fltr, ["ID"], limit=limit, offset=offset)
+            raised = False
+        except:
+            raised = True
+
+        check_result("Limit and offset", f"Invalid limit {limit} or offset {offset}", raised, True)
+
+    plan = parser.query_and_save(f4py.IntFilter("IntA", operator.ge, 6), ["ID"], out_file_path, num_processes="auto")
+    check_results("Automatic num_processes", read_file_into_lists(out_file_path), [[b"ID"], [b"E"], [b"B"], [b"C"]])
+    check_result("Query plan", "Matching rows", plan.num_matching_rows, 3)
+    check_result("Query plan", "Small file is scanned serially", plan.scan_num_processes, 1)
+    check_result("Query plan", "No limited scan", plan.limited_scan, False)
+    check_result("Query plan", "Last query plan", parser.get_last_query_plan() is plan, True)
+    os.unlink(out_file_path)
+
+    try:
+        parser.query_and_save(f4py.NoFilter(), ["ID"], out_file_path, num_processes=0)
+        fail_test("Invalid num_processes.")
+    except:
+        pass_test("Invalid num_processes.")
+
     try:
         parser.query_and_save(FloatFilter("InvalidColumn", operator.eq, 1), ["FloatA"], out_file_path, num_processes=num_processes)
         fail_test("Invalid column name in float filter.")
@@ -546,6 +637,33 @@ def run_small_tests(in_file_path, f4_file_path, out_file_path, num_processes = 1
     check_results("Filter using string/int-range two-column index", read_file_into_lists(out_file_path), [[b"FloatA"], [b"9.9"], [b"2.2"]])
     os.unlink(out_file_path)
 
+    fltr = f4py.AndFilter(f4py.AndFilter(f4py.StringFilter("OrdinalA", operator.eq, "Med"), f4py.StringFilter("CategoricalA", operator.eq, "Brown")), f4py.FloatRangeFilter("FloatA", 0.0, 5.0))
+    parser.query_and_save(fltr, ["ID"], out_file_path, num_processes=num_processes)
+    check_results("Filter using three-column index", read_file_into_lists(out_file_path), [[b"ID"], [b"D"]])
+    os.unlink(out_file_path)
+
+    fltr = f4py.AndFilter(f4py.StringFilter("OrdinalA", operator.eq, "Low"), f4py.FloatFilter("FloatA", operator.lt, 5.0))
+    parser.query_and_save(fltr, ["ID"], out_file_path, num_processes=num_processes)
+    check_results("Filter using three-column index, skipping a column", read_file_into_lists(out_file_path), [[b"ID"], [b"A"]])
+    os.unlink(out_file_path)
+
+    fltr = f4py.AndFilter(f4py.AndFilter(f4py.StringFilter("OrdinalA", operator.eq, "Med"), f4py.StringRangeFilter("CategoricalA", "Brown", "Red")), f4py.IntFilter("IntA", operator.ge, 6))
+    parser.query_and_save(fltr, ["ID"], out_file_path, num_processes=num_processes)
+    check_results("Filter using three-column index and another index", read_file_into_lists(out_file_path), [[b"ID"], [b"C"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.InFilter("ID", ["D", "A", "Z"]), ["ID"], out_file_path, num_processes=num_processes)
+    check_results("InFilter - ID", read_file_into_lists(out_file_path), [[b"ID"], [b"A"], [b"D"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.InFilter("IntA", [7, 5]), ["ID"], out_file_path, num_processes=num_processes)
+    check_results("InFilter - IntA", read_file_into_lists(out_file_path), [[b"ID"], [b"A"], [b"C"], [b"D"]])
+    os.unlink(out_file_path)
+
+    parser.query_and_save(f4py.InFilter("FloatA", [2.2]), ["ID"], out_file_path, num_processes=num_processes)
+    check_results("InFilter - FloatA", read_file_into_lists(out_file_path), [[b"ID"], [b"B"], [b"C"]])
+    os.unlink(out_file_path)
+
     # Clean up data files
     for file_path in glob.glob(f"{f4_file_path}*"):
         os.unlink(file_path)
@@ -569,7 +687,7 @@ def run_medium_tests(num_processes):
     for file_path in glob.glob(f"{f4_file_path}*"):
         os.unlink(file_path)
 
-    f4py.Builder().convert_delimited_file(in_file_path, f4_file_path, compression_type=None, num_processes=num_processes, num_cols_per_chunk=1)
+    f4py.Builder().convert_delimited_file(in_file_path, f4_file_path, compression_type=None, num_processes=num_processes)
 
     print("-------------------------------------------------------")
     print(f"Running all tests for {in_file_path} - no indexing")
@@ -577,11 +695,25 @@ def run_medium_tests(num_processes):
 
     run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
 
+    print("-------------------------------------------------------")
+    print(f"Running all tests for {in_file_path} - with zone maps and Bloom filters")
+    print("-------------------------------------------------------")
+
+    f4py.IndexBuilder.build_zone_maps(f4_file_path, ["ID", "Categorical1", "Discrete1", "Numeric1"], num_rows_per_zone=50)
+    f4py.IndexBuilder.build_bloom_filters(f4_file_path, ["ID", "Categorical1", "Discrete1"], num_rows_per_block=30)
+    run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
+
     print("-------------------------------------------------------")
     print(f"Running all tests for {in_file_path} - with indexing")
     print("-------------------------------------------------------")
 
     f4py.IndexBuilder.build_indexes(f4_file_path, ["ID", "Categorical1", "Discrete1", "Numeric1"])
+
+    # Indexes that are merged from sorted runs must be identical to indexes that are sorted all at once.
+    index_file_contents = {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}
+    f4py.IndexBuilder.build_indexes(f4_file_path, ["ID", "Categorical1", "Discrete1", "Numeric1"], num_processes=num_processes, num_rows_per_run=37)
+    check_result("Index runs", "Merged indexes", {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}, index_file_contents)
+
     run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
 
     print("-------------------------------------------------------")
@@ -591,6 +723,34 @@ def run_medium_tests(num_processes):
     f4py.IndexBuilder.build_endswith_index(f4_file_path, "Discrete1")
     run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
 
+    print("-------------------------------------------------------")
+    print(f"Running all tests for {in_file_path} - with bitmap indexes")
+    print("-------------------------------------------------------")
+
+    f4py.IndexBuilder.build_bitmap_indexes(f4_file_path, ["Categorical1", "Discrete1"])
+    run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
+
+    print("-------------------------------------------------------")
+    print(f"Running all tests for {in_file_path} - with trigram indexes")
+    print("-------------------------------------------------------")
+
+    f4py.IndexBuilder.build_trigram_indexes(f4_file_path, "ID")
+    run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical1, medium_Discrete1, medium_Numeric1, num_processes)
+
+    # Output that is formatted in parallel must be identical to output formatted serially.
+    for compression_type in [None, "zstd"]:
+        compressed_f4_file_path = f"{f4_file_path}_{compression_type}"
+        f4py.Builder().convert_delimited_file(in_file_path, compressed_f4_file_path, compression_type=compression_type, num_processes=num_processes)
+
+        with f4py.Parser(compressed_f4_file_path) as parser:
+            parser.query_and_save(f4py.NoFilter(), [], out_file_path, num_processes=1)
+            parser.query_and_save(f4py.NoFilter(), [], f"{out_file_path}_parallel", num_processes=num_processes)
+            check_result("Parallel output", "Worker pool reused", parser._get_parallel(num_processes) is parser._get_parallel(num_processes), True)
+
+        check_result("Parallel output", f"Compression type {compression_type}", open(f"{out_file_path}_parallel", "rb").read(), open(out_file_path, "rb").read())
+        os.unlink(out_file_path)
+        os.unlink(f"{out_file_path}_parallel")
+
     # Clean up data files
     for file_path in glob.glob(f"{f4_file_path}*"):
         os.unlink(file_path)
@@ -631,6 +791,12 @@ def run_medium_tests2(f4_file_path, out_file_path, medium_ID, medium_Categorical
     run_endswith_test("PM", parser, medium_ID, medium_Discrete1, out_file_path, num_processes)
     run_endswith_test("ZZZZ", parser, medium_ID, medium_Discrete1, out_file_path, num_processes)
 
+    run_substring_test(f4py.ContainsFilter("ID", "w99"), lambda value: b"w99" in value, parser, medium_ID, out_file_path, num_processes)
+    run_substring_test(f4py.ContainsFilter("ID", "7"), lambda value: b"7" in value, parser, medium_ID, out_file_path, num_processes)
+    run_substring_test(f4py.LikeFilter("ID", r"^Row12\d$"), lambda value: re.search(rb"^Row12\d$", value), parser, medium_ID, out_file_path, num_processes)
+    run_substring_test(f4py.LikeFilter("ID", r"34(56|78)"), lambda value: re.search(rb"34(56|78)", value), parser, medium_ID, out_file_path, num_processes)
+    run_substring_test(f4py.NotLikeFilter("ID", r"w1.*99"), lambda value: not re.search(rb"w1.*99", value), parser, medium_ID, out_file_path, num_processes)
+
     run_float_test(0.0, 1.0, parser, medium_ID, medium_Numeric1, out_file_path, num_processes)
     run_float_test(0.85, 0.9, parser, medium_ID, medium_Numeric1, out_file_path, num_processes)
     run_float_test(-0.9, -0.85, parser, medium_ID, medium_Numeric1, out_file_path, num_processes)
@@ -655,6 +821,12 @@ def run_endswith_test(value, parser, medium_ID, filter_values, out_file_path, nu
     check_results(f"EndsWith filter - {column_name} - {value} = {len(matches) - 1} matches", read_file_into_lists(out_file_path), matches)
     os.unlink(out_file_path)
 
+def run_substring_test(fltr, passes_function, parser, medium_ID, out_file_path, num_processes):
+    parser.query_and_save(fltr, ["ID"], out_file_path, num_processes=num_processes)
+    matches = medium_ID[:1] + [value for value in medium_ID[1:] if passes_function(value[0])]
+    check_results(f"{type(fltr).__name__} - ID = {len(matches) - 1} matches", read_file_into_lists(out_file_path), matches)
+    os.unlink(out_file_path)
+
 def run_float_test(lower_bound, upper_bound, parser, medium_ID, medium_Numeric1, out_file_path, num_processes):
     column_name = "Numeric1"
     parser.query_and_save(f4py.FloatRangeFilter(column_name, lower_bound, upper_bound), ["ID"], out_file_path, num_processes=num_processes)
@@ -663,6 +835,35 @@ def run_float_test(lower_bound, upper_bound, parser, medium_ID, medium_Numeric1,
     check_results(f"Filter FloatWithin = {lower_bound} <> {upper_bound} = {len(matches) - 1} matches", read_file_into_lists(out_file_path), matches)
     os.unlink(out_file_path)
 
+def run_single_index_tests(description, f4_file_path, out_file_path, indexed_filter_positions, **builder_args):
+    # Only some columns have an index (of a single type), so the other filters must scan the data file.
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, **builder_args)
+
+    filters_expected_ids = [(f4py.IntFilter("IntA", operator.eq, 5), [b"A", b"D"]),
+                            (f4py.FloatRangeFilter("FloatA", 0.0, 5.0), [b"A", b"B", b"C", b"D"]),
+                            (f4py.StringFilter("CategoricalB", operator.ne, "Brown"), [b"A", b"B", b"D"]),
+                            (f4py.StartsWithFilter("CategoricalB", "Br"), [b"E", b"C"]),
+                            (f4py.StringFilter("CategoricalB", operator.eq, "Brown"), [b"E", b"C"]),
+                            (f4py.AndFilter(f4py.StringFilter("CategoricalB", operator.eq, "Brown"), f4py.IntFilter("IntA", operator.eq, 6)), [b"E"]),
+                            (f4py.OrFilter(f4py.StringFilter("CategoricalB", operator.eq, "Orange"), f4py.IntFilter("IntA", operator.eq, 6)), [b"E", b"D"]),
+                            (f4py.EndsWithFilter("CategoricalB", "own"), [b"E", b"C"]),
+                            (f4py.ContainsFilter("CategoricalB", "ell"), [b"A", b"B"]),
+                            (f4py.LikeFilter("CategoricalB", r"ow$"), [b"A", b"B"]),
+                            (f4py.NotLikeFilter("CategoricalB", r"ow$"), [b"E", b"C", b"D"]),
+                            (f4py.InFilter("CategoricalB", ["Brown", "Orange"]), [b"E", b"C", b"D"])]
+
+    with f4py.Parser(f4_file_path) as parser:
+        for i, (fltr, expected_ids) in enumerate(filters_expected_ids):
+            plan = parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results(description, read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            check_result(description, f"{type(fltr).__name__} used index", plan.used_index, i in indexed_filter_positions)
+            os.unlink(out_file_path)
+
+            check_result(description, f"{type(fltr).__name__} with limit", [row[0] for row in parser.query(fltr, ["ID"], limit=1)], expected_ids[:1])
+
 # Basic small tests
 f4_file_path = "data/small.f4"
 out_file_path = "/tmp/small_out.tsv"
@@ -685,12 +886,289 @@ sys.stdout.close()
 sys.stdout = old_stdout
 check_results("No filters, select all columns - std out", read_string_into_lists(out), read_file_into_lists("data/small.tsv"))
 
-index_columns = ["ID", "CategoricalB", "FloatA", "FloatB", "IntA", "IntB", "OrdinalA", ["CategoricalB", "IntB"]]
+# Iterate over query results (lazily)
+parser = f4py.Parser(f4_file_path)
+rows = parser.query(f4py.StringFilter("CategoricalB", operator.eq, "Yellow"), ["ID", "IntA"], num_rows_per_scan=2)
+check_result("Query iterator", "First row", next(rows), [b"A", b"5"])
+check_result("Query iterator", "Remaining rows", list(rows), [[b"B", b"8"]])
+check_result("Query iterator", "Batches", list(parser.query(f4py.IntRangeFilter("IntA", 5, 7), ["ID"], batch_size=2)), [[[b"E"], [b"A"]], [[b"C"], [b"D"]]])
+check_result("Query iterator", "All columns", next(parser.query(f4py.NoFilter())), [b"E", b"9.9", b"-99.9", b"Low", b"High", b"6", b"66", b"Brown", b"Brown"])
+check_result("Query iterator", "No matches", list(parser.query(f4py.StringFilter("ID", operator.eq, "Z"), ["ID"])), [])
+
+# The numbers of rows and columns are saved, but files without them (from older versions) can still be read.
+check_result("Row and column counts", "Saved", (f4py.read_int_from_file(f4_file_path, ".nrow"), f4py.read_int_from_file(f4_file_path, ".ncol")), (parser.get_num_rows(), parser.get_num_cols()))
+os.unlink(f"{f4_file_path}.nrow")
+os.unlink(f"{f4_file_path}.ncol")
+f4py.clear_file_cache(f4_file_path)
+with f4py.Parser(f4_file_path) as parser:
+    check_result("Row and column counts", "Calculated", (parser.get_num_rows(), parser.get_num_cols()), (5, 9))
+
+# Statistics cannot be saved for integers that are too large for msgpack, so these columns have none.
+with open("/tmp/f4_big_ints.tsv", "w") as big_ints_file:
+    big_ints_file.write("ID\tBigInt\tSmallInt\nA\t99999999999999999999\t1\nB\t-99999999999999999999\t2\nC\t5\t3\n")
+
+f4py.Builder().convert_delimited_file("/tmp/f4_big_ints.tsv", "/tmp/f4_big_ints.f4")
+with f4py.Parser("/tmp/f4_big_ints.f4") as parser:
+    check_result("Large integers", "Values", list(parser.query(f4py.NoFilter(), ["BigInt"])), [[b"99999999999999999999"], [b"-99999999999999999999"], [b"5"]])
+    check_result("Large integers", "Statistics for other columns", (parser.get_column_stats("SmallInt")["min"], parser.get_column_stats("SmallInt")["max"]), (1, 3))
+
+    try:
+        parser.get_column_stats("BigInt")
+        raised = False
+    except:
+        raised = True
+
+    check_result("Large integers", "No statistics", raised, True)
+
+for file_path in glob.glob("/tmp/f4_big_ints*"):
+    os.unlink(file_path)
+
+# Schema hints (copied from an existing F4 file or specified directly)
+schema_f4_file_path = "data/small_schema.f4"
+f4py.Builder().convert_delimited_file("data/small.tsv", schema_f4_file_path, schema=f4_file_path, num_processes=2)
+for ext in ["", ".cc", ".ct"]:
+    check_result("Schema copied from F4 file", f"File extension '{ext}'", open(schema_f4_file_path + ext, "rb").read(), open(f4_file_path + ext, "rb").read())
+
+schema = {"ID": ("s", 1), "FloatA": ("i", 3), "FloatB": ("f", 5), "OrdinalA": ("s", 4), "OrdinalB": ("s", 4), "IntA": ("i", 1), "IntB": ("i", 2), "CategoricalA": ("s", 6), "CategoricalB": ("s", 6)}
+try:
+    f4py.Builder().convert_delimited_file("data/small.tsv", schema_f4_file_path, schema=schema)
+    fail_test("Value that does not fit the schema.")
+except:
+    pass_test("Value that does not fit the schema.")
+
+f4py.Builder().convert_delimited_file("data/small.tsv.gz", schema_f4_file_path, schema=schema, widen_schema=True, num_processes=2)
+parser = f4py.Parser(schema_f4_file_path)
+check_result("Widened schema", "FloatA column", parser.get_column_type_from_name("FloatA"), "f")
+parser.query_and_save(f4py.NoFilter(), [], out_file_path)
+check_results("Widened schema, select all columns", read_file_into_lists(out_file_path), read_file_into_lists("data/small.tsv"))
+os.unlink(out_file_path)
+
+# A file with only a header row is rejected (with or without a schema).
+with open("/tmp/f4_header_only.tsv", "w") as header_only_file:
+    header_only_file.write("ID\tIntA\n")
+
+for header_only_schema in [None, {"ID": ("s", 1), "IntA": ("i", 1)}]:
+    try:
+        f4py.Builder().convert_delimited_file("/tmp/f4_header_only.tsv", schema_f4_file_path, schema=header_only_schema)
+        raised = False
+    except Exception as e:
+        raised = "no data rows" in str(e)
+
+    check_result("Header only", f"Schema {header_only_schema}", raised, True)
+
+os.unlink("/tmp/f4_header_only.tsv")
+
+# Integers that are too large for binary encoding do not fit the schema (but the column can be stored as text when it is widened).
+with open("/tmp/f4_big_ints.tsv", "w") as big_ints_file:
+    big_ints_file.write("BigInt\n5\n99999999999999999999\n")
+
+try:
+    f4py.Builder().convert_delimited_file("/tmp/f4_big_ints.tsv", schema_f4_file_path, schema={"BigInt": ("i", 20)}, numeric_encoding="binary")
+    raised = False
+except Exception as e:
+    raised = "too large to be stored as a binary-encoded integer" in str(e)
+
+check_result("Schema with large integers", "Binary encoding", raised, True)
+
+f4py.Builder().convert_delimited_file("/tmp/f4_big_ints.tsv", schema_f4_file_path, schema={"BigInt": ("i", 20)}, numeric_encoding="binary", widen_schema=True)
+with f4py.Parser(schema_f4_file_path) as parser:
+    check_result("Schema with large integers", "Widened schema", list(parser.query(f4py.NoFilter())), [[b"5"], [b"99999999999999999999"]])
+
+os.unlink("/tmp/f4_big_ints.tsv")
+
+for file_path in glob.glob(f"{schema_f4_file_path}*"):
+    os.unlink(file_path)
+
+index_columns = ["ID", "CategoricalB", "FloatA", "FloatB", "IntA", "IntB", "OrdinalA", ["CategoricalB", "IntB"], ["OrdinalA", "CategoricalA", "FloatA"]]
 
 ## Small tests with indexing
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, index_columns = index_columns)
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, index_columns = index_columns)
 
+f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, index_columns=index_columns)
+index_file_contents = {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}
+f4py.IndexBuilder.build_indexes(f4_file_path, index_columns, num_processes=2, num_rows_per_run=2, tmp_dir_path="/tmp/f4_index_runs")
+check_result("Index runs", "Merged indexes", {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}, index_file_contents)
+check_result("Index runs", "Temporary files removed", os.listdir("/tmp/f4_index_runs"), [])
+
+# Indexes are searched in a single process, even when num_processes is auto.
+with f4py.Parser(f4_file_path) as parser:
+    plan = parser.query_and_save(f4py.IntFilter("IntA", operator.ge, 6), ["ID"], out_file_path, num_processes="auto")
+    check_results("Automatic num_processes with index", read_file_into_lists(out_file_path), [[b"ID"], [b"E"], [b"B"], [b"C"]])
+    check_result("Query plan", "Index searched serially", (plan.used_index, plan.scan_backend, plan.scan_num_processes, plan.estimated_scan_cost), (True, "serial", 1, None))
+    os.unlink(out_file_path)
+
+# Indexes built from values that were saved during conversion must be identical to indexes built from the data file.
+for compression_type, numeric_encoding in [(None, None), ("dictionary", None), ("zstd", "binary")]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, index_columns=index_columns, compression_type=compression_type, numeric_encoding=numeric_encoding, num_processes=2)
+    index_file_contents = {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}
+    f4py.IndexBuilder.build_indexes(f4_file_path, index_columns)
+    check_result("Index keys from conversion", f"{compression_type} compression", {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}, index_file_contents)
+
+    # The values for the indexes are also saved in files of (about) num_rows_per_run rows.
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, index_columns=index_columns, compression_type=compression_type, numeric_encoding=numeric_encoding, num_processes=2, num_rows_per_save=1, num_rows_per_run=2, tmp_dir_path="/tmp/f4_conversion_runs")
+    check_result("Index runs from conversion", f"{compression_type} compression", {file_path: open(file_path, "rb").read() for file_path in glob.glob(f"{f4_file_path}.idx_*")}, index_file_contents)
+    check_result("Index runs from conversion", "Temporary directory removed", os.path.exists("/tmp/f4_conversion_runs"), False)
+
+    # Likewise for zone maps, Bloom filters, hash indexes, bitmap indexes and trigram indexes (the latter sorted in runs).
+    column_index_extensions = (".zm_*", ".bf_*", ".hidx_*", ".bidx_*", ".tidx_*")
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, numeric_encoding=numeric_encoding, num_processes=2, num_rows_per_run=2, zone_map_columns=["ID", "IntA", "FloatA"], bloom_filter_columns=["ID", "IntA"], hash_index_columns=["ID", "IntA"], bitmap_index_columns=["CategoricalB", "IntA"], trigram_index_columns="CategoricalA")
+    index_file_contents = {file_path: open(file_path, "rb").read() for extension in column_index_extensions for file_path in glob.glob(f"{f4_file_path}{extension}")}
+    f4py.IndexBuilder.build_zone_maps(f4_file_path, ["ID", "IntA", "FloatA"])
+    f4py.IndexBuilder.build_bloom_filters(f4_file_path, ["ID", "IntA"])
+    f4py.IndexBuilder.build_hash_indexes(f4_file_path, ["ID", "IntA"])
+    f4py.IndexBuilder.build_bitmap_indexes(f4_file_path, ["CategoricalB", "IntA"])
+    f4py.IndexBuilder.build_trigram_indexes(f4_file_path, "CategoricalA")
+    check_result("Column indexes from conversion", f"{compression_type} compression", {file_path: open(file_path, "rb").read() for extension in column_index_extensions for file_path in glob.glob(f"{f4_file_path}{extension}")}, index_file_contents)
+    check_result("Column indexes from conversion", "Number of files", len(index_file_contents), 10)
+
+## Small tests with all files combined into one
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, single_file = True)
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, compression_type = "dictionary", index_columns = index_columns, single_file = True)
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, compression_type = "zstd", numeric_encoding = "binary", index_columns = index_columns, single_file = True)
+f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, single_file=True)
+f4py.IndexBuilder.build_endswith_index(f4_file_path, "CategoricalB")
+check_result("Single file", "Index added to single file", (glob.glob(f"{f4_file_path}*"), f4py.list_file_extensions(f4_file_path, ".idx_CategoricalB_")), ([f4_file_path], [".idx_CategoricalB_reverse_string"]))
+with f4py.Parser(f4_file_path) as parser:
+    parser.query_and_save(f4py.EndsWithFilter("CategoricalB", "own"), ["ID"], out_file_path)
+    check_results("Single file", read_file_into_lists(out_file_path), [[b"ID"], [b"E"], [b"C"]])
+    os.unlink(out_file_path)
+
+## Zone maps
+for compression_type in [None, "zstd"]:
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, zone_map_columns=["IntA", "CategoricalB", "FloatA"])
+    f4py.IndexBuilder.build_zone_maps(f4_file_path, "IntA", num_rows_per_zone=2)
+    check_result("Zone maps", "Zones", f4py.read_cached_object_from_file(f4_file_path, ".zm_IntA"), {"num_rows_per_zone": 2, "zones": [{"min": 5, "max": 6, "values": [5, 6]}, {"min": 7, "max": 8, "values": [7, 8]}, {"min": 5, "max": 5, "values": [5]}]})
+    with f4py.Parser(f4_file_path) as parser:
+        row_indices = f4py.Filters._select_zone_rows(f4_file_path, f4py.RowSet(start=0, end=5), f4py.IntFilter("IntA", operator.eq, 6), b"IntA")
+        check_result("Zone maps", "Rows in matching zones", list(row_indices), [0, 1])
+
+        for fltr, expected_ids in [(f4py.IntFilter("IntA", operator.eq, 6), [b"E"]), (f4py.IntRangeFilter("IntA", 7, 8), [b"B", b"C"]), (f4py.StringFilter("CategoricalB", operator.eq, "Orange"), [b"D"]), (f4py.IntFilter("IntA", operator.gt, 5), [b"E", b"B", b"C"])]:
+            parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results("Zone maps", read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            os.unlink(out_file_path)
+
+    # Rebuilding the file removes zone maps that were not requested.
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type)
+    check_result("Zone maps", "Stale zone maps removed", glob.glob(f"{f4_file_path}.zm_*"), [])
+
+## Bloom filters
+for compression_type, bloom_index_columns in [(None, []), ("zstd", []), ("zstd", ["ID", "IntA", "CategoricalB"])]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, index_columns=bloom_index_columns, bloom_filter_columns=["ID"])
+    f4py.IndexBuilder.build_bloom_filters(f4_file_path, ["IntA", "CategoricalB"], num_rows_per_block=2)
+    with f4py.Parser(f4_file_path) as parser:
+        check_result("Bloom filters", "Blocks that may contain value", list(f4py.StringFilter("CategoricalB", operator.eq, "Orange")._find_bloom_filter_blocks(f4_file_path)[0]), [2])
+
+        for fltr, expected_ids, expected_excluded in [(f4py.StringFilter("ID", operator.eq, "C"), [b"C"], False), (f4py.StringFilter("ID", operator.eq, "BB"), [], True), (f4py.IntFilter("IntA", operator.eq, 5), [b"A", b"D"], False), (f4py.OrFilter(f4py.StringFilter("ID", operator.eq, "BB"), f4py.StringFilter("CategoricalB", operator.eq, "Orange")), [b"D"], False), (f4py.AndFilter(f4py.IntFilter("IntA", operator.ge, 5), f4py.StringFilter("ID", operator.eq, "CC")), [], True)]:
+            plan = parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results("Bloom filters", read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            check_result("Bloom filters", "Excluded by Bloom filters", plan.excluded_by_bloom_filters, expected_excluded)
+            os.unlink(out_file_path)
+
+try:
+    f4py.IndexBuilder.build_bloom_filters(f4_file_path, "FloatA")
+    fail_test("Bloom filter for a float column.")
+except:
+    pass_test("Bloom filter for a float column.")
+
+## Hash indexes
+for compression_type, bloom_filter_columns in [(None, []), ("zstd", []), (None, ["ID"])]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, index_columns=["FloatA"], bloom_filter_columns=bloom_filter_columns, hash_index_columns=["ID", "IntA"])
+    f4py.IndexBuilder.build_hash_indexes(f4_file_path, "CategoricalB")
+    with f4py.Parser(f4_file_path) as parser:
+        for fltr, expected_ids in [(f4py.StringFilter("ID", operator.eq, "C"), [b"C"]), (f4py.StringFilter("ID", operator.eq, "BB"), []), (f4py.StringFilter("ID", operator.eq, "CCCCCCCC"), []), (f4py.IntFilter("IntA", operator.eq, 5), [b"A", b"D"]), (f4py.InFilter("ID", ["D", "B", "ZZ"]), [b"B", b"D"]), (f4py.InFilter("IntA", [5, 8, 100]), [b"A", b"B", b"D"]), (f4py.InFilter("CategoricalB", ["Brown", "Orange"]), [b"E", b"C", b"D"]), (f4py.InFilter("FloatA", [2.2, 9.9]), [b"E", b"B", b"C"])]:
+            plan = parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results("Hash indexes", read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            check_result("Hash indexes", "Used index or Bloom filter", plan.used_index or plan.excluded_by_bloom_filters, True)
+            os.unlink(out_file_path)
+
+run_single_index_tests("Only sorted indexes", f4_file_path, out_file_path, [2, 3, 4, 5, 11], index_columns=["CategoricalB"])
+run_single_index_tests("Only hash indexes", f4_file_path, out_file_path, [4, 5, 11], hash_index_columns=["CategoricalB"])
+
+try:
+    f4py.IndexBuilder.build_hash_indexes(f4_file_path, "FloatA")
+    fail_test("Hash index for a float column.")
+except:
+    pass_test("Hash index for a float column.")
+
+try:
+    f4py.InFilter("IntA", [5, "5"])
+    fail_test("InFilter with values of different types.")
+except:
+    pass_test("InFilter with values of different types.")
+
+## Bitmap indexes
+for compression_type in [None, "zstd"]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, index_columns=["ID"], bitmap_index_columns=["CategoricalB", "OrdinalA", "IntA"])
+    with f4py.Parser(f4_file_path) as parser:
+        for fltr, expected_ids in [(f4py.StringFilter("CategoricalB", operator.eq, "Yellow"), [b"A", b"B"]), (f4py.StringFilter("CategoricalB", operator.ne, "Brown"), [b"A", b"B", b"D"]), (f4py.InFilter("OrdinalA", ["Low", "High"]), [b"E", b"A", b"B"]), (f4py.IntRangeFilter("IntA", 6, 7), [b"E", b"C"]), (f4py.OrFilter(f4py.StringFilter("CategoricalB", operator.eq, "Orange"), f4py.IntFilter("IntA", operator.gt, 7)), [b"B", b"D"]), (f4py.AndFilter(f4py.StringFilter("OrdinalA", operator.eq, "Med"), f4py.OrFilter(f4py.StringFilter("CategoricalB", operator.eq, "Brown"), f4py.IntFilter("IntA", operator.eq, 5))), [b"C", b"D"]), (f4py.AndFilter(f4py.StartsWithFilter("CategoricalB", "Yel"), f4py.StringFilter("ID", operator.ne, "A")), [b"B"])]:
+            parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results("Bitmap indexes", read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            os.unlink(out_file_path)
+
+    fltr = f4py.AndFilter(f4py.StringFilter("OrdinalA", operator.eq, "Med"), f4py.IntFilter("IntA", operator.ne, 5))
+    check_result("Bitmap indexes", "Combined bitmap", list(f4py.RowSet.from_bitmap(fltr._get_bitmap(f4_file_path, {b"OrdinalA": "s", b"IntA": "i"}), 5)), [3])
+
+run_single_index_tests("Only bitmap indexes", f4_file_path, out_file_path, [2, 3, 4, 5, 7, 8, 9, 10, 11], bitmap_index_columns=["CategoricalB"])
+
+try:
+    f4py.IndexBuilder.build_bitmap_indexes(f4_file_path, "CategoricalB", max_num_values=2)
+    fail_test("Bitmap index with too many values.")
+except:
+    pass_test("Bitmap index with too many values.")
+
+## Trigram indexes
+for compression_type in [None, "zstd"]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type=compression_type, index_columns=["ID"], trigram_index_columns=["CategoricalA", "CategoricalB"])
+    with f4py.Parser(f4_file_path) as parser:
+        for fltr, expected_ids in [(f4py.ContainsFilter("CategoricalB", "row"), [b"E", b"C"]), (f4py.ContainsFilter("CategoricalA", "e"), [b"A", b"B", b"C"]), (f4py.ContainsFilter("CategoricalB", "xyz"), []), (f4py.LikeFilter("CategoricalB", r"^Bro.n$"), [b"E", b"C"]), (f4py.LikeFilter("CategoricalB", r"ellow|ange"), [b"A", b"B", b"D"]), (f4py.LikeFilter("CategoricalA", r"(?i)^RED"), [b"A", b"B"]), (f4py.NotLikeFilter("CategoricalB", r"Bro"), [b"A", b"B", b"D"]), (f4py.AndFilter(f4py.ContainsFilter("CategoricalA", "own"), f4py.NotLikeFilter("CategoricalB", r"Brown")), [b"D"])]:
+            parser.query_and_save(fltr, ["ID"], out_file_path)
+            check_results("Trigram indexes", read_file_into_lists(out_file_path), [[b"ID"]] + [[x] for x in expected_ids])
+            check_result("Trigram indexes", "Used index", parser.get_last_query_plan().used_index, True)
+            os.unlink(out_file_path)
+
+check_result("Trigram indexes", "Required literals", f4py.Filters._get_required_literals(re.compile(r"^abc(de)+f?[gh]ijk|")), [])
+check_result("Trigram indexes", "Required literals", f4py.Filters._get_required_literals(re.compile(r"^abc(de)+f?[gh]ijk")), ["abc", "de", "ijk"])
+check_result("Trigram indexes", "Required literals", f4py.Filters._get_required_literals(re.compile(r"abc", re.IGNORECASE)), [])
+
+run_single_index_tests("Only trigram indexes", f4_file_path, out_file_path, [3, 7, 8, 9, 10], trigram_index_columns=["CategoricalB"])
+
+try:
+    f4py.IndexBuilder.build_trigram_indexes(f4_file_path, "IntA")
+    fail_test("Trigram index for an integer column.")
+except:
+    pass_test("Trigram index for an integer column.")
+
+## Text filters on numeric columns (the stored text, not the number, must be compared)
+with open("/tmp/f4_numbers.tsv", "w") as numbers_file:
+    numbers_file.write("ID\tF\tI\nA\t0.5\t7\nB\t1.10\t11\nC\t2.50\t250\nD\t11.5\t5\n")
+
+for builder_args in [{}, {"index_columns": ["F", "I"]}, {"index_columns": ["F"], "bitmap_index_columns": ["I"]}]:
+    for file_path in glob.glob(f"{f4_file_path}*"):
+        os.unlink(file_path)
+
+    f4py.Builder().convert_delimited_file("/tmp/f4_numbers.tsv", f4_file_path, **builder_args)
+    with f4py.Parser(f4_file_path) as parser:
+        for fltr, expected_ids in [(f4py.StartsWithFilter("F", "1"), [b"B", b"D"]), (f4py.LikeFilter("F", r"^1\.10$"), [b"B"]), (f4py.LikeFilter("F", "50"), [b"C"]), (f4py.NotLikeFilter("F", "50"), [b"A", b"B", b"D"]), (f4py.EndsWithFilter("F", "0"), [b"B", b"C"]), (f4py.ContainsFilter("F", ".5"), [b"A", b"C", b"D"]), (f4py.StartsWithFilter("I", "1"), [b"B"]), (f4py.AndFilter(f4py.StartsWithFilter("I", "2"), f4py.IntFilter("I", operator.gt, 5)), [b"C"])]:
+            check_result("Text filters on numeric columns", f"{type(fltr).__name__} with {builder_args}", parser.query_to_numpy(fltr, ["ID"])["ID"].tolist(), expected_ids)
+
+os.unlink("/tmp/f4_numbers.tsv")
+
 ## Small tests with dictionary-based compression
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, compression_type = "dictionary")
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, compression_type = "dictionary")
@@ -707,10 +1185,97 @@ run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, compression_type = "zstd", index_columns = index_columns)
 run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, compression_type = "zstd", index_columns = index_columns)
 
+## Small tests with binary-encoded numeric columns
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 1, num_cols_per_chunk = 1, lines_per_chunk = 1, numeric_encoding = "binary")
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, numeric_encoding = "binary", index_columns = index_columns)
+f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, numeric_encoding="binary")
+check_result("Binary encoding", "Encoding file", open(f4_file_path + ".ce", "rb").read(), b"tddttbbtt")
+check_result("Binary encoding", "Line length", open(f4_file_path + ".ll", "rb").read(), b"39")
+
+# The encodings must not be used after the file is rebuilt without binary encoding.
+f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path)
+check_result("Binary encoding", "Encoding file removed", os.path.exists(f4_file_path + ".ce"), False)
+with f4py.Parser(f4_file_path) as parser:
+    check_result("Binary encoding", "Rebuilt without encoding", next(parser.query(f4py.NoFilter(), ["IntA", "FloatA"])), [b"6", b"9.9"])
+
+# Categorical compression is only used when every distinct value in a column was tracked exactly.
+with open("/tmp/f4_categories.tsv", "w") as categories_file:
+    categories_file.write("ID\tColor\n" + "".join(f"{i}\t{['Red', 'Blue', 'Green'][i % 3]}\n" for i in range(60)))
+
+for max_exact_values, expected_compression_type in [(1000, b"c"), (2, b"s")]:
+    column_compression_dicts = f4py.Builder()._summarize_columns("/tmp/f4_categories.tsv", b"\t", None, 2, "dictionary", None, 1, max_exact_values)[3]
+    check_result("Dictionary compression", f"Compression type with max_exact_values={max_exact_values}", column_compression_dicts[1]["compression_type"], expected_compression_type)
+
+    f4py.Builder().convert_delimited_file("/tmp/f4_categories.tsv", "/tmp/f4_categories.f4", compression_type="dictionary", max_exact_values=max_exact_values)
+    with f4py.Parser("/tmp/f4_categories.f4") as parser:
+        check_result("Dictionary compression", f"Query with max_exact_values={max_exact_values}", parser.query_to_numpy(f4py.StringFilter("Color", operator.eq, "Green"), ["ID"])["ID"].tolist(), list(range(2, 60, 3)))
+
+for file_path in glob.glob("/tmp/f4_categories*"):
+    os.unlink(file_path)
+
+with warnings.catch_warnings(record=True) as caught_warnings:
+    warnings.simplefilter("always")
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, num_cols_per_chunk=2)
+    check_result("Deprecated arguments", "num_cols_per_chunk", [warning.category for warning in caught_warnings], [DeprecationWarning])
+
+# Gzipped files cannot be split, so they are summarized by one process.
+with redirect_stdout(StringIO()) as output:
+    f4py.Builder(verbose=True).convert_delimited_file("data/small.tsv.gz", f4_file_path, num_processes=2)
+check_result("Gzipped input", "Single process message", "summarized in a single process" in output.getvalue(), True)
+
+try:
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, max_exact_values=0)
+    fail_test("Invalid max_exact_values.")
+except:
+    pass_test("Invalid max_exact_values.")
+
+## Small tests with binary-encoded numeric columns (and z-standard compression)
+run_small_tests("data/small.tsv", f4_file_path, out_file_path, num_processes = 2, num_cols_per_chunk = 2, lines_per_chunk = 2, compression_type = "zstd", numeric_encoding = "binary")
+
+try:
+    f4py.Builder().convert_delimited_file("data/small.tsv", f4_file_path, compression_type="dictionary", numeric_encoding="binary")
+    fail_test("Binary encoding with dictionary compression.")
+except:
+    pass_test("Binary encoding with dictionary compression.")
+
 # Clean up data files
 for file_path in glob.glob(f"{f4_file_path}*"):
     os.unlink(file_path)
 
+# Column profiler (discards exact values after a threshold)
+profiler = f4py.ColumnProfiler(max_exact_values=10)
+for i in range(1000):
+    profiler.add(str(i).encode())
+profiler.add(b"1.5")
+check_result("Column profiler", "Column type", profiler.column_type, b"f")
+check_result("Column profiler", "Maximum length", profiler.max_length, 3)
+check_result("Column profiler", "Exact values discarded", profiler.get_distinct_values(), None)
+check_result("Column profiler", "Approximate number of distinct values", abs(profiler.get_num_distinct() - 1001) < 100, True)
+check_result("Column profiler", "Statistics", {key: value for key, value in profiler.get_stats(b"f").items() if key != "histogram"}, {"min": 0, "max": 999, "num_empty": 0, "num_distinct": profiler.get_num_distinct()})
+profiler2 = f4py.ColumnProfiler(max_sample_size=100)
+for i in range(1000):
+    profiler2.add(str(i).encode())
+other_profiler = f4py.ColumnProfiler(max_sample_size=100)
+for i in range(1000, 1050):
+    other_profiler.add(str(i).encode())
+profiler2.merge(other_profiler)
+check_result("Column profiler", "Sample size", len(profiler2.sample), 100)
+check_result("Column profiler", "Histogram", [abs(boundary - i * 105) < 200 for i, boundary in enumerate(profiler2.get_stats(b"i")["histogram"])], [True] * 11)
+
+# Row sets (compared against Python sets)
+row_set_1 = f4py.RowSet([9, 1, 5, 3, 7, 3])
+row_set_2 = f4py.RowSet(start=2, end=8)
+row_set_3 = f4py.RowSet([2, 3, 4, 5, 6, 7, 8, 9])
+set_1, set_2, set_3 = set(row_set_1), set(range(2, 8)), set(range(2, 10))
+check_result("Row sets", "Sorted iteration", list(row_set_1), [1, 3, 5, 7, 9])
+check_result("Row sets", "Contiguous indices stored as range", row_set_3.is_range(), True)
+for row_set_a, set_a in [(row_set_1, set_1), (row_set_2, set_2), (row_set_3, set_3)]:
+    for row_set_b, set_b in [(row_set_1, set_1), (row_set_2, set_2), (row_set_3, set_3), (f4py.RowSet(), set())]:
+        check_result("Row sets", "And", list(row_set_a & row_set_b), sorted(set_a & set_b))
+        check_result("Row sets", "Or", list(row_set_a | row_set_b), sorted(set_a | set_b))
+        check_result("Row sets", "Difference", list(row_set_a - row_set_b), sorted(set_a - set_b))
+check_result("Row sets", "Union of many", list(f4py.RowSet.union_all([row_set_2, row_set_1, f4py.RowSet()])), sorted(set_1 | set_2))
+
 # Medium tests
 run_medium_tests(num_processes=1)
 run_medium_tests(num_processes=2)